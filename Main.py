@@ -1,21 +1,11 @@
 # Importing the needed modules 
 from dotenv import load_dotenv
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from Utils.Agents import (
-    Internist,
-    Neurologist,
-    Cardiologist,
-    Gastroenterologist,
-    Psychiatrist,
-    MultidisciplinaryTeam,
-    TeamSummary,
-)
-import json, os, re
+from Utils.Orchestrator import SPECIALIST_MODES, TEAM_MODES, load_agent_api_keys, run_case_pipeline
+from Utils.RateLimiter import rate_limiter
+from Utils.ResponseCache import get_response_cache
+import argparse, asyncio, glob, hashlib, json, os, re, statistics, time
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-# Loading API key from a dotenv file.
-load_dotenv(dotenv_path='apikey.env')
-
 # Available reports:
 # - "Medical Report - Anna Thompson - Irritable Bowel Syndrome.txt"
 # - "Medical Report - Charles Baker - Prostate Cancer (Suspicion).txt"
@@ -26,85 +16,66 @@ load_dotenv(dotenv_path='apikey.env')
 # - "Medical Report - Olivia White - Recurrent Tonsillitis.txt"
 # - "Medical Report - Robert Miller - COPD.txt"
 # - "Medical Rerort - Michael Johnson - Panic Attack Disorder.txt"
+# Processed when Main.py is run without arguments
 MEDICAL_REPORT_FILE = "Medical Report - Charles Baker - Prostate Cancer (Suspicion).txt"
 
-# Read the medical report
-with open(os.path.join("Medical Reports", MEDICAL_REPORT_FILE), "r", encoding="utf-8") as file:
-    medical_report = file.read()
-
-# Load API keys for each agent from environment variables
-# Format: INTERNIST_API_KEY, NEUROLOGIST_API_KEY, etc.
-# Falls back to GOOGLE_API_KEY if agent-specific key not found
-agent_api_keys = {
-    "Internist": os.getenv("INTERNIST_API_KEY") or os.getenv("GOOGLE_API_KEY"),
-    "Neurologist": os.getenv("NEUROLOGIST_API_KEY") or os.getenv("GOOGLE_API_KEY"),
-    "Cardiologist": os.getenv("CARDIOLOGIST_API_KEY") or os.getenv("GOOGLE_API_KEY"),
-    "Gastroenterologist": os.getenv("GASTROENTEROLOGIST_API_KEY") or os.getenv("GOOGLE_API_KEY"),
-    "Psychiatrist": os.getenv("PSYCHIATRIST_API_KEY") or os.getenv("GOOGLE_API_KEY"),
-}
-
-agents = {
-    "Internist": Internist(medical_report, api_key=agent_api_keys["Internist"]),
-    "Neurologist": Neurologist(medical_report, api_key=agent_api_keys["Neurologist"]),
-    "Cardiologist": Cardiologist(medical_report, api_key=agent_api_keys["Cardiologist"]),
-    "Gastroenterologist": Gastroenterologist(medical_report, api_key=agent_api_keys["Gastroenterologist"]),
-    "Psychiatrist": Psychiatrist(medical_report, api_key=agent_api_keys["Psychiatrist"])
-}
-
-# Function to run each agent and get their response
-def get_response(agent_name, agent):
-    response = agent.run()
-    return agent_name, response
-
-# Run the agents concurrently and collect responses
-responses = {}
-with ThreadPoolExecutor() as executor:
-    futures = {executor.submit(get_response, name, agent): name for name, agent in agents.items()}
-    
-    for future in as_completed(futures):
-        agent_name, response = future.result()
-        responses[agent_name] = response
-
-# Validate specialist outputs
-missing_specialists = [name for name, result in responses.items() if result is None]
-if missing_specialists:
-    raise RuntimeError(f"Failed to obtain structured output from: {', '.join(missing_specialists)}")
-
-# Prepare JSON payloads for the multidisciplinary agent
-structured_reports_json = json.dumps({k: v.model_dump() for k, v in responses.items()}, indent=2)
-
-# Load API key for MultidisciplinaryTeam (falls back to GOOGLE_API_KEY if not specified)
-team_api_key = os.getenv("MULTIDISCIPLINARYTEAM_API_KEY") or os.getenv("GOOGLE_API_KEY")
-
-team_agent = MultidisciplinaryTeam(
-    medical_report=medical_report,
-    internist_report=responses["Internist"].model_dump_json(indent=2),
-    neurologist_report=responses["Neurologist"].model_dump_json(indent=2),
-    cardiologist_report=responses["Cardiologist"].model_dump_json(indent=2),
-    gastroenterologist_report=responses["Gastroenterologist"].model_dump_json(indent=2),
-    psychiatrist_report=responses["Psychiatrist"].model_dump_json(indent=2),
-    structured_reports_json=structured_reports_json,
-    api_key=team_api_key
-)
-
-# Run the MultidisciplinaryTeam agent to generate the final diagnosis
-team_summary = team_agent.run()
-if team_summary is None:
-    raise RuntimeError("Multidisciplinary team failed to produce a structured summary.")
-json_output_path = "results/final_diagnosis.json"
-
-# Ensure the directory exists
-os.makedirs(os.path.dirname(json_output_path), exist_ok=True)
-
-# Write the structured summary to disk
-with open(json_output_path, "w", encoding="utf-8") as json_file:
-    json_file.write(team_summary.model_dump_json(indent=2))
-
-# Ensure subdirectories exist for detailed outputs
-treatments_dir = os.path.join("results", "treatment")
-os.makedirs(treatments_dir, exist_ok=True)
-
-# Generate treatment recommendations (each option saved separately)
+RESULTS_DIR = "results"
+MANIFEST_FILE = "manifest.json"
+
+
+def collect_reports(inputs):
+    """Expand files, directories (their *.txt files) and glob patterns into a list of report paths"""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = sorted(glob.glob(os.path.join(item, "*.txt")))
+        elif glob.has_magic(item):
+            matches = sorted(glob.glob(item))
+        else:
+            matches = [item]
+        paths.extend(matches)
+    # Keep the first occurrence of every file
+    seen = set()
+    unique = []
+    for path in paths:
+        key = os.path.abspath(path)
+        if key not in seen:
+            seen.add(key)
+            unique.append(path)
+    return unique
+
+
+def report_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def output_dir_for(report_path, results_dir):
+    """Stable, unique output directory for a report: readable name plus a hash of its path"""
+    stem = os.path.splitext(os.path.basename(report_path))[0]
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", stem).strip("-") or "report"
+    digest = hashlib.sha256(os.path.abspath(report_path).encode("utf-8")).hexdigest()[:8]
+    return os.path.join(results_dir, f"{slug}-{digest}")
+
+
+def is_up_to_date(output_dir, input_hash):
+    """True when a previous run finished this exact report content"""
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return manifest.get("input_hash") == input_hash
+
+
+def write_json(path, payload):
+    """Write JSON through a temporary file so readers never see a half-written file"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(payload, indent=2))
+    os.replace(tmp_path, path)
+
+
+# Plain-text rendering of a treatment option (saved next to its JSON)
 def render_treatment_text(option):
     if not option:
         return "Treatment recommendation unavailable."
@@ -143,13 +114,166 @@ def render_treatment_text(option):
         lines.append(f"• {note}")
     return "\n".join(lines).strip()
 
-# Also generate structured treatment JSON and save per-option
-treatment_options_json = team_agent.generate_treatment_plan_json(team_summary)
-if treatment_options_json and isinstance(treatment_options_json, list):
-    for idx, option in enumerate(treatment_options_json[:3], start=1):
-        json_path = os.path.join(treatments_dir, f"treatment{idx}.json")
-        with open(json_path, "w", encoding="utf-8") as jf:
-            jf.write(json.dumps(option, indent=2))
+def write_outputs(output_dir, agent_results):
+    os.makedirs(output_dir, exist_ok=True)
+    write_json(os.path.join(output_dir, "specialists.json"), agent_results["specialists"])
+    write_json(os.path.join(output_dir, "final_diagnosis.json"), agent_results["teamSummary"])
+
+    treatments_dir = os.path.join(output_dir, "treatment")
+    os.makedirs(treatments_dir, exist_ok=True)
+    treatment_options = agent_results["treatmentOptions"]
+    if treatment_options and isinstance(treatment_options, list):
+        for idx, option in enumerate(treatment_options[:3], start=1):
+            write_json(os.path.join(treatments_dir, f"treatment{idx}.json"), option)
+            with open(os.path.join(treatments_dir, f"treatment{idx}.txt"), "w", encoding="utf-8") as tf:
+                tf.write(render_treatment_text(option))
+
+
+async def process_report(report_path, output_dir, medical_report, input_hash, api_keys, specialist_mode="individual", routing=None, team_mode="separate"):
+    """Run one report through the pipeline and write its outputs; the manifest is written last"""
+    started = time.perf_counter()
+    agent_results = await run_case_pipeline(
+        medical_report, api_keys=api_keys, specialist_mode=specialist_mode, routing=routing, team_mode=team_mode
+    )
+
+    missing_specialists = [name for name, result in agent_results["specialists"].items() if result is None]
+    if missing_specialists:
+        raise RuntimeError(f"Failed to obtain structured output from: {', '.join(missing_specialists)}")
+    if agent_results["teamSummary"] is None:
+        raise RuntimeError("Multidisciplinary team failed to produce a structured summary.")
+
+    write_outputs(output_dir, agent_results)
+    elapsed = time.perf_counter() - started
+    # Only a complete run gets a manifest, so interrupted reports are redone on resume
+    write_json(os.path.join(output_dir, MANIFEST_FILE), {
+        "source": report_path,
+        "input_hash": input_hash,
+        "completed_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "elapsed_seconds": round(elapsed, 3),
+        "rate_limit_wait_seconds": agent_results["rateLimitWaitSeconds"],
+    })
+    return elapsed
+
+
+async def run_batch(report_paths, results_dir=RESULTS_DIR, max_reports=4, force=False, specialist_mode="individual", routing=None, team_mode="separate"):
+    """
+    Process reports with at most `max_reports` pipelines in flight.
+
+    All pipelines share one event loop, so every specialist, team and treatment
+    call goes through the same per-provider concurrency limits and per-key rate
+    limiter. Returns the statistics printed by `print_stats`.
+    """
+    api_keys = load_agent_api_keys()
+    queue = asyncio.Queue()
+    for path in report_paths:
+        queue.put_nowait(path)
+
+    stats = {"total": len(report_paths), "processed": 0, "skipped": 0, "failed": [], "latencies": []}
+    started = time.perf_counter()
+
+    async def worker():
+        while True:
+            try:
+                path = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                with open(path, "r", encoding="utf-8") as file:
+                    medical_report = file.read()
+                input_hash = report_hash(medical_report)
+                output_dir = output_dir_for(path, results_dir)
+                if not force and is_up_to_date(output_dir, input_hash):
+                    stats["skipped"] += 1
+                    print(f"[Batch] Skipping {path} (up to date in {output_dir})")
+                    continue
+                elapsed = await process_report(
+                    path, output_dir, medical_report, input_hash, api_keys, specialist_mode, routing, team_mode
+                )
+                stats["processed"] += 1
+                stats["latencies"].append(elapsed)
+                done = stats["processed"] + stats["skipped"] + len(stats["failed"])
+                print(f"[Batch] {done}/{stats['total']} {path} -> {output_dir} ({elapsed:.1f}s)")
+            except Exception as e:
+                stats["failed"].append(path)
+                print(f"[Batch] ERROR: {path} failed: {e}")
+
+    await asyncio.gather(*(worker() for _ in range(max(1, max_reports))))
+    stats["wall_seconds"] = time.perf_counter() - started
+    return stats
+
+
+def print_stats(stats):
+    wall = stats["wall_seconds"]
+    latencies = sorted(stats["latencies"])
+    llm_calls = sum(s["calls"] for s in rate_limiter.stats().values())
+    rate_limit_wait = sum(s["total_wait_seconds"] for s in rate_limiter.stats().values())
+    cache = get_response_cache().stats()
+
+    print("")
+    print("Batch summary")
+    print(f"  Reports:         {stats['total']} total, {stats['processed']} processed, "
+          f"{stats['skipped']} skipped, {len(stats['failed'])} failed")
+    print(f"  Wall time:       {wall:.1f}s")
+    if stats["processed"] and wall > 0:
+        print(f"  Throughput:      {stats['processed'] / wall * 60:.2f} reports/min")
+    if latencies:
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"  Report latency:  median {statistics.median(latencies):.1f}s, p95 {p95:.1f}s, max {latencies[-1]:.1f}s")
+    print(f"  LLM calls:       {llm_calls} ({llm_calls / wall:.2f}/s)" if wall > 0 else f"  LLM calls:       {llm_calls}")
+    print(f"  Rate-limit wait: {rate_limit_wait:.1f}s total")
+    if cache.get("enabled"):
+        print(f"  Response cache:  {cache['hits']} hits, {cache['misses']} misses ({cache['hit_rate']:.0%} hit rate)")
+    for path in stats["failed"]:
+        print(f"  Failed:          {path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the diagnostic agents over one or more medical reports.")
+    parser.add_argument(
+        "inputs",
+        nargs="*",
+        help='Report files, directories or glob patterns (e.g. "Medical Reports/*.txt"); '
+             "defaults to MEDICAL_REPORT_FILE",
+    )
+    parser.add_argument("--output-dir", default=RESULTS_DIR, help="Root directory for per-report outputs (default: results)")
+    parser.add_argument("--max-reports", type=int, default=4, help="Reports processed at the same time (default: 4)")
+    parser.add_argument("--force", action="store_true", help="Reprocess reports whose outputs are already up to date")
+    parser.add_argument(
+        "--specialist-mode",
+        choices=SPECIALIST_MODES,
+        default=None,
+        help='"individual": one call per specialist; "panel": one call for all five (default: SPECIALIST_MODE or individual)',
+    )
+    parser.add_argument(
+        "--route-specialists",
+        action="store_true",
+        default=None,
+        help="Only consult specialists the local router finds relevant to each report (default: SPECIALIST_ROUTING)",
+    )
+    parser.add_argument(
+        "--team-mode",
+        choices=TEAM_MODES,
+        default=None,
+        help='"separate": team summary, then treatment options; "fused": both in one call (default: TEAM_MODE or separate)',
+    )
+    args = parser.parse_args(argv)
+
+    # Loading API key from a dotenv file.
+    load_dotenv(dotenv_path='apikey.env')
+
+    inputs = args.inputs or [os.path.join("Medical Reports", MEDICAL_REPORT_FILE)]
+    report_paths = collect_reports(inputs)
+    if not report_paths:
+        parser.error("no medical reports matched the given inputs")
+
+    specialist_mode = args.specialist_mode or os.getenv("SPECIALIST_MODE", "individual")
+    team_mode = args.team_mode or os.getenv("TEAM_MODE", "separate")
+    stats = asyncio.run(run_batch(
+        report_paths, args.output_dir, args.max_reports, args.force, specialist_mode, args.route_specialists, team_mode
+    ))
+    print_stats(stats)
+    return 1 if stats["failed"] else 0
+
 
-print(f"Structured team summary saved to {json_output_path}")
-print("Structured treatment options saved to results/treatment/treatment1.json, treatment2.json, treatment3.json")
\ No newline at end of file
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,13 +1,32 @@
-from langchain_core.prompts import PromptTemplate
-from langchain_ollama import ChatOllama
 import os
-import json
 import re
-from typing import List, Optional, Dict
+import json
+import asyncio
 import time
-from threading import Lock
-from pydantic import BaseModel, Field, ValidationError
+import zlib
+from functools import lru_cache
+from typing import Any, List, Optional, Dict
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
 from typing import Literal
+from Utils.RateLimiter import aenforce_rate_limit, enforce_rate_limit, estimate_tokens
+from Utils.PromptRegistry import prompt_registry
+from Utils.LLMClients import GEMINI_AVAILABLE, agent_model_spec, get_chat_model
+from Utils.Hedging import DeadlineExceeded, hedge_delay, latency_tracker, role_deadline
+from Utils.ResponseCache import get_response_cache
+from Utils.Retry import retry_policy
+from Utils.StreamingJSON import IncrementalJSONParser, iter_json_objects
+from Utils.Telemetry import start_call
+
+
+class ResponseParseError(ValueError):
+    """A model response that could not be turned into the expected structure"""
+
+    def __init__(self, message, reason, errors=None):
+        super().__init__(message)
+        # Short failure category recorded in telemetry: empty_response, invalid_json or schema_validation
+        self.reason = reason
+        # One line per problem, quoted back to the model in a repair prompt
+        self.errors = errors or []
 
 
 class EvidenceItem(BaseModel):
@@ -60,29 +79,247 @@ class TeamSummary(BaseModel):
     disagreement_notes: List[str] = Field(default_factory=list)
     specialist_confidence: Dict[str, float] = Field(default_factory=dict)
 
-# Simple rate limiting (default: 7 seconds between calls, configurable via env variable)
-_RATE_LIMIT_LOCK = Lock()
-_LAST_CALL_TIME = 0.0
-_CALL_INTERVAL_SECONDS = float(os.getenv("LLM_CALL_INTERVAL_SECONDS", "7"))
+# Cache identity for structured treatment options (bump when the treatment JSON prompt schema changes)
+TREATMENT_CACHE_ROLE = "MultidisciplinaryTeam.treatment"
+TREATMENT_SCHEMA_VERSION = "1"
+
+# Cache identity for fused team summary + treatment replies (bump when the fused output format changes)
+FUSED_CACHE_ROLE = "MultidisciplinaryTeam.fused"
+FUSED_SCHEMA_VERSION = "1"
+
+# Specialists answered by a single SpecialistPanel call, in prompt order
+PANEL_ROLES = ("Internist", "Neurologist", "Cardiologist", "Gastroenterologist", "Psychiatrist")
+# Each panel role's remit, as listed in the panel prompt
+PANEL_FOCUS = {
+    "Internist": "systemic diseases, medication interactions, and whole-body implications.",
+    "Neurologist": "brain, spine, nerve, and neuromuscular issues only.",
+    "Cardiologist": "heart structure, rhythm, perfusion, and cardiovascular risk only.",
+    "Gastroenterologist": "GI tract, liver, pancreas, and related systems only.",
+    "Psychiatrist": "mood, anxiety, cognition, behavior, and psychopharmacology effects.",
+}
+_PANEL_SIZES = {2: "two", 3: "three", 4: "four", 5: "five"}
+# Bump when the panel prompt's output format changes (invalidates cached panel replies)
+PANEL_SCHEMA_VERSION = "1"
+# Registry name of the free-text treatment plan prompt
+TREATMENT_TEXT_PROMPT_NAME = "MultidisciplinaryTeam.treatment_text"
+
+# Version of the prompt templates below; part of the prompt registry key
+PROMPT_TEMPLATE_VERSION = "1"
+
+# Array fields whose items are emitted while a response is still streaming
+STREAMED_FIELDS = {
+    SpecialistReport: {"key_findings": EvidenceItem},
+    TeamSummary: {"diagnoses": DiagnosisItem},
+}
+
+# Parse failures a repair prompt can fix (an empty reply has nothing to repair)
+REPAIRABLE_REASONS = ("invalid_json", "schema_validation")
+REPAIR_PROMPT_NAME = "repair"
+# Follow-up sent instead of the full prompt when a reply fails validation
+_REPAIR_TEMPLATE = """Your previous reply {{ problem }}.
+
+ERRORS:
+{{ errors }}
+
+PREVIOUS REPLY:
+{{ reply }}
+
+Return the corrected JSON object only. Fix the errors listed above, keep every other field and value unchanged, and do not add prose or code fences.
+"""
+
+
+def repair_prompt():
+    return prompt_registry.get(
+        REPAIR_PROMPT_NAME, PROMPT_TEMPLATE_VERSION, lambda: (_REPAIR_TEMPLATE, ["problem", "errors", "reply"])
+    )
+
+
+class _ItemRelay:
+    """Forwards each distinct streamed item to `on_item` once, however many attempts the reply takes"""
+
+    def __init__(self, on_item):
+        self.on_item = on_item
+        self._sent = set()
+
+    def callback(self):
+        return self.send if self.on_item is not None else None
+
+    def send(self, field, item):
+        key = (field, json.dumps(item, sort_keys=True, default=str))
+        if key not in self._sent:
+            self._sent.add(key)
+            self.on_item(field, item)
+
+    def replay(self, structured):
+        """Send the items of the final (e.g. cached or repaired) reply that were not streamed"""
+        if self.on_item is None:
+            return
+        for field in STREAMED_FIELDS.get(type(structured), {}):
+            for item in getattr(structured, field):
+                self.send(field, item.model_dump())
+
+
+def compact_prompts_enabled():
+    """Whether team/treatment prompts use the compact encoding (PROMPT_COMPACT, on unless set to 0/false)"""
+    return os.getenv("PROMPT_COMPACT", "1").lower() not in ("0", "false", "no")
+
+
+def _drop_empty(value):
+    if isinstance(value, dict):
+        cleaned = {k: _drop_empty(v) for k, v in value.items()}
+        return {k: v for k, v in cleaned.items() if v is not None and v != "" and v != [] and v != {}}
+    if isinstance(value, list):
+        cleaned = [_drop_empty(v) for v in value]
+        return [v for v in cleaned if v is not None and v != "" and v != [] and v != {}]
+    return value
 
 
-def enforce_rate_limit():
-    """Ensure at most 1 call every _CALL_INTERVAL_SECONDS globally."""
-    global _LAST_CALL_TIME
-    with _RATE_LIMIT_LOCK:
-        now = time.time()
-        wait_time = _CALL_INTERVAL_SECONDS - (now - _LAST_CALL_TIME)
-        if wait_time > 0:
-            time.sleep(wait_time)
-        _LAST_CALL_TIME = time.time()
+def compact_json(payload):
+    """Minified JSON with null and empty fields dropped, for prompts"""
+    return json.dumps(_drop_empty(payload), separators=(",", ":"), ensure_ascii=False)
 
 
-# Try to import Google Gemini (optional - only if package is installed)
-try:
-    from langchain_google_genai import ChatGoogleGenerativeAI
-    GEMINI_AVAILABLE = True
-except ImportError:
-    GEMINI_AVAILABLE = False
+# Team prompt input section, and its compact replacement that carries each
+# specialist report once (inside the bundle)
+_TEAM_INPUT_DATA = """INPUT DATA (validated JSON strings):
+- Internist Report: {{ internist_report }}
+- Neurologist Report: {{ neurologist_report }}
+- Cardiologist Report: {{ cardiologist_report }}
+- Gastroenterologist Report: {{ gastroenterologist_report }}
+- Psychiatrist Report: {{ psychiatrist_report }}
+- Structured Specialist Bundle: {{ structured_specialist_reports }}
+- Patient Chief Complaint and Symptoms: {{ chief_complaint }}
+"""
+_TEAM_COMPACT_INPUT_DATA = """INPUT DATA (minified JSON, empty fields omitted):
+- Specialist Reports (keyed by specialist): {{ structured_specialist_reports }}
+- Patient Chief Complaint and Symptoms: {{ chief_complaint }}
+"""
+_TEAM_REPORT_FIELDS = (
+    "internist_report",
+    "neurologist_report",
+    "cardiologist_report",
+    "gastroenterologist_report",
+    "psychiatrist_report",
+)
+# Static text of both input sections, for sizing the full prompt from a compact one
+_TEAM_INPUT_LABELS = re.sub(r"\{\{.*?\}\}", "", _TEAM_INPUT_DATA)
+_TEAM_COMPACT_INPUT_LABELS = re.sub(r"\{\{.*?\}\}", "", _TEAM_COMPACT_INPUT_DATA)
+# Team call kinds (as in telemetry) -> keys of `MultidisciplinaryTeam.prompt_tokens`
+_TEAM_PROMPT_CALLS = {"agent": "team", "fused": "fused", "treatment": "treatment"}
+
+
+def _swapped_prompt_tokens(prompt, replacements):
+    """
+    Estimated tokens of `prompt` with each (full, compact) text pair swapped
+    back to its full form, without rendering the full prompt.
+    """
+    chars = len(prompt) + sum(len(full) - len(compact) for full, compact in replacements)
+    # Same ~4 characters per token as `estimate_tokens`
+    return max(1, chars // 4) if chars > 0 else 0
+
+
+# Fused mode: inserted before the team prompt's constraints so the same reply
+# also carries the treatment options
+_TEAM_CONSTRAINTS = "\nCONSTRAINTS:\n"
+_FUSED_TREATMENT_SECTION = """
+TREATMENT OPTIONS:
+In the same JSON object, also return a top-level "treatment_options" array with exactly three treatment options for the diagnoses above (led by the rank 1 diagnosis), each matching:
+{
+  "option_number": 1,
+  "match_percentage": 0-100,
+  "primary_name": "string",
+  "overview": "string",
+  "modality": "string",
+  "success_rate": 0-100,
+  "duration": "string",
+  "recovery_time": "string",
+  "cost_estimate": "string",
+  "side_effects": ["string"],
+  "recommended_for": ["string"],
+  "procedure_steps": ["string"],
+  "notes": ["string"]
+}
+- Number the options 1-3 with descending match_percentage unless clinical nuance dictates otherwise.
+- Keep treatment fields concise and clinically realistic.
+"""
+
+
+@lru_cache(maxsize=None)
+def type_adapter(schema):
+    """Shared TypeAdapter per schema (building one compiles a validator)"""
+    return TypeAdapter(schema)
+
+
+def content_text(content):
+    """Text of a model response's content (a string, or a list of text parts)"""
+    if isinstance(content, list):
+        return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return content if isinstance(content, str) else str(content)
+
+
+def validation_messages(err, limit=20):
+    """`path: message (got value)` lines for the first `limit` errors of a ValidationError"""
+    messages = []
+    for error in err.errors(include_url=False)[:limit]:
+        path = ".".join(str(part) for part in error["loc"]) or "(root)"
+        message = f"{path}: {error['msg']}"
+        if error["type"] != "missing":
+            value = repr(error.get("input"))
+            message += f" (got {value if len(value) <= 80 else value[:77] + '...'})"
+        messages.append(message)
+    return messages
+
+
+def parse_json_object(text, schema, label=""):
+    """
+    Validate the first JSON object in `text` that matches `schema`.
+
+    The span from the first `{` to the last `}` is tried first with a single
+    `validate_json` call (parsing and validation in one pass), which covers
+    bare JSON and code fences without braces in the surrounding prose. Only
+    if that span is not JSON are the objects located one by one with
+    `iter_json_objects` and validated from their decoded value. Raises
+    ResponseParseError with reason invalid_json or schema_validation.
+    """
+    adapter = type_adapter(schema)
+    first, last = text.find("{"), text.rfind("}")
+    if first < 0 or last < first:
+        raise ResponseParseError(
+            f"{label}No JSON object found\nRaw text: {repr(text)}", "invalid_json", ["the reply contains no JSON object"]
+        )
+    try:
+        return adapter.validate_json(text[first:last + 1])
+    except ValidationError as err:
+        if not all(error["type"] == "json_invalid" for error in err.errors()):
+            raise ResponseParseError(
+                f"{label}Structured output validation failed: {err}", "schema_validation", validation_messages(err)
+            ) from err
+        json_error = err.errors(include_url=False)[0]["msg"]
+
+    # Prose or a second object around the JSON; take the objects one at a time
+    schema_error = None
+    for _, _, value in iter_json_objects(text):
+        try:
+            return adapter.validate_python(value)
+        except ValidationError as err:
+            if schema_error is None:
+                schema_error = err
+    if schema_error is not None:
+        raise ResponseParseError(
+            f"{label}Structured output validation failed: {schema_error}", "schema_validation",
+            validation_messages(schema_error),
+        )
+    raise ResponseParseError(f"{label}Failed to decode JSON\nRaw text: {repr(text)}", "invalid_json", [json_error])
+
+
+def streaming_enabled():
+    """Whether agents stream completions by default (LLM_STREAMING, on unless set to 0/false)"""
+    return os.getenv("LLM_STREAMING", "1").lower() not in ("0", "false", "no")
+
+
+def _valid_treatment_options(options):
+    """Whether `options` is a usable treatment plan: a non-empty list of option objects"""
+    return isinstance(options, list) and bool(options) and all(isinstance(option, dict) for option in options)
 
 class Agent:
     def __init__(self, medical_report=None, role=None, extra_info=None, api_key=None):
@@ -103,20 +340,46 @@ class Agent:
                 google_api_key = os.getenv("GOOGLE_API_KEY")
         else:
             google_api_key = api_key
-        if GEMINI_AVAILABLE and google_api_key:
-            # Using gemini-2.5-flash (stable, free tier, fast)
-            # Alternative free models: gemini-2.0-flash-lite,
-            # "models/gemini-flash-latest" (latest flash), "models/gemini-pro-latest" (latest pro)
-            self.model = ChatGoogleGenerativeAI(
-                temperature=0, 
-                model="models/gemini-2.5-flash",
-                google_api_key=google_api_key
-            )
-        else:
-            # Fallback to Ollama if Gemini not available
-            self.model = ChatOllama(temperature=0, model="llama3.1")
+        # Gemini when a key is available, Ollama otherwise; the client itself is
+        # shared with every other agent using the same model and key
+        self.provider, self.model_name, google_api_key = agent_model_spec(google_api_key)
+        self.model = get_chat_model(self.provider, self.model_name, google_api_key, temperature=0)
+        # Rate limits are tracked per API key and model
+        self.api_key = google_api_key
         self.last_raw_response = None
         self.last_structured_response = None
+        self.last_rate_limit_wait = 0.0
+        self.last_call = None
+        # Second client on another API key for hedge requests (see `enable_hedging`)
+        self.hedge_api_key = None
+        self.hedge_model = None
+
+    def enable_hedging(self, api_keys):
+        """Send hedge requests on one of `api_keys` other than this agent's own (Gemini only)"""
+        others = sorted({key for key in api_keys if key and key != self.api_key})
+        if self.provider != "gemini" or not others:
+            return
+        # Spread the roles over the other keys, the same way in every process
+        self.hedge_api_key = others[zlib.crc32(self.role.encode("utf-8")) % len(others)]
+        self.hedge_model = get_chat_model(self.provider, self.model_name, self.hedge_api_key, temperature=0)
+
+    def _wait_for_rate_limit(self, prompt):
+        """Wait for this agent's key/model bucket and remember the queue wait"""
+        self.last_rate_limit_wait = enforce_rate_limit(
+            api_key=self.api_key, model=self.model_name, tokens=estimate_tokens(prompt)
+        )
+        if self.last_rate_limit_wait > 0:
+            print(f"{self.role} waited {self.last_rate_limit_wait:.2f}s for its rate limit")
+        return self.last_rate_limit_wait
+
+    async def _await_rate_limit(self, prompt):
+        """Async variant of `_wait_for_rate_limit` that sleeps on the event loop"""
+        self.last_rate_limit_wait = await aenforce_rate_limit(
+            api_key=self.api_key, model=self.model_name, tokens=estimate_tokens(prompt)
+        )
+        if self.last_rate_limit_wait > 0:
+            print(f"{self.role} waited {self.last_rate_limit_wait:.2f}s for its rate limit")
+        return self.last_rate_limit_wait
 
     def _resolve_schema_model(self):
         if self.role == "MultidisciplinaryTeam":
@@ -124,57 +387,39 @@ class Agent:
         return SpecialistReport
 
     def _extract_json(self, text):
-        if isinstance(text, list):
-            text = " ".join([json.dumps(t) if isinstance(t, (dict, list)) else str(t) for t in text])
-        elif isinstance(text, dict):
-            text = json.dumps(text)
-        elif isinstance(text, str):
-            text = text.strip()
-        else:
-            text = str(text)
-        
+        """Text of the first balanced JSON object in the response (or the stripped text if there is none)"""
+        text = content_text(text).strip()
         if not text:
-            raise ValueError(f"[{self.role}] No content to parse!")
-
-        # First, try to extract JSON from markdown code blocks (```json ... ``` or ``` ... ```)
-        markdown_pattern = r'```(?:json)?\s*\n?(.*?)\n?```'
-        markdown_match = re.search(markdown_pattern, text, flags=re.S | re.I)
-        if markdown_match:
-            text = markdown_match.group(1).strip()
-        
-        # Now try to find JSON object in the text
-        match = re.search(r'\{.*\}', text, flags=re.S)
-        if match:
-            candidate = match.group(0)
-            try:
-                json.loads(candidate)
-                return candidate
-            except json.JSONDecodeError:
-                pass  # fallback to using full text below
-
+            raise ResponseParseError(f"[{self.role}] No content to parse!", "empty_response")
+        for start, end, _ in iter_json_objects(text):
+            return text[start:end]
         return text
 
-    def _parse_response(self, raw_text):
+    def _parse_response(self, raw_text, schema=None):
+        schema = schema or self.schema_model
         if raw_text is None or (isinstance(raw_text, str) and not raw_text.strip()):
-            raise ValueError(f"[{self.role}] Empty response received!")
-
-        json_text = self._extract_json(raw_text)
-
-        if not json_text.strip():
-            raise ValueError(f"[{self.role}] Extracted JSON is empty!")
-
-        try:
-            data = json.loads(json_text)
-        except json.JSONDecodeError as e:
-            raise ValueError(f"[{self.role}] Failed to decode JSON: {e}\nRaw text: {repr(json_text)}") from e
-
-        try:
-            # Validate with your schema model
-            return self.schema_model.model_validate(data)
-        except ValidationError as err:
-            raise ValueError(f"[{self.role}] Structured output validation failed: {err}") from err
+            raise ResponseParseError(f"[{self.role}] Empty response received!", "empty_response")
+        if isinstance(raw_text, dict):
+            # Already decoded by the provider; validate it directly
+            try:
+                return type_adapter(schema).validate_python(raw_text)
+            except ValidationError as err:
+                raise ResponseParseError(
+                    f"[{self.role}] Structured output validation failed: {err}", "schema_validation",
+                    validation_messages(err),
+                ) from err
+
+        text = content_text(raw_text)
+        if not text.strip():
+            raise ResponseParseError(f"[{self.role}] Extracted JSON is empty!", "empty_response")
+        return parse_json_object(text, schema, label=f"[{self.role}] ")
 
     def create_prompt_template(self):
+        """Compiled prompt for this role, shared with every other agent of the same role"""
+        return prompt_registry.get(self.role, PROMPT_TEMPLATE_VERSION, self._prompt_source)
+
+    def _prompt_source(self):
+        """(jinja2 template, input variables) for this role; compiled once by the registry"""
         if self.role == "MultidisciplinaryTeam":
             templates = """
 You are the multidisciplinary synthesis team responsible for converting structured specialist insights into a prioritized differential diagnosis.
@@ -285,6 +530,7 @@ CONSTRAINTS:
 - Contradictions should capture conflicts or gaps, referencing the relevant specialist.
 - next_steps should list concrete clinical actions for that diagnosis.
 - consensus_highlights summarize areas of agreement; disagreement_notes capture unresolved conflicts.
+- A specialist entry with "status": "not_consulted" was not asked because the report holds nothing for that specialty; do not cite it in specialist_support and leave it out of specialist_confidence.
 - Return nothing except the JSON object.
 """
         else:
@@ -515,33 +761,339 @@ Medical Report: {medical_report}
             ]
         else:
             input_vars = ["medical_report"]
-        return PromptTemplate(template=templates, input_variables=input_vars, template_format="jinja2")
+        return templates, input_vars
     
-    def run(self):
-        print(f"{self.role} is running...")
+    def build_prompt(self):
         if self.role == "MultidisciplinaryTeam":
             # For MultidisciplinaryTeam, format with extra_info values
-            prompt = self.prompt_template.format(
-                internist_report=self.extra_info.get('internist_report', ''),
-                neurologist_report=self.extra_info.get('neurologist_report', ''),
-                cardiologist_report=self.extra_info.get('cardiologist_report', ''),
-                gastroenterologist_report=self.extra_info.get('gastroenterologist_report', ''),
-                psychiatrist_report=self.extra_info.get('psychiatrist_report', ''),
-                chief_complaint=self.extra_info.get('chief_complaint', ''),
-                structured_specialist_reports=self.extra_info.get('structured_reports_json', '')
-            )
-        else:
-            # For individual agents, format with medical_report
-            prompt = self.prompt_template.format(medical_report=self.medical_report)
+            return self.prompt_template.format(**self._team_prompt_values())
+        # For individual agents, format with medical_report
+        return self.prompt_template.format(medical_report=self.medical_report)
+
+    def _cached_response(self, prompt):
+        """Return a previously validated response for this exact prompt, if cached"""
+        cached = get_response_cache().lookup(self.role, self.model_name, prompt, self.schema_model)
+        if cached is not None:
+            print(f"{self.role} served from response cache")
+            self.last_rate_limit_wait = 0.0
+            self.last_structured_response = cached
+        return cached
+
+    @staticmethod
+    def _response_text(response):
+        return response.content if hasattr(response, "content") else str(response)
+
+    def _handle_response(self, response, prompt):
+        return self._handle_text(self._response_text(response), prompt)
+
+    def _handle_text(self, raw_text, prompt):
+        self.last_raw_response = raw_text
+        structured = self._parse_response(raw_text)
+        self.last_structured_response = structured
+        # Only reached when validation succeeded, so bad parses are never cached
+        get_response_cache().store(self.role, self.model_name, prompt, structured)
+        return structured
+
+    @staticmethod
+    def _chunk_text(chunk):
+        return content_text(chunk.content if hasattr(chunk, "content") else chunk)
+
+    def _new_stream_parser(self):
+        return IncrementalJSONParser(watch=STREAMED_FIELDS.get(self.schema_model, {}))
+
+    def _emit_items(self, items, on_item):
+        if on_item is None:
+            return
+        item_models = STREAMED_FIELDS.get(self.schema_model, {})
+        for field, value in items:
+            try:
+                item = item_models[field].model_validate(value)
+            except ValidationError:
+                # Left to the full validation once the object is complete
+                continue
+            on_item(field, item.model_dump())
+
+    def _stream_text(self, parser):
+        # The stream is cut once the top-level object closes; fall back to
+        # everything received when no complete object was found
+        return parser.document if parser.done else parser.text
+
+    @staticmethod
+    def _add_usage(usage, chunk):
+        # Chunk usage metadata holds per-chunk deltas (langchain sums them when merging chunks)
+        chunk_usage = getattr(chunk, "usage_metadata", None)
+        if not chunk_usage:
+            return usage
+        usage = dict(usage or {})
+        for key in ("input_tokens", "output_tokens"):
+            if chunk_usage.get(key) is not None:
+                usage[key] = usage.get(key, 0) + chunk_usage[key]
+        return usage
+
+    def _stream_response(self, prompt, on_item):
+        """Returns (text, usage metadata or None)"""
+        parser = self._new_stream_parser()
+        usage = None
+        chunks = self.model.stream(prompt, **self._model_kwargs())
+        try:
+            for chunk in chunks:
+                usage = self._add_usage(usage, chunk)
+                self._emit_items(parser.feed(self._chunk_text(chunk)), on_item)
+                if parser.done:
+                    break
+        finally:
+            chunks.close()
+        return self._stream_text(parser), usage
+
+    async def _astream_response(self, prompt, on_item, model=None):
+        parser = self._new_stream_parser()
+        usage = None
+        chunks = (model or self.model).astream(prompt, **self._model_kwargs())
+        try:
+            async for chunk in chunks:
+                usage = self._add_usage(usage, chunk)
+                self._emit_items(parser.feed(self._chunk_text(chunk)), on_item)
+                if parser.done:
+                    break
+        finally:
+            await chunks.aclose()
+        return self._stream_text(parser), usage
+
+    def _model_kwargs(self):
+        # Retries are handled by `_generate`; keep the Gemini client from retrying
+        # underneath it, and bound the blocking (sync) calls by the role's deadline
+        if self.provider != "gemini":
+            return {}
+        return {"max_retries": 1, "timeout": role_deadline(self.role)}
+
+    def _retry_delay(self, policy, attempt, error, call):
+        call.model_failed()
+        call.retries += 1
+        delay = policy.backoff(attempt)
+        print(
+            f"{self.role} model call failed ({type(error).__name__}: {error}); "
+            f"retry {attempt}/{policy.max_attempts - 1} in {delay:.1f}s"
+        )
+        return delay
+
+    def _generate(self, prompt, call, stream=False, relay=None):
+        """
+        Text of one model reply to `prompt`.
+
+        Transport errors are retried with backoff per the retry policy; every
+        attempt waits for the rate limit and is added to `call`.
+        """
+        policy = retry_policy()
+        attempt = 1
+        while True:
+            call.rate_limit_wait += self._wait_for_rate_limit(prompt)
+            call.model_started()
+            try:
+                if stream:
+                    raw_text, usage = self._stream_response(prompt, relay.callback() if relay else None)
+                else:
+                    response = self.model.invoke(prompt, **self._model_kwargs())
+                    raw_text, usage = self._response_text(response), getattr(response, "usage_metadata", None)
+            except Exception as e:
+                if not policy.should_retry(e, attempt):
+                    raise
+                time.sleep(self._retry_delay(policy, attempt, e, call))
+                attempt += 1
+                continue
+            call.model_finished(prompt, raw_text, usage)
+            return raw_text
+
+    async def _arequest(self, model, prompt, stream, on_item):
+        """One request to `model`; returns (text, usage metadata or None)"""
+        if stream:
+            return await self._astream_response(prompt, on_item, model)
+        response = await model.ainvoke(prompt, **self._model_kwargs())
+        return self._response_text(response), getattr(response, "usage_metadata", None)
+
+    async def _ahedge_request(self, prompt, call, stream):
+        await aenforce_rate_limit(api_key=self.hedge_api_key, model=self.model_name, tokens=estimate_tokens(prompt))
+        call.hedges += 1
+        print(f"{self.role} is slow to answer; hedging on a second API key")
+        # Calls that stream items to the caller are not hedged, so the hedge never has an item callback
+        return await self._arequest(self.hedge_model, prompt, stream, None)
+
+    async def _arace(self, prompt, call, stream, relay):
+        """
+        Request `prompt` within the role's deadline; returns (text, usage).
+
+        If the request has not answered after the hedge delay, the same prompt
+        is also sent on the hedge key. The first non-empty answer wins and the
+        other request is cancelled; an error only counts once both have failed.
+        Raises DeadlineExceeded when no answer arrives in time. Calls that stream
+        items to `relay` are not hedged: items already delivered from one request
+        could not be taken back if the other won with a different reply.
+
+        The latency recorded for the hedge delay is the one the caller saw, from
+        the first request to the answer (the deadline when none came), whichever
+        request answered: a slow primary that lost to the hedge still counts as
+        slow, so the delay does not drift down as hedges win.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = role_deadline(self.role)
+        started = loop.time()
+        on_item = relay.callback() if relay and stream else None
+        primary = asyncio.create_task(self._arequest(self.model, prompt, stream, on_item))
+        hedge = None
+        pending = {primary}
+        error = None
+        empty = None
+        try:
+            hedged = self.hedge_model is not None and on_item is None
+            delay = hedge_delay(self.role, self.model_name) if hedged else None
+            if delay is not None and delay < deadline:
+                done, _ = await asyncio.wait(pending, timeout=delay)
+                if not done:
+                    hedge = asyncio.create_task(self._ahedge_request(prompt, call, stream))
+                    pending.add(hedge)
+            while pending:
+                remaining = deadline - (loop.time() - started)
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(remaining, 0), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    latency_tracker.record(self.role, self.model_name, deadline)
+                    raise DeadlineExceeded(self.role, deadline)
+                for task in done:
+                    if task.exception() is not None:
+                        # Report the original request's error rather than the hedge's
+                        if task is primary or error is None:
+                            error = task.exception()
+                        continue
+                    raw_text, usage = task.result()
+                    if not content_text(raw_text).strip():
+                        # Give the other request a chance to return something usable
+                        empty = empty or (raw_text, usage)
+                        continue
+                    if task is hedge:
+                        call.hedge_wins += 1
+                    latency_tracker.record(self.role, self.model_name, min(loop.time() - started, deadline))
+                    return raw_text, usage
+            if empty is not None:
+                return empty
+            raise error
+        finally:
+            losers = [task for task in (primary, hedge) if task is not None and not task.done()]
+            for task in losers:
+                task.cancel()
+            if losers:
+                await asyncio.gather(*losers, return_exceptions=True)
+
+    async def _agenerate(self, prompt, call, stream=False, relay=None):
+        """Async counterpart of `_generate`; each attempt is a deadline-bounded, possibly hedged `_arace`"""
+        policy = retry_policy()
+        attempt = 1
+        while True:
+            call.rate_limit_wait += await self._await_rate_limit(prompt)
+            call.model_started()
+            try:
+                raw_text, usage = await self._arace(prompt, call, stream, relay)
+            except Exception as e:
+                if not policy.should_retry(e, attempt):
+                    raise
+                await asyncio.sleep(self._retry_delay(policy, attempt, e, call))
+                attempt += 1
+                continue
+            call.model_finished(prompt, raw_text, usage)
+            return raw_text
+
+    def build_repair_prompt(self, raw_text, error):
+        """Follow-up holding only the rejected reply and the validator errors, not the original prompt"""
+        problem = "is not valid JSON" if error.reason == "invalid_json" else "does not match the required schema"
+        return repair_prompt().format(
+            problem=problem,
+            errors="\n".join(f"- {message}" for message in error.errors) or "- (no details)",
+            reply=content_text(raw_text).strip(),
+        )
+
+    def _start_repair(self, error, call):
+        """Count a repair for this parse failure; False if it cannot be repaired or the budget is spent"""
+        budget = retry_policy().repair_attempts
+        if error.reason not in REPAIRABLE_REASONS or call.repairs >= budget:
+            return False
+        call.repairs += 1
+        print(f"{self.role} reply failed validation ({error.reason}); sending repair prompt {call.repairs}/{budget}")
+        return True
+
+    def _parse_with_repair(self, raw_text, call, parse):
+        """`parse(raw_text)`, sending repair prompts while the reply fails validation and budget remains"""
+        while True:
+            try:
+                return parse(raw_text)
+            except ResponseParseError as e:
+                if not self._start_repair(e, call):
+                    raise
+                raw_text = self._generate(self.build_repair_prompt(raw_text, e), call)
+
+    async def _aparse_with_repair(self, raw_text, call, parse):
+        while True:
+            try:
+                # In a thread: `parse` stores validated replies in the (SQLite) response cache
+                return await asyncio.to_thread(parse, raw_text)
+            except ResponseParseError as e:
+                if not self._start_repair(e, call):
+                    raise
+                raw_text = await self._agenerate(self.build_repair_prompt(raw_text, e), call)
+
+    def run(self, stream=None, on_item=None):
+        """
+        Run the agent and return the validated report (None on failure).
+
+        In streaming mode (`stream`, default from LLM_STREAMING) the completion
+        is parsed as it arrives: `on_item(field, item)` is called for each
+        `key_findings` / `diagnoses` entry as soon as it is complete, and the
+        stream is closed once the JSON object ends. Transport errors and
+        replies that fail validation are retried per `Utils.Retry`.
+        """
+        print(f"{self.role} is running...")
+        prompt = self.build_prompt()
+        if stream is None:
+            stream = streaming_enabled()
+        call = self.last_call = start_call("agent", self.role, self.model_name)
+        relay = _ItemRelay(on_item)
+        try:
+            cached = self._cached_response(prompt)
+            if cached is not None:
+                call.finish("cached")
+                relay.replay(cached)
+                return cached
+            raw_text = self._generate(prompt, call, stream, relay)
+            structured = self._parse_with_repair(raw_text, call, lambda text: self._handle_text(text, prompt))
+            call.finish()
+            relay.replay(structured)
+            return structured
+        except Exception as e:
+            call.fail(e)
+            print(f"Error occurred in {self.role}:", e)
+            import traceback
+            traceback.print_exc()
+            return None
+
+    async def arun(self, stream=None, on_item=None):
+        """Async counterpart of `run` using the model's `ainvoke` / `astream` path"""
+        print(f"{self.role} is running...")
+        prompt = self.build_prompt()
+        if stream is None:
+            stream = streaming_enabled()
+        call = self.last_call = start_call("agent", self.role, self.model_name)
+        relay = _ItemRelay(on_item)
         try:
-            enforce_rate_limit()
-            response = self.model.invoke(prompt)
-            raw_text = response.content if hasattr(response, "content") else str(response)
-            self.last_raw_response = raw_text
-            structured = self._parse_response(raw_text)
-            self.last_structured_response = structured
+            cached = await asyncio.to_thread(self._cached_response, prompt)
+            if cached is not None:
+                call.finish("cached")
+                relay.replay(cached)
+                return cached
+            raw_text = await self._agenerate(prompt, call, stream, relay)
+            structured = await self._aparse_with_repair(raw_text, call, lambda text: self._handle_text(text, prompt))
+            call.finish()
+            relay.replay(structured)
             return structured
         except Exception as e:
+            call.fail(e)
             print(f"Error occurred in {self.role}:", e)
             import traceback
             traceback.print_exc()
@@ -568,8 +1120,179 @@ class Psychiatrist(Agent):
     def __init__(self, medical_report, api_key=None):
         super().__init__(medical_report, "Psychiatrist", api_key=api_key)
 
+class SpecialistPanel(Agent):
+    """
+    Panel mode: the specialist reports of `roles` (default: all five) from a single model call.
+
+    The medical report and the report schema are sent once instead of once per
+    role, and the prompt only asks for the roles on the panel. Each role's entry
+    is validated on its own; `run` / `arun` return the reports that validated,
+    and `failed_roles` maps the others to the reason, so the caller can run just
+    those roles as individual agents.
+    """
+
+    def __init__(self, medical_report, api_key=None, roles=None):
+        super().__init__(medical_report, "SpecialistPanel", api_key=api_key)
+        self.roles = tuple(role for role in PANEL_ROLES if roles is None or role in roles)
+        if len(self.roles) < 2:
+            raise ValueError(f"A specialist panel needs at least two of {', '.join(PANEL_ROLES)}")
+        self.failed_roles = {}
+
+    def _resolve_schema_model(self):
+        # The reply is checked as a plain object; entries are validated per role
+        return Dict[str, Any]
+
+    def build_prompt(self):
+        return self.prompt_template.format(
+            medical_report=self.medical_report,
+            roles=self.roles,
+            panel_size=_PANEL_SIZES[len(self.roles)],
+            focus=PANEL_FOCUS,
+        )
+
+    def _prompt_source(self):
+        return """
+You are a panel of {{ panel_size }} specialists ({{ roles | join(", ") }}) reviewing the same medical report. Each specialist writes an independent report from their own perspective.
+
+SPECIALIST FOCUS:
+{% for role in roles %}- {{ role }}: {{ focus[role] }}
+{% endfor %}
+INSTRUCTIONS:
+- Each specialist stays strictly within their own focus.
+- Reference only evidence from the report using short quotes (5-15 words).
+- Identify contradictions or gaps relevant to each specialty.
+
+OUTPUT (return ONLY JSON with one report per specialist):
+{
+{% for role in roles %}  "{{ role }}": REPORT{{ "," if not loop.last }}
+{% endfor %}}
+
+where each REPORT matches this schema:
+{
+  "specialist": "the specialist's name",
+  "primary_assessment": "string",
+  "overall_confidence": 0-100,
+  "key_findings": [
+    {
+      "summary": "string",
+      "quote": "string",
+      "confidence": 0-100
+    }
+  ],
+  "contradictions": [
+    {
+      "description": "string",
+      "related_specialist": "string or null",
+      "impact": "low" | "medium" | "high"
+    }
+  ],
+  "recommendations": [
+    "string"
+  ]
+}
+
+RULES:
+- Provide 2-4 key_findings with confidence scores in every report.
+- Recommendations must be actionable next steps within that specialty.
+- Arrays must be present even if empty (use []).
+- Return only the JSON object (no prose or explanations).
+
+Medical Report: {{ medical_report }}
+""", ["medical_report", "roles", "panel_size", "focus"]
+
+    def _parse_reports(self, raw_text, prompt):
+        """Validate each role's entry; raises only if none of them is usable"""
+        self.last_raw_response = raw_text
+        data = self._parse_response(raw_text)
+        reports, failed, errors = {}, {}, []
+        for role in self.roles:
+            entry = data.get(role)
+            if not isinstance(entry, dict):
+                failed[role] = "missing from the panel reply"
+                errors.append(f"{role}: Field required")
+                continue
+            try:
+                reports[role] = SpecialistReport.model_validate(dict(entry, specialist=role))
+            except ValidationError as err:
+                messages = validation_messages(err, limit=5)
+                failed[role] = "; ".join(messages)
+                errors.extend(f"{role}.{message}" for message in messages)
+        if not reports:
+            raise ResponseParseError(
+                f"[{self.role}] No valid specialist report in the panel reply", "schema_validation", errors
+            )
+        self.failed_roles = failed
+        if not failed:
+            # Only complete panels are cached, so a hit never needs fallback calls
+            get_response_cache().store_json(
+                self.role, self.model_name, prompt, PANEL_SCHEMA_VERSION,
+                {role: report.model_dump() for role, report in reports.items()},
+            )
+        return reports
+
+    def _cached_reports(self, prompt):
+        cached = get_response_cache().lookup_json(self.role, self.model_name, prompt, PANEL_SCHEMA_VERSION)
+        if cached is None:
+            return None
+        print(f"{self.role} served from response cache")
+        self.last_rate_limit_wait = 0.0
+        self.failed_roles = {}
+        return {role: SpecialistReport.model_validate(report) for role, report in cached.items()}
+
+    def _failed(self, e):
+        print(f"Error occurred in {self.role}:", e)
+        import traceback
+        traceback.print_exc()
+        self.failed_roles = {role: str(e) for role in self.roles}
+        return {}
+
+    def run(self, stream=None, on_item=None):
+        """Returns {role: SpecialistReport} for the roles whose entries validated"""
+        print(f"{self.role} is running...")
+        prompt = self.build_prompt()
+        call = self.last_call = start_call("panel", self.role, self.model_name)
+        try:
+            cached = self._cached_reports(prompt)
+            if cached is not None:
+                call.finish("cached")
+                return cached
+            raw_text = self._generate(prompt, call)
+            reports = self._parse_with_repair(raw_text, call, lambda text: self._parse_reports(text, prompt))
+            call.finish()
+            return reports
+        except Exception as e:
+            call.fail(e)
+            return self._failed(e)
+
+    async def arun(self, stream=None, on_item=None):
+        """Async counterpart of `run`"""
+        print(f"{self.role} is running...")
+        prompt = self.build_prompt()
+        call = self.last_call = start_call("panel", self.role, self.model_name)
+        try:
+            cached = await asyncio.to_thread(self._cached_reports, prompt)
+            if cached is not None:
+                call.finish("cached")
+                return cached
+            raw_text = await self._agenerate(prompt, call)
+            reports = await self._aparse_with_repair(raw_text, call, lambda text: self._parse_reports(text, prompt))
+            call.finish()
+            return reports
+        except Exception as e:
+            call.fail(e)
+            return self._failed(e)
+
 class MultidisciplinaryTeam(Agent):
-    def __init__(self, medical_report, internist_report, neurologist_report, cardiologist_report, gastroenterologist_report, psychiatrist_report, structured_reports_json="", api_key=None):
+    def __init__(self, medical_report, internist_report, neurologist_report, cardiologist_report, gastroenterologist_report, psychiatrist_report, structured_reports_json="", api_key=None, compact=None):
+        # Compact mode sends the specialist bundle once, minified, instead of
+        # every report twice in indented JSON
+        self.compact = compact_prompts_enabled() if compact is None else compact
+        # Prompt tokens per call: {"team"|"treatment"|"fused": {"sent": n, "sentEstimated": bool, "fullEstimate": n}}
+        self.prompt_tokens = {}
+        # Estimated tokens of the full encoding of the prompts last built, by call
+        self._full_prompt_estimates = {}
+        # Why the last fused reply's treatment options were unusable (None if they were)
+        self.fused_treatment_error = None
         extra_info = {
             "internist_report": internist_report,
             "neurologist_report": neurologist_report,
@@ -580,7 +1303,10 @@ class MultidisciplinaryTeam(Agent):
             "structured_reports_json": structured_reports_json
         }
         super().__init__(medical_report=medical_report, role="MultidisciplinaryTeam", extra_info=extra_info, api_key=api_key)
-        self.treatment_prompt_template = PromptTemplate(template="""
+        self.compact_prompt_template = prompt_registry.get(
+            f"{self.role}.compact", PROMPT_TEMPLATE_VERSION, self._compact_prompt_source
+        )
+        self.treatment_prompt_template = prompt_registry.get(TREATMENT_TEXT_PROMPT_NAME, PROMPT_TEMPLATE_VERSION, lambda: ("""
 You are the multidisciplinary specialist team finalizing comprehensive treatment recommendations.
 
 CLINICAL CONTEXT:
@@ -651,7 +1377,7 @@ ADDITIONAL RULES:
 - Ensure modality labels (e.g., "Pharmacologic Regimen", "Surgical + Radiation") clearly communicate the treatment category.
 - Tailor personalized notes to the patient’s presentation and the multidisciplinary findings—do not provide generic statements.
 - Maintain strict adherence to the line order and spacing shown (blank line between major sections, none within).
-""", input_variables=[
+""", [
             "diagnoses",
             "internist_report",
             "neurologist_report",
@@ -661,7 +1387,7 @@ ADDITIONAL RULES:
             "chief_complaint",
             "team_confidence",
             "structured_specialist_reports",
-        ], template_format="jinja2")
+        ]))
         # JSON schema prompt for structured treatment options
         treatment_json_template = """
 You are the multidisciplinary team producing structured treatment recommendations.
@@ -728,17 +1454,212 @@ CONSTRAINTS:
 - Ensure fields are concise and clinically realistic.
 - Return only JSON.
 """
-        self.treatment_json_prompt_template = PromptTemplate(
-            template=treatment_json_template,
-            input_variables=[
+        self.treatment_json_prompt_template = prompt_registry.get(
+            TREATMENT_CACHE_ROLE,
+            PROMPT_TEMPLATE_VERSION,
+            lambda: (treatment_json_template, [
                 "diagnoses",
                 "team_confidence",
                 "structured_specialist_reports",
-            ],
-            template_format="jinja2",
+            ]),
+        )
+
+    def _compact_prompt_source(self):
+        templates, _ = self._prompt_source()
+        assert _TEAM_INPUT_DATA in templates, "team prompt input section changed"
+        return templates.replace(_TEAM_INPUT_DATA, _TEAM_COMPACT_INPUT_DATA), [
+            "structured_specialist_reports",
+            "chief_complaint",
+        ]
+
+    def _compact_bundle(self):
+        bundle = self.extra_info.get("structured_reports_json", "")
+        try:
+            return compact_json(json.loads(bundle))
+        except ValueError:
+            return bundle
+
+    def _compact_team_prompt(self, template, name):
+        """Render a team prompt in the compact encoding and estimate the size of the full one"""
+        bundle = self._compact_bundle()
+        prompt = template.format(
+            structured_specialist_reports=bundle,
+            chief_complaint=self.extra_info.get("chief_complaint", ""),
+        )
+        reports = "".join(str(self.extra_info.get(field, "")) for field in _TEAM_REPORT_FIELDS)
+        self._full_prompt_estimates[name] = _swapped_prompt_tokens(prompt, [
+            (_TEAM_INPUT_LABELS + reports, _TEAM_COMPACT_INPUT_LABELS),
+            (self.extra_info.get("structured_reports_json", ""), bundle),
+        ])
+        return prompt
+
+    def _start_prompt(self, call):
+        """Attach the full-encoding estimate to the first request of a team call"""
+        name = _TEAM_PROMPT_CALLS.get(call.kind)
+        if name is None or call.full_prompt_tokens_estimate is not None:
+            return None
+        call.full_prompt_tokens_estimate = self._full_prompt_estimates.get(name)
+        return name
+
+    def _sent_prompt(self, name, call):
+        # Usage metadata of the prompt sent (estimated only if the provider reported none)
+        self.prompt_tokens[name] = {
+            "sent": call.prompt_tokens,
+            "sentEstimated": call.tokens_estimated,
+            "fullEstimate": call.full_prompt_tokens_estimate,
+        }
+
+    def _generate(self, prompt, call, stream=False, relay=None):
+        name = self._start_prompt(call)
+        raw_text = super()._generate(prompt, call, stream, relay)
+        if name is not None:
+            self._sent_prompt(name, call)
+        return raw_text
+
+    async def _agenerate(self, prompt, call, stream=False, relay=None):
+        name = self._start_prompt(call)
+        raw_text = await super()._agenerate(prompt, call, stream, relay)
+        if name is not None:
+            self._sent_prompt(name, call)
+        return raw_text
+
+    def build_prompt(self):
+        if not self.compact:
+            prompt = super().build_prompt()
+            self._full_prompt_estimates["team"] = estimate_tokens(prompt)
+            return prompt
+        return self._compact_team_prompt(self.compact_prompt_template, "team")
+
+    def _team_prompt_values(self):
+        return {
+            "internist_report": self.extra_info.get("internist_report", ""),
+            "neurologist_report": self.extra_info.get("neurologist_report", ""),
+            "cardiologist_report": self.extra_info.get("cardiologist_report", ""),
+            "gastroenterologist_report": self.extra_info.get("gastroenterologist_report", ""),
+            "psychiatrist_report": self.extra_info.get("psychiatrist_report", ""),
+            "chief_complaint": self.extra_info.get("chief_complaint", ""),
+            "structured_specialist_reports": self.extra_info.get("structured_reports_json", ""),
+        }
+
+    def _fused_prompt_source(self, compact):
+        templates, input_variables = self._compact_prompt_source() if compact else self._prompt_source()
+        assert _TEAM_CONSTRAINTS in templates, "team prompt constraints section changed"
+        return templates.replace(_TEAM_CONSTRAINTS, _FUSED_TREATMENT_SECTION + _TEAM_CONSTRAINTS), input_variables
+
+    def _fused_template(self, compact):
+        name = f"{self.role}.compact.fused" if compact else f"{self.role}.fused"
+        return prompt_registry.get(name, PROMPT_TEMPLATE_VERSION, lambda: self._fused_prompt_source(compact))
+
+    def build_fused_prompt(self):
+        """Team prompt that also asks for the treatment options, for fused mode"""
+        if not self.compact:
+            prompt = self._fused_template(False).format(**self._team_prompt_values())
+            self._full_prompt_estimates["fused"] = estimate_tokens(prompt)
+            return prompt
+        return self._compact_team_prompt(self._fused_template(True), "fused")
+
+    def _parse_fused(self, raw_text, prompt):
+        """
+        (TeamSummary, treatment options or None) from a fused reply.
+
+        The summary and the options are validated separately: only an invalid
+        summary fails the reply (and is repaired), while unusable options are
+        reported in `fused_treatment_error` for the caller to request on their own.
+        """
+        self.last_raw_response = raw_text
+        data = self._parse_response(raw_text, schema=Dict[str, Any])
+        try:
+            summary = TeamSummary.model_validate(data)
+        except ValidationError as err:
+            raise ResponseParseError(
+                f"[{self.role}] Structured output validation failed: {err}", "schema_validation",
+                validation_messages(err),
+            ) from err
+        self.last_structured_response = summary
+        options = data.get("treatment_options")
+        if not _valid_treatment_options(options):
+            self.fused_treatment_error = "missing or invalid treatment_options"
+            return summary, None
+        self.fused_treatment_error = None
+        # Only complete replies are cached, so a hit never needs the separate treatment call
+        get_response_cache().store_json(
+            FUSED_CACHE_ROLE, self.model_name, prompt, FUSED_SCHEMA_VERSION,
+            {"team_summary": summary.model_dump(), "treatment_options": options},
         )
+        return summary, options
+
+    def _cached_fused(self, prompt):
+        cached = get_response_cache().lookup_json(FUSED_CACHE_ROLE, self.model_name, prompt, FUSED_SCHEMA_VERSION)
+        if cached is None:
+            return None
+        print(f"{self.role} (fused) served from response cache")
+        self.last_rate_limit_wait = 0.0
+        self.fused_treatment_error = None
+        self.last_structured_response = TeamSummary.model_validate(cached["team_summary"])
+        return self.last_structured_response, cached["treatment_options"]
+
+    def run_fused(self, stream=None, on_item=None):
+        """
+        Team summary and treatment options from one call: (TeamSummary or None, options or None).
+
+        `on_item` receives streamed `diagnoses` entries as in `run`. When the
+        options are None but the summary is not, `fused_treatment_error` says
+        why and `generate_treatment_plan_json` can be called for them.
+        """
+        print(f"{self.role} (fused) is running...")
+        prompt = self.build_fused_prompt()
+        if stream is None:
+            stream = streaming_enabled()
+        call = self.last_call = start_call("fused", self.role, self.model_name)
+        relay = _ItemRelay(on_item)
+        try:
+            cached = self._cached_fused(prompt)
+            if cached is not None:
+                call.finish("cached")
+                relay.replay(cached[0])
+                return cached
+            raw_text = self._generate(prompt, call, stream, relay)
+            summary, options = self._parse_with_repair(raw_text, call, lambda text: self._parse_fused(text, prompt))
+            call.finish()
+            relay.replay(summary)
+            return summary, options
+        except Exception as e:
+            call.fail(e)
+            print(f"Error occurred in {self.role} (fused):", e)
+            import traceback
+            traceback.print_exc()
+            return None, None
+
+    async def arun_fused(self, stream=None, on_item=None):
+        """Async counterpart of `run_fused`"""
+        print(f"{self.role} (fused) is running...")
+        prompt = self.build_fused_prompt()
+        if stream is None:
+            stream = streaming_enabled()
+        call = self.last_call = start_call("fused", self.role, self.model_name)
+        relay = _ItemRelay(on_item)
+        try:
+            cached = await asyncio.to_thread(self._cached_fused, prompt)
+            if cached is not None:
+                call.finish("cached")
+                relay.replay(cached[0])
+                return cached
+            raw_text = await self._agenerate(prompt, call, stream, relay)
+            summary, options = await self._aparse_with_repair(
+                raw_text, call, lambda text: self._parse_fused(text, prompt)
+            )
+            call.finish()
+            relay.replay(summary)
+            return summary, options
+        except Exception as e:
+            call.fail(e)
+            print(f"Error occurred in {self.role} (fused):", e)
+            import traceback
+            traceback.print_exc()
+            return None, None
 
     def generate_treatment_plan(self, diagnoses_summary):
+        call = None
         try:
             if isinstance(diagnoses_summary, TeamSummary):
                 diagnoses_payload = diagnoses_summary.model_dump_json(indent=2)
@@ -760,42 +1681,116 @@ CONSTRAINTS:
                 team_confidence=team_confidence,
                 structured_specialist_reports=self.extra_info.get("structured_reports_json", "")
             )
-            enforce_rate_limit()
-            response = self.model.invoke(prompt)
-            return response.content
+            call = start_call("treatment_text", self.role, self.model_name)
+            plan = self._generate(prompt, call)
+            call.finish()
+            return plan
         except Exception as e:
+            if call is not None:
+                call.fail(e)
             print("Error occurred while generating treatment plan:", e)
             import traceback
             traceback.print_exc()
             return None
 
-    def generate_treatment_plan_json(self, diagnoses_summary):
-        try:
-            if isinstance(diagnoses_summary, TeamSummary):
-                diagnoses_payload = diagnoses_summary.model_dump_json(indent=2)
-                team_confidence = json.dumps(diagnoses_summary.specialist_confidence, indent=2)
-            elif isinstance(diagnoses_summary, str):
-                diagnoses_payload = diagnoses_summary
-                team_confidence = "Unavailable"
-            else:
-                diagnoses_payload = json.dumps(diagnoses_summary, indent=2)
-                team_confidence = "Unavailable"
+    def _build_treatment_json_prompt(self, diagnoses_summary):
+        if isinstance(diagnoses_summary, TeamSummary):
+            diagnoses_payload = diagnoses_summary.model_dump_json(indent=2)
+            team_confidence = json.dumps(diagnoses_summary.specialist_confidence, indent=2)
+        elif isinstance(diagnoses_summary, str):
+            diagnoses_payload = diagnoses_summary
+            team_confidence = "Unavailable"
+        else:
+            diagnoses_payload = json.dumps(diagnoses_summary, indent=2)
+            team_confidence = "Unavailable"
+        bundle = self.extra_info.get("structured_reports_json", "")
+        if not self.compact:
             prompt = self.treatment_json_prompt_template.format(
                 diagnoses=diagnoses_payload,
                 team_confidence=team_confidence,
-                structured_specialist_reports=self.extra_info.get("structured_reports_json", ""),
+                structured_specialist_reports=bundle,
+            )
+            self._full_prompt_estimates["treatment"] = estimate_tokens(prompt)
+            return prompt
+
+        full_values = (diagnoses_payload, team_confidence, bundle)
+        if isinstance(diagnoses_summary, TeamSummary):
+            diagnoses_payload = compact_json(diagnoses_summary.model_dump())
+            team_confidence = compact_json(diagnoses_summary.specialist_confidence)
+        elif not isinstance(diagnoses_summary, str):
+            diagnoses_payload = compact_json(diagnoses_summary)
+        compact_values = (diagnoses_payload, team_confidence, self._compact_bundle())
+        prompt = self.treatment_json_prompt_template.format(
+            diagnoses=compact_values[0],
+            team_confidence=compact_values[1],
+            structured_specialist_reports=compact_values[2],
+        )
+        self._full_prompt_estimates["treatment"] = _swapped_prompt_tokens(prompt, zip(full_values, compact_values))
+        return prompt
+
+    def _cached_treatment_options(self, prompt):
+        options = get_response_cache().lookup_json(
+            TREATMENT_CACHE_ROLE, self.model_name, prompt, TREATMENT_SCHEMA_VERSION
+        )
+        if not _valid_treatment_options(options):
+            # Missing, or written before empty option lists were rejected
+            return None
+        print("Treatment plan served from response cache")
+        self.last_rate_limit_wait = 0.0
+        return options
+
+    def _parse_treatment_options(self, raw_text, prompt):
+        # Extract the JSON object and check it carries a non-empty list of options
+        data = self._parse_response(raw_text, schema=Dict[str, Any])
+        if not _valid_treatment_options(data.get("options")):
+            raise ResponseParseError(
+                "Treatment JSON does not contain a non-empty 'options' array.", "schema_validation",
+                ["options: Field required (a non-empty list of treatment option objects)"],
+            )
+        get_response_cache().store_json(
+            TREATMENT_CACHE_ROLE, self.model_name, prompt, TREATMENT_SCHEMA_VERSION, data["options"]
+        )
+        return data["options"]
+
+    def generate_treatment_plan_json(self, diagnoses_summary):
+        call = start_call("treatment", self.role, self.model_name)
+        try:
+            prompt = self._build_treatment_json_prompt(diagnoses_summary)
+            cached = self._cached_treatment_options(prompt)
+            if cached is not None:
+                call.finish("cached")
+                return cached
+            raw_text = self._generate(prompt, call)
+            options = self._parse_with_repair(
+                raw_text, call, lambda text: self._parse_treatment_options(text, prompt)
+            )
+            call.finish()
+            return options
+        except Exception as e:
+            call.fail(e)
+            print("Error occurred while generating structured treatment JSON:", e)
+            import traceback
+            traceback.print_exc()
+            return None
+
+    async def agenerate_treatment_plan_json(self, diagnoses_summary):
+        """Async counterpart of `generate_treatment_plan_json`"""
+        call = start_call("treatment", self.role, self.model_name)
+        try:
+            prompt = self._build_treatment_json_prompt(diagnoses_summary)
+            cached = await asyncio.to_thread(self._cached_treatment_options, prompt)
+            if cached is not None:
+                call.finish("cached")
+                return cached
+            raw_text = await self._agenerate(prompt, call)
+            options = await self._aparse_with_repair(
+                raw_text, call, lambda text: self._parse_treatment_options(text, prompt)
             )
-            enforce_rate_limit()
-            response = self.model.invoke(prompt)
-            raw_text = response.content if hasattr(response, "content") else str(response)
-            # Try to extract and validate JSON list of options
-            json_text = self._extract_json(raw_text)
-            data = json.loads(json_text)
-            if not isinstance(data, dict) or "options" not in data or not isinstance(data["options"], list):
-                raise ValueError("Treatment JSON does not contain 'options' array.")
-            return data["options"]
+            call.finish()
+            return options
         except Exception as e:
+            call.fail(e)
             print("Error occurred while generating structured treatment JSON:", e)
             import traceback
             traceback.print_exc()
-            return None
\ No newline at end of file
+            return None
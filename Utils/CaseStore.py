@@ -0,0 +1,512 @@
+"""
+Persistent storage for medical cases.
+
+`CaseStore` is the small repository interface the API server talks to.
+`SqliteCaseStore` implements it with indexed columns for `status`, `createdAt`
+and `patientId`, and keeps the (large) `agentResults` blob in a separate table
+so that listing cases or updating a status never reads or rewrites it. Nothing
+is loaded eagerly: startup cost and memory stay flat as the case count grows.
+
+`CaseWriter` moves saves and progress events off the caller's thread: a
+dedicated writer thread applies them in batches, and successive saves of the
+same case that arrive before it gets to them are coalesced into one write.
+"""
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Compact separators for stored JSON (cases are never read by hand from the database)
+_JSON_SEPARATORS = (",", ":")
+
+
+class CaseStore(ABC):
+    """Repository interface for case records (plain dicts, as returned by the API)"""
+
+    @abstractmethod
+    def get(self, case_id: str, include_results: bool = True) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def save(self, case: dict):
+        """Insert or replace a case; agentResults is only written when the dict has that key"""
+
+    def save_many(self, cases: Iterable[dict]):
+        """Save several cases in one transaction"""
+        for case in cases:
+            self.save(case)
+
+    @abstractmethod
+    def delete(self, case_id: str):
+        ...
+
+    @abstractmethod
+    def list(self, status: Optional[str] = None, include_results: bool = False) -> List[dict]:
+        """Cases (newest first), optionally filtered by status"""
+
+    @abstractmethod
+    def list_page(
+        self,
+        status: Optional[str] = None,
+        limit: int = 50,
+        after: Optional[Tuple[str, str]] = None,
+        include_results: bool = False,
+    ) -> Tuple[List[dict], Optional[Tuple[str, str]]]:
+        """
+        One page of cases (newest first) using keyset pagination.
+
+        `after` is the (createdAt, id) of the last case of the previous page.
+        Returns the page and the key to pass as `after` for the next one
+        (None when there are no more cases).
+        """
+
+    @abstractmethod
+    def version(self, status: Optional[str] = None) -> Tuple[int, str]:
+        """(count, latest updatedAt) - changes whenever the listing would"""
+
+    @abstractmethod
+    def count(self, status: Optional[str] = None) -> int:
+        ...
+
+    @abstractmethod
+    def import_json_dir(self, directory: str) -> int:
+        """One-time import of the legacy one-JSON-file-per-case layout"""
+
+    @abstractmethod
+    def append_event(self, case_id: str, event_type: str, data) -> int:
+        """Record a progress event for a case; returns its (monotonic) id"""
+
+    @abstractmethod
+    def events_since(self, case_id: str, after_id: int = 0) -> List[dict]:
+        """Events with id > after_id, oldest first"""
+
+    @abstractmethod
+    def last_event_id(self, case_id: str) -> int:
+        ...
+
+    @abstractmethod
+    def clear_events(self, case_id: str):
+        """Drop a case's events (called when a new run starts)"""
+
+    def apply_events(self, ops: Iterable[Tuple[str, tuple]]) -> List[Optional[int]]:
+        """
+        Apply ("append", (case_id, type, data)) and ("clear", (case_id,)) operations in order.
+
+        Returns, per operation, the appended event's id (None for a clear).
+        """
+        return [self.append_event(*args) if op == "append" else self.clear_events(*args) for op, args in ops]
+
+
+class SqliteCaseStore(CaseStore):
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # sqlite3 connections are not shareable across threads; keep one per thread
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS cases (
+                id TEXT PRIMARY KEY,
+                patient_id TEXT,
+                status TEXT NOT NULL,
+                status_key TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_cases_status ON cases (status_key, created_at DESC, id DESC);
+            CREATE INDEX IF NOT EXISTS idx_cases_created ON cases (created_at DESC, id DESC);
+            CREATE INDEX IF NOT EXISTS idx_cases_patient ON cases (patient_id);
+            CREATE INDEX IF NOT EXISTS idx_cases_updated ON cases (updated_at);
+            CREATE TABLE IF NOT EXISTS case_results (
+                case_id TEXT PRIMARY KEY REFERENCES cases (id) ON DELETE CASCADE,
+                agent_results TEXT
+            );
+            CREATE TABLE IF NOT EXISTS case_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                case_id TEXT NOT NULL,
+                type TEXT NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_case_events_case ON case_events (case_id, id);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            """
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row_to_case(row, include_results: bool) -> dict:
+        case = json.loads(row[0])
+        if include_results:
+            case["agentResults"] = json.loads(row[1]) if row[1] else None
+        return case
+
+    def _select(self, include_results: bool, with_key: bool = False) -> str:
+        columns = "c.created_at, c.id, c.data" if with_key else "c.data"
+        if include_results:
+            return f"SELECT {columns}, r.agent_results FROM cases c LEFT JOIN case_results r ON r.case_id = c.id"
+        return f"SELECT {columns} FROM cases c"
+
+    def get(self, case_id: str, include_results: bool = True) -> Optional[dict]:
+        row = self._conn().execute(self._select(include_results) + " WHERE c.id = ?", (case_id,)).fetchone()
+        return self._row_to_case(row, include_results) if row else None
+
+    def save(self, case: dict):
+        self._save_many([case])
+
+    def save_many(self, cases: Iterable[dict]):
+        self._save_many(cases)
+
+    def _save_many(self, cases: Iterable[dict]):
+        conn = self._conn()
+        with conn:
+            for case in cases:
+                record = {k: v for k, v in case.items() if k != "agentResults"}
+                # Upsert rather than REPLACE: a REPLACE deletes the row first and
+                # would cascade to case_results
+                conn.execute(
+                    "INSERT INTO cases (id, patient_id, status, status_key, created_at, updated_at, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET patient_id = excluded.patient_id, status = excluded.status, "
+                    "status_key = excluded.status_key, created_at = excluded.created_at, "
+                    "updated_at = excluded.updated_at, data = excluded.data",
+                    (
+                        case["id"],
+                        case.get("patientId"),
+                        case.get("status", ""),
+                        (case.get("status") or "").lower(),
+                        case.get("createdAt", ""),
+                        case.get("updatedAt", ""),
+                        json.dumps(record, separators=_JSON_SEPARATORS),
+                    ),
+                )
+                # Records loaded without their results leave the stored results untouched
+                if "agentResults" not in case:
+                    continue
+                results = case["agentResults"]
+                conn.execute(
+                    "INSERT OR REPLACE INTO case_results (case_id, agent_results) VALUES (?, ?)",
+                    (case["id"], json.dumps(results, separators=_JSON_SEPARATORS) if results is not None else None),
+                )
+
+    def delete(self, case_id: str):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM case_events WHERE case_id = ?", (case_id,))
+            conn.execute("DELETE FROM case_results WHERE case_id = ?", (case_id,))
+            conn.execute("DELETE FROM cases WHERE id = ?", (case_id,))
+
+    def list(self, status: Optional[str] = None, include_results: bool = False) -> List[dict]:
+        query = self._select(include_results)
+        params = ()
+        if status:
+            query += " WHERE c.status_key = ?"
+            params = (status.lower(),)
+        query += " ORDER BY c.created_at DESC, c.id DESC"
+        return [self._row_to_case(row, include_results) for row in self._conn().execute(query, params)]
+
+    def list_page(
+        self,
+        status: Optional[str] = None,
+        limit: int = 50,
+        after: Optional[Tuple[str, str]] = None,
+        include_results: bool = False,
+    ) -> Tuple[List[dict], Optional[Tuple[str, str]]]:
+        clauses, params = [], []
+        if status:
+            clauses.append("c.status_key = ?")
+            params.append(status.lower())
+        if after:
+            clauses.append("(c.created_at, c.id) < (?, ?)")
+            params.extend(after)
+        query = self._select(include_results, with_key=True)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        # Fetch one extra row to know whether another page exists
+        query += " ORDER BY c.created_at DESC, c.id DESC LIMIT ?"
+        params.append(limit + 1)
+        rows = self._conn().execute(query, params).fetchall()
+        next_key = (rows[limit - 1][0], rows[limit - 1][1]) if len(rows) > limit else None
+        return [self._row_to_case(row[2:], include_results) for row in rows[:limit]], next_key
+
+    def version(self, status: Optional[str] = None) -> Tuple[int, str]:
+        if status:
+            row = self._conn().execute(
+                "SELECT COUNT(*), MAX(updated_at) FROM cases WHERE status_key = ?", (status.lower(),)
+            ).fetchone()
+        else:
+            row = self._conn().execute("SELECT COUNT(*), MAX(updated_at) FROM cases").fetchone()
+        return row[0], row[1] or ""
+
+    def count(self, status: Optional[str] = None) -> int:
+        if status:
+            return self._conn().execute("SELECT COUNT(*) FROM cases WHERE status_key = ?", (status.lower(),)).fetchone()[0]
+        return self._conn().execute("SELECT COUNT(*) FROM cases").fetchone()[0]
+
+    def import_json_dir(self, directory: str) -> int:
+        conn = self._conn()
+        marker = conn.execute("SELECT value FROM meta WHERE key = 'json_import'").fetchone()
+        if marker or not os.path.isdir(directory):
+            return 0
+        cases = []
+        for filename in os.listdir(directory):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(directory, filename), "r", encoding="utf-8") as f:
+                    case = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Skipping unreadable case file {filename}: {e}")
+                continue
+            if not isinstance(case, dict):
+                print(f"Skipping case file {filename}: expected a JSON object, found {type(case).__name__}")
+                continue
+            case.setdefault("id", filename[:-5])
+            cases.append(case)
+        self._save_many(cases)
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_import', ?)", (str(len(cases)),))
+        return len(cases)
+
+
+    def append_event(self, case_id: str, event_type: str, data) -> int:
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO case_events (case_id, type, data) VALUES (?, ?, ?)",
+                (case_id, event_type, json.dumps(data, separators=_JSON_SEPARATORS)),
+            )
+        return cursor.lastrowid
+
+    def events_since(self, case_id: str, after_id: int = 0) -> List[dict]:
+        rows = self._conn().execute(
+            "SELECT id, type, data FROM case_events WHERE case_id = ? AND id > ? ORDER BY id",
+            (case_id, after_id),
+        ).fetchall()
+        return [{"id": row[0], "type": row[1], "data": json.loads(row[2])} for row in rows]
+
+    def last_event_id(self, case_id: str) -> int:
+        row = self._conn().execute("SELECT MAX(id) FROM case_events WHERE case_id = ?", (case_id,)).fetchone()
+        return row[0] or 0
+
+    def clear_events(self, case_id: str):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM case_events WHERE case_id = ?", (case_id,))
+
+    def apply_events(self, ops: Iterable[Tuple[str, tuple]]) -> List[Optional[int]]:
+        conn = self._conn()
+        ids: List[Optional[int]] = []
+        with conn:
+            for op, args in ops:
+                if op == "append":
+                    case_id, event_type, data = args
+                    cursor = conn.execute(
+                        "INSERT INTO case_events (case_id, type, data) VALUES (?, ?, ?)",
+                        (case_id, event_type, json.dumps(data, separators=_JSON_SEPARATORS)),
+                    )
+                    ids.append(cursor.lastrowid)
+                else:
+                    conn.execute("DELETE FROM case_events WHERE case_id = ?", (args[0],))
+                    ids.append(None)
+        return ids
+
+
+def snapshot_case(case: dict) -> dict:
+    """Deep copy of `case`, so no later in-place update of the original reaches a queued write"""
+    return copy.deepcopy(case)
+
+
+class CaseWriter:
+    """
+    Applies case saves and progress events to a CaseStore on a dedicated writer thread.
+
+    `save` snapshots the case and returns at once with a Future that completes
+    when the case is written. A case saved again while its previous save is
+    still pending replaces it, so bursts of progress updates become one write.
+    Event appends and clears are never coalesced; they are applied in the order
+    they were made, after the batch's saves, in one transaction. The writer
+    waits up to `coalesce_seconds` for more work before writing, unless a save
+    is `urgent` (its caller is waiting on the Future).
+    """
+
+    def __init__(self, store: CaseStore, coalesce_seconds: float = 0.05):
+        self.store = store
+        self.coalesce_seconds = coalesce_seconds
+        self._cond = threading.Condition()
+        self._pending: Dict[str, Tuple[dict, List[Future]]] = {}
+        # ("append", (case_id, type, data)) or ("clear", (case_id,)), with their Futures
+        self._events: List[Tuple[str, tuple, Future]] = []
+        self._flush_waiters: List[Future] = []
+        self._urgent = False
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self.saves = 0
+        self.coalesced = 0
+        self.events = 0
+        self.batches = 0
+        self.written = 0
+        self.errors = 0
+
+    def save(self, case: dict, urgent: bool = False) -> Future:
+        snapshot = snapshot_case(case)
+        future: Future = Future()
+        with self._cond:
+            self.saves += 1
+            if self._closed:
+                # Shut down: write on the caller's thread
+                self._write({snapshot["id"]: (snapshot, [future])}, [], [])
+                return future
+            futures = [future]
+            previous = self._pending.pop(snapshot["id"], None)
+            if previous is not None:
+                self.coalesced += 1
+                futures = previous[1] + futures
+                # A save without agentResults leaves them as they are; keep the pending ones
+                if "agentResults" not in snapshot and "agentResults" in previous[0]:
+                    snapshot["agentResults"] = previous[0]["agentResults"]
+            self._pending[snapshot["id"]] = (snapshot, futures)
+            self._urgent = self._urgent or urgent
+            self._start()
+            self._cond.notify()
+        return future
+
+    def append_event(self, case_id: str, event_type: str, data) -> Future:
+        """Queue a progress event; the Future's result is its id"""
+        return self._queue_event("append", (case_id, event_type, data))
+
+    def clear_events(self, case_id: str) -> Future:
+        """Queue dropping a case's events (ordered with the events queued before and after it)"""
+        return self._queue_event("clear", (case_id,))
+
+    def _queue_event(self, op: str, args: tuple) -> Future:
+        future: Future = Future()
+        with self._cond:
+            self.events += 1
+            if self._closed:
+                self._write({}, [(op, args, future)], [])
+                return future
+            self._events.append((op, args, future))
+            self._start()
+            self._cond.notify()
+        return future
+
+    def flush(self) -> Future:
+        """Future that completes once every save and event queued so far has been written"""
+        future: Future = Future()
+        with self._cond:
+            if self._closed or (not self._pending and not self._events and self._thread is None):
+                future.set_result(None)
+                return future
+            self._flush_waiters.append(future)
+            self._urgent = True
+            self._start()
+            self._cond.notify()
+        return future
+
+    def close(self, timeout: Optional[float] = 10):
+        """Write what is pending and stop the writer thread; later saves are written synchronously"""
+        with self._cond:
+            self._closed = True
+            self._urgent = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "pending_events": len(self._events),
+                "saves": self.saves,
+                "coalesced": self.coalesced,
+                "events": self.events,
+                "batches": self.batches,
+                "written": self.written,
+                "errors": self.errors,
+            }
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="case-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._events and not self._flush_waiters and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._pending and not self._events and not self._flush_waiters:
+                    return
+                # Give successive updates of the same cases a moment to arrive
+                deadline = time.monotonic() + self.coalesce_seconds
+                while not self._urgent and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending = self._pending, {}
+                events, self._events = self._events, []
+                waiters, self._flush_waiters = self._flush_waiters, []
+                self._urgent = False
+            self._write(batch, events, waiters)
+
+    def _write(
+        self,
+        batch: Dict[str, Tuple[dict, List[Future]]],
+        events: List[Tuple[str, tuple, Future]],
+        waiters: List[Future],
+    ):
+        error = None
+        event_ids: List[Optional[int]] = []
+        try:
+            if batch:
+                self.store.save_many([snapshot for snapshot, _ in batch.values()])
+            if events:
+                event_ids = self.store.apply_events([(op, args) for op, args, _ in events])
+        except Exception as e:
+            error = e
+            print(f"Error writing cases {', '.join(batch) or '-'} ({len(events)} events): {e}")
+        with self._cond:
+            self.batches += 1 if batch or events else 0
+            self.written += len(batch) if error is None else 0
+            self.errors += 1 if error is not None else 0
+        for _, futures in batch.values():
+            for future in futures:
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+        for i, (_, _, future) in enumerate(events):
+            if error is None:
+                future.set_result(event_ids[i])
+            else:
+                future.set_exception(error)
+        for future in waiters:
+            future.set_result(None)
+
+
+def create_case_store() -> CaseStore:
+    """Case store configured from the environment"""
+    return SqliteCaseStore(os.getenv("CASE_DB_PATH", os.path.join("cases_data", "cases.sqlite3")))
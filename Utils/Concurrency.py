@@ -0,0 +1,33 @@
+"""
+Per-provider bounds on concurrent LLM calls.
+
+Used by the orchestrator for agent calls and by the report parser for its
+model fallback, so both share one limit per provider on each event loop.
+"""
+import asyncio
+import os
+import weakref
+from typing import Dict
+
+# Default maximum number of in-flight LLM calls per provider (per event loop),
+# overridable with <PROVIDER>_MAX_CONCURRENCY
+_PROVIDER_LIMITS = {
+    "gemini": 32,
+    "ollama": 2,
+}
+_DEFAULT_PROVIDER_LIMIT = 16
+
+# asyncio primitives belong to a single event loop, so keep one set per loop
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = weakref.WeakKeyDictionary()
+
+
+def provider_semaphore(provider: str) -> asyncio.Semaphore:
+    """Semaphore bounding concurrent calls to `provider` on the running loop"""
+    loop = asyncio.get_running_loop()
+    per_loop = _semaphores.setdefault(loop, {})
+    semaphore = per_loop.get(provider)
+    if semaphore is None:
+        default = _PROVIDER_LIMITS.get(provider, int(os.getenv("LLM_MAX_CONCURRENCY", str(_DEFAULT_PROVIDER_LIMIT))))
+        semaphore = asyncio.Semaphore(int(os.getenv(f"{provider.upper()}_MAX_CONCURRENCY", str(default))))
+        per_loop[provider] = semaphore
+    return semaphore
@@ -0,0 +1,85 @@
+"""
+Per-call deadlines and hedged requests for agent model calls.
+
+Every async model request runs under its role's deadline (`<ROLE>_DEADLINE_SECONDS`,
+falling back to LLM_DEADLINE_SECONDS). A request that has not answered after the
+hedge delay gets a duplicate "hedge" request on a second API key; whichever
+answers first wins and the other is cancelled. The hedge delay is the p95 (by
+default) of the role's recent model latencies, so only the slowest calls are
+duplicated; until enough latencies have been observed a fixed delay is used.
+
+A missed deadline raises `DeadlineExceeded`, a TimeoutError, so the retry
+policy in `Utils.Retry` treats it as a transport error.
+"""
+import math
+import os
+from collections import deque
+from threading import Lock
+from typing import Deque, Dict, Optional, Tuple
+
+
+class DeadlineExceeded(TimeoutError):
+    """The model did not answer within the role's deadline"""
+
+    def __init__(self, role: str, deadline: float):
+        super().__init__(f"[{role}] No response within the {deadline:g}s deadline")
+        # Outcome recorded in telemetry
+        self.reason = "deadline_exceeded"
+
+
+def role_deadline(role: str) -> float:
+    """Seconds a single model request of `role` may take"""
+    value = os.getenv(f"{role.upper()}_DEADLINE_SECONDS") or os.getenv("LLM_DEADLINE_SECONDS") or "120"
+    return float(value)
+
+
+class HedgeSettings:
+    def __init__(self):
+        self.enabled = os.getenv("LLM_HEDGING", "1").lower() not in ("0", "false", "no")
+        self.quantile = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+        self.min_samples = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+        # Used until `min_samples` latencies have been observed
+        self.initial_delay = float(os.getenv("LLM_HEDGE_DELAY_SECONDS", "20"))
+        # Never hedge sooner than this, however fast the role usually is
+        self.min_delay = float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "2"))
+
+
+class LatencyTracker:
+    """Sliding window of recent model latencies per (role, model)"""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._lock = Lock()
+        self._samples: Dict[Tuple[str, str], Deque[float]] = {}
+
+    def record(self, role: str, model: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault((role, model), deque(maxlen=self.window)).append(seconds)
+
+    def quantile(self, role: str, model: str, q: float, min_samples: int = 1) -> Optional[float]:
+        """`q` quantile of the window, or None with fewer than `min_samples` latencies"""
+        with self._lock:
+            samples = sorted(self._samples.get((role, model), ()))
+        if not samples or len(samples) < min_samples:
+            return None
+        # Nearest-rank quantile
+        return samples[min(len(samples) - 1, max(0, math.ceil(q * len(samples)) - 1))]
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+
+# Process-wide latencies shared by every agent
+latency_tracker = LatencyTracker()
+
+
+def hedge_delay(role: str, model: str) -> Optional[float]:
+    """Seconds to wait before hedging a request of `role` (None when hedging is off)"""
+    settings = HedgeSettings()
+    if not settings.enabled:
+        return None
+    observed = latency_tracker.quantile(role, model, settings.quantile, settings.min_samples)
+    if observed is None:
+        return settings.initial_delay
+    return max(settings.min_delay, observed)
@@ -0,0 +1,312 @@
+"""
+Durable, SQLite-backed job queue for case processing.
+
+Jobs survive server restarts. A worker claims a job by taking a lease (the
+visibility timeout); if the worker dies, the lease expires and another worker
+picks the job up again. Each claim counts as an attempt, failed jobs are retried
+with backoff up to `max_attempts`, and `enqueue` refuses new work once the
+queue is full so the API can push back on clients instead of piling up work.
+
+Submission is single-flight per case: while a case has an active job, a new
+submission attaches to it (or, with `supersede=True`, asks the running job to
+cancel and queues a fresh one). Jobs also carry a hash of the report content;
+a job is not claimed while another job with the same case or report hash is
+running, so identical executions never overlap and the later one is answered
+from the LLM response cache.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+
+# Error recorded for a job whose last allowed attempt died without reporting back
+EXPIRED_FINAL_ATTEMPT = "Lease expired on final attempt"
+
+
+class QueueFullError(Exception):
+    """Raised by `enqueue` when the queue already holds `max_depth` active jobs"""
+
+    def __init__(self, depth: int):
+        super().__init__(f"Job queue is full ({depth} active jobs)")
+        self.depth = depth
+
+
+class JobQueue:
+    def __init__(self, path: str, max_depth: int = 1000, max_attempts: int = 3, visibility_timeout: float = 300):
+        self.path = path
+        self.max_depth = max_depth
+        self.max_attempts = max_attempts
+        self.visibility_timeout = visibility_timeout
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                case_id TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                available_at REAL NOT NULL,
+                lease_expires_at REAL,
+                worker TEXT,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs (status, priority DESC, id);
+            CREATE INDEX IF NOT EXISTS idx_jobs_case ON jobs (case_id, status);
+            """
+        )
+        # Columns added after the first release of the table
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if "report_hash" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN report_hash TEXT")
+        if "cancel_requested" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN cancel_requested INTEGER NOT NULL DEFAULT 0")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_report ON jobs (report_hash, status)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; write transactions are opened explicitly with BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _to_dict(row) -> Optional[dict]:
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        return job
+
+    def _write(self, fn):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def enqueue(
+        self,
+        case_id: str,
+        payload: Optional[dict] = None,
+        priority: int = 0,
+        report_hash: Optional[str] = None,
+        supersede: bool = False,
+    ) -> Tuple[dict, bool]:
+        """
+        Submit a job for `case_id`; returns (job, created).
+
+        If the case already has a queued job, or a running one and `supersede`
+        is False, that job is returned with created=False. With `supersede`,
+        the running job is flagged for cancellation and a new job is queued.
+        Raises QueueFullError when `max_depth` jobs are already active.
+        """
+        def insert(conn):
+            active = conn.execute(
+                "SELECT * FROM jobs WHERE case_id = ? AND status IN ('queued', 'running') ORDER BY id",
+                (case_id,),
+            ).fetchall()
+            queued = [job for job in active if job["status"] == "queued"]
+            running = [job for job in active if job["status"] == "running"]
+            if queued:
+                return queued[0], False
+            if running and not supersede:
+                return running[0], False
+
+            depth = conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+            if depth >= self.max_depth:
+                raise QueueFullError(depth)
+            now = time.time()
+            for job in running:
+                conn.execute("UPDATE jobs SET cancel_requested = 1, updated_at = ? WHERE id = ?", (now, job["id"]))
+            cursor = conn.execute(
+                "INSERT INTO jobs (case_id, payload, status, priority, max_attempts, available_at, report_hash, "
+                "created_at, updated_at) VALUES (?, ?, 'queued', ?, ?, ?, ?, ?, ?)",
+                (case_id, json.dumps(payload or {}), priority, self.max_attempts, now, report_hash, now, now),
+            )
+            return conn.execute("SELECT * FROM jobs WHERE id = ?", (cursor.lastrowid,)).fetchone(), True
+
+        job, created = self._write(insert)
+        return self._to_dict(job), created
+
+    def claim(self, worker: str) -> Optional[dict]:
+        """
+        Lease the next ready job (or one whose lease expired) to `worker`.
+
+        Jobs whose final attempt expired are left to `reap_expired`.
+        """
+        def take(conn):
+            now = time.time()
+            # Skip jobs whose case or report content is already being processed
+            row = conn.execute(
+                "SELECT j.id FROM jobs j "
+                "WHERE ((j.status = 'queued' AND j.available_at <= ?) "
+                "       OR (j.status = 'running' AND j.lease_expires_at < ? AND j.attempts < j.max_attempts)) "
+                "AND NOT EXISTS (SELECT 1 FROM jobs r WHERE r.status = 'running' AND r.id != j.id "
+                "                AND r.lease_expires_at >= ? "
+                "                AND (r.case_id = j.case_id OR r.report_hash = j.report_hash)) "
+                "ORDER BY j.priority DESC, j.id LIMIT 1",
+                (now, now, now),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, "
+                "lease_expires_at = ?, updated_at = ? WHERE id = ?",
+                (worker, now + self.visibility_timeout, now, row["id"]),
+            )
+            return conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+
+        return self._to_dict(self._write(take))
+
+    def reap_expired(self) -> List[dict]:
+        """
+        Fail running jobs whose final attempt's lease expired (the worker died without reporting back).
+
+        Returns the failed jobs, so the caller can mark their cases as failed too.
+        """
+        def update(conn):
+            now = time.time()
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'running' AND lease_expires_at < ? AND attempts >= max_attempts",
+                (now,),
+            ).fetchall()
+            for row in rows:
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', lease_expires_at = NULL, last_error = ?, updated_at = ? "
+                    "WHERE id = ?",
+                    (EXPIRED_FINAL_ATTEMPT, now, row["id"]),
+                )
+            return [dict(self._to_dict(row), status="failed", last_error=EXPIRED_FINAL_ATTEMPT) for row in rows]
+
+        return self._write(update)
+
+    def heartbeat(self, job_id: int, worker: str):
+        """Extend a running job's lease so it is not handed to another worker"""
+        now = time.time()
+        self._conn().execute(
+            "UPDATE jobs SET lease_expires_at = ?, updated_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (now + self.visibility_timeout, now, job_id, worker),
+        )
+
+    def cancel_requested(self, job_id: int) -> bool:
+        """Whether a newer submission superseded this job"""
+        row = self._conn().execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def mark_cancelled(self, job_id: int, worker: str) -> bool:
+        """Mark `worker`'s running job cancelled; False if the worker no longer holds it"""
+        return self._conn().execute(
+            "UPDATE jobs SET status = 'cancelled', lease_expires_at = NULL, updated_at = ? "
+            "WHERE id = ? AND worker = ? AND status = 'running'",
+            (time.time(), job_id, worker),
+        ).rowcount == 1
+
+    def complete(self, job_id: int, worker: str) -> bool:
+        """Mark `worker`'s running job done; False if its lease expired and another worker took it"""
+        return self._conn().execute(
+            "UPDATE jobs SET status = 'done', lease_expires_at = NULL, updated_at = ? "
+            "WHERE id = ? AND worker = ? AND status = 'running'",
+            (time.time(), job_id, worker),
+        ).rowcount == 1
+
+    def fail(self, job_id: int, worker: str, error: str, retry_delay: float = 0) -> bool:
+        """Record a failed attempt of `worker`'s job; returns True if the job will be retried"""
+        def update(conn):
+            job = conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND worker = ? AND status = 'running'",
+                (job_id, worker),
+            ).fetchone()
+            if job is None:
+                # Lease lost: the job's current holder records its outcome
+                return False
+            now = time.time()
+            retry = job["attempts"] < job["max_attempts"]
+            conn.execute(
+                "UPDATE jobs SET status = ?, available_at = ?, lease_expires_at = NULL, last_error = ?, updated_at = ? "
+                "WHERE id = ?",
+                ("queued" if retry else "failed", now + retry_delay, error, now, job_id),
+            )
+            return retry
+
+        return self._write(update)
+
+    def requeue_running(self, worker_is_alive: Callable[[str], bool]) -> List[str]:
+        """
+        Put running jobs whose worker is gone back in the queue (used at startup).
+
+        `worker_is_alive(worker)` decides whether a lease holder still exists;
+        jobs held by live workers elsewhere are left alone. Returns the case ids
+        of the requeued jobs.
+        """
+        def update(conn):
+            rows = conn.execute("SELECT id, case_id, worker FROM jobs WHERE status = 'running'").fetchall()
+            dead = [row for row in rows if not worker_is_alive(row["worker"] or "")]
+            now = time.time()
+            for row in dead:
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', available_at = ?, lease_expires_at = NULL, worker = NULL, "
+                    "updated_at = ? WHERE id = ?",
+                    (now, now, row["id"]),
+                )
+            return [row["case_id"] for row in dead]
+
+        return self._write(update)
+
+    def get(self, job_id: int) -> Optional[dict]:
+        return self._to_dict(self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def depth(self) -> int:
+        """Number of queued plus running jobs"""
+        return self._conn().execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+
+    def position(self, job_id: int) -> Optional[int]:
+        """How many queued jobs will be claimed before this one (0 = next); None if not queued"""
+        job = self._conn().execute("SELECT status, priority FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if job is None or job["status"] != "queued":
+            return None
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND (priority > ? OR (priority = ? AND id < ?))",
+            (job["priority"], job["priority"], job_id),
+        ).fetchone()[0]
+
+    def stats(self) -> dict:
+        rows = self._conn().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        counts = {row["status"]: row["n"] for row in rows}
+        return {
+            "queued": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "cancelled": counts.get("cancelled", 0),
+            "max_depth": self.max_depth,
+        }
+
+
+def create_job_queue() -> JobQueue:
+    """Job queue configured from the environment"""
+    return JobQueue(
+        os.getenv("JOB_QUEUE_PATH", os.path.join("cases_data", "jobs.sqlite3")),
+        max_depth=int(os.getenv("JOB_QUEUE_MAX_DEPTH", "1000")),
+        max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+        visibility_timeout=float(os.getenv("JOB_VISIBILITY_TIMEOUT_SECONDS", "300")),
+    )
@@ -0,0 +1,125 @@
+"""
+Process-wide registry of LLM chat clients.
+
+Constructing a `ChatGoogleGenerativeAI` sets up its own HTTP client and auth,
+so building one per agent per case puts connection setup on every call. The
+registry keeps one long-lived client per (provider, model, api_key,
+temperature) and hands the same instance to every agent and to the report
+parser. Clients are safe to share: they hold no per-conversation state.
+"""
+import time
+from threading import Lock
+from typing import Dict, Iterable, Optional, Tuple
+
+from langchain_ollama import ChatOllama
+
+from Utils.RateLimiter import key_fingerprint
+
+# Try to import Google Gemini (optional - only if package is installed)
+try:
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    GEMINI_AVAILABLE = True
+except ImportError:
+    GEMINI_AVAILABLE = False
+
+# Using gemini-2.5-flash (stable, free tier, fast)
+# Alternative free models: gemini-2.0-flash-lite,
+# "models/gemini-flash-latest" (latest flash), "models/gemini-pro-latest" (latest pro)
+GEMINI_MODEL = "models/gemini-2.5-flash"
+# Fallback when Gemini is not available
+OLLAMA_MODEL = "llama3.1"
+
+ClientKey = Tuple[str, str, Optional[str], float]
+
+
+def agent_model_spec(api_key: Optional[str]) -> Tuple[str, str, Optional[str]]:
+    """(provider, model, api_key) used by an agent given its Google API key"""
+    if GEMINI_AVAILABLE and api_key:
+        return "gemini", GEMINI_MODEL, api_key
+    return "ollama", OLLAMA_MODEL, None
+
+
+def _create_client(provider: str, model: str, api_key: Optional[str], temperature: float):
+    if provider == "gemini":
+        if not GEMINI_AVAILABLE:
+            raise RuntimeError("langchain_google_genai is not installed")
+        return ChatGoogleGenerativeAI(temperature=temperature, model=model, google_api_key=api_key)
+    if provider == "ollama":
+        return ChatOllama(temperature=temperature, model=model)
+    raise ValueError(f"Unknown LLM provider: {provider}")
+
+
+class ClientRegistry:
+    """One shared chat client per (provider, model, api_key, temperature)"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._clients: Dict[ClientKey, object] = {}
+        self._uses: Dict[ClientKey, int] = {}
+        self.created = 0
+        self.reused = 0
+        self.creation_seconds = 0.0
+
+    def get(self, provider: str, model: str, api_key: Optional[str] = None, temperature: float = 0):
+        key = (provider, model, api_key, float(temperature))
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self.reused += 1
+                self._uses[key] += 1
+                return client
+            # Built under the lock so concurrent first uses share one client
+            started = time.perf_counter()
+            client = _create_client(provider, model, api_key, temperature)
+            self.creation_seconds += time.perf_counter() - started
+            self.created += 1
+            self._clients[key] = client
+            self._uses[key] = 1
+            return client
+
+    def warm_up(self, specs: Iterable[Tuple[str, str, Optional[str], float]]) -> int:
+        """Create the clients for `specs` ahead of the first request; returns how many were new"""
+        before = self.created
+        for provider, model, api_key, temperature in specs:
+            try:
+                self.get(provider, model, api_key, temperature)
+            except Exception as e:
+                print(f"Could not warm up {provider}/{model} client: {e}")
+        return self.created - before
+
+    def stats(self) -> dict:
+        with self._lock:
+            clients = [
+                {
+                    "provider": provider,
+                    "model": model,
+                    "key": key_fingerprint(api_key),
+                    "temperature": temperature,
+                    "uses": self._uses[(provider, model, api_key, temperature)],
+                }
+                for provider, model, api_key, temperature in self._clients
+            ]
+            lookups = self.created + self.reused
+            return {
+                "clients": len(clients),
+                "created": self.created,
+                "reused": self.reused,
+                "reuse_rate": round(self.reused / lookups, 3) if lookups else 0.0,
+                "creation_seconds": round(self.creation_seconds, 3),
+                "pool": clients,
+            }
+
+
+# Process-wide registry shared by every agent
+llm_clients = ClientRegistry()
+
+
+def get_chat_model(provider: str, model: str, api_key: Optional[str] = None, temperature: float = 0):
+    """Shared chat client for this provider/model/key/temperature"""
+    return llm_clients.get(provider, model, api_key, temperature)
+
+
+def warm_up_agent_clients(api_keys: Iterable[Optional[str]]) -> int:
+    """Create the agent clients for the given API keys (e.g. `load_agent_api_keys().values()`)"""
+    specs = {agent_model_spec(api_key) + (0.0,) for api_key in api_keys}
+    return llm_clients.warm_up(specs)
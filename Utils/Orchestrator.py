@@ -0,0 +1,264 @@
+"""
+Asyncio orchestration of a full diagnostic case.
+
+The five specialists are fanned out concurrently on the event loop, followed by
+the MultidisciplinaryTeam synthesis and the structured treatment plan. No
+threads are used: every LLM call goes through `Agent.arun`, and concurrency is
+bounded per provider so one process can keep many cases in flight without
+flooding Gemini (or a local Ollama server). Each agent may hedge slow calls on
+another of the configured API keys (see `Utils.Hedging`).
+
+In "panel" specialist mode the five specialist reports come from a single
+SpecialistPanel call; only the roles whose entries fail validation are then
+run as individual agents. With routing on, specialists the local router scores
+as irrelevant to the report are not called at all (see `Utils.SpecialistRouter`),
+and the panel prompt only asks for the consulted ones.
+
+In "fused" team mode the team summary and the treatment options come from one
+call instead of two sequential ones. The summary and the options are validated
+separately; if only the options are unusable, they are requested on their own,
+and if the fused call fails the separate calls are made.
+"""
+import asyncio
+import json
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+from Utils.Agents import (
+    Internist,
+    Neurologist,
+    Cardiologist,
+    Gastroenterologist,
+    Psychiatrist,
+    MultidisciplinaryTeam,
+    SpecialistPanel,
+)
+from Utils.Concurrency import provider_semaphore
+from Utils.SpecialistRouter import route_specialists, routing_enabled
+from Utils.Telemetry import collect_calls
+
+SPECIALISTS = {
+    "Internist": Internist,
+    "Neurologist": Neurologist,
+    "Cardiologist": Cardiologist,
+    "Gastroenterologist": Gastroenterologist,
+    "Psychiatrist": Psychiatrist,
+}
+
+# "individual": one call per specialist; "panel": one SpecialistPanel call plus fallbacks
+SPECIALIST_MODES = ("individual", "panel")
+# "separate": team summary, then treatment options; "fused": both from one call
+TEAM_MODES = ("separate", "fused")
+
+
+def load_agent_api_keys() -> Dict[str, Optional[str]]:
+    """Per-agent API keys, falling back to GOOGLE_API_KEY"""
+    keys = {name: os.getenv(f"{name.upper()}_API_KEY") or os.getenv("GOOGLE_API_KEY") for name in SPECIALISTS}
+    keys["MultidisciplinaryTeam"] = os.getenv("MULTIDISCIPLINARYTEAM_API_KEY") or os.getenv("GOOGLE_API_KEY")
+    keys["SpecialistPanel"] = os.getenv("SPECIALISTPANEL_API_KEY") or os.getenv("GOOGLE_API_KEY")
+    return keys
+
+
+def hedge_key_pool(api_keys: Dict[str, Optional[str]]) -> List[str]:
+    """Distinct API keys agents can hedge on: the per-agent keys plus GOOGLE_API_KEY"""
+    keys = list(api_keys.values()) + [os.getenv("GOOGLE_API_KEY")]
+    return [key for key in dict.fromkeys(keys) if key]
+
+
+async def _bounded(agent, coroutine_factory):
+    async with provider_semaphore(agent.provider):
+        return await coroutine_factory()
+
+
+def build_team_agent(medical_report: str, specialist_reports: Dict[str, Optional[dict]], api_key: Optional[str] = None) -> MultidisciplinaryTeam:
+    """Create the MultidisciplinaryTeam agent from specialist report dicts"""
+    return MultidisciplinaryTeam(
+        medical_report=medical_report,
+        internist_report=json.dumps(specialist_reports.get("Internist", {}), indent=2),
+        neurologist_report=json.dumps(specialist_reports.get("Neurologist", {}), indent=2),
+        cardiologist_report=json.dumps(specialist_reports.get("Cardiologist", {}), indent=2),
+        gastroenterologist_report=json.dumps(specialist_reports.get("Gastroenterologist", {}), indent=2),
+        psychiatrist_report=json.dumps(specialist_reports.get("Psychiatrist", {}), indent=2),
+        structured_reports_json=json.dumps(specialist_reports, indent=2),
+        api_key=api_key,
+    )
+
+
+async def run_specialists(
+    medical_report: str,
+    api_keys: Dict[str, Optional[str]],
+    specialist_mode: str = "individual",
+    on_result: Optional[Callable[[str, str, object], None]] = None,
+    routing: Optional[bool] = None,
+) -> Tuple[Dict[str, Optional[dict]], Dict[str, float], Optional[dict]]:
+    """
+    Specialist stage of the pipeline.
+
+    Returns (name -> report dict or None, name -> rate-limit wait, routing
+    decision or None). `on_result("specialist", name, report)` fires for each
+    report as it arrives, and `on_result("partial", ...)` for streamed entries.
+    With `routing` (default: SPECIALIST_ROUTING), skipped specialists get a
+    "not_consulted" entry instead of a report.
+    """
+    if specialist_mode not in SPECIALIST_MODES:
+        raise ValueError(f"Unknown specialist mode {specialist_mode!r} (expected one of {', '.join(SPECIALIST_MODES)})")
+    hedge_keys = hedge_key_pool(api_keys)
+    responses: Dict[str, Optional[dict]] = {}
+    rate_limit_waits: Dict[str, float] = {}
+
+    def deliver(name, report):
+        if report is None:
+            print(f"[Pipeline] WARNING: Storing None for {name} - check logs above for errors")
+        responses[name] = report.model_dump() if report else None
+        if on_result:
+            on_result("specialist", name, responses[name])
+
+    consulted = list(SPECIALISTS)
+    decision = None
+    if routing if routing is not None else routing_enabled():
+        decision = route_specialists(medical_report, consulted)
+        consulted = decision.consulted
+        print(f"[Pipeline] Routing: consulting {', '.join(consulted)}; not consulting {', '.join(decision.skipped) or 'none'}")
+        for name in decision.skipped:
+            responses[name] = decision.not_consulted_entry(name)
+            if on_result:
+                on_result("specialist", name, responses[name])
+
+    remaining = consulted
+    # The panel is asked for the consulted roles only; a single role is just its own call
+    if specialist_mode == "panel" and len(consulted) > 1:
+        panel = SpecialistPanel(medical_report, api_key=api_keys.get("SpecialistPanel"), roles=consulted)
+        panel.enable_hedging(hedge_keys)
+        reports = await _bounded(panel, panel.arun)
+        rate_limit_waits[panel.role] = round(panel.last_rate_limit_wait, 3)
+        for name, report in reports.items():
+            deliver(name, report)
+        remaining = [name for name in consulted if name not in reports]
+        for name in remaining:
+            print(f"[Pipeline] {name} falls back to an individual call: {panel.failed_roles.get(name)}")
+
+    agents = {name: SPECIALISTS[name](medical_report, api_key=api_keys.get(name)) for name in remaining}
+    for agent in agents.values():
+        agent.enable_hedging(hedge_keys)
+
+    def partial(agent_name):
+        if on_result is None:
+            return None
+        return lambda field, item: on_result("partial", agent_name, {"field": field, "item": item})
+
+    async def run_specialist(name, agent):
+        try:
+            return name, await _bounded(agent, lambda: agent.arun(on_item=partial(name)))
+        except Exception as e:
+            print(f"[Pipeline] ERROR: {name} failed with exception: {e}")
+            return name, None
+
+    tasks = [asyncio.create_task(run_specialist(name, agent)) for name, agent in agents.items()]
+    for finished in asyncio.as_completed(tasks):
+        deliver(*await finished)
+
+    # Seconds each agent spent queued behind its rate limit
+    rate_limit_waits.update({name: round(agent.last_rate_limit_wait, 3) for name, agent in agents.items()})
+    # Reports in SPECIALISTS order, however they arrived
+    return {name: responses.get(name) for name in SPECIALISTS}, rate_limit_waits, decision.as_dict() if decision else None
+
+
+async def run_team(
+    medical_report: str,
+    responses: Dict[str, Optional[dict]],
+    api_keys: Dict[str, Optional[str]],
+    team_mode: str = "separate",
+    on_result: Optional[Callable[[str, str, object], None]] = None,
+) -> Tuple[MultidisciplinaryTeam, Optional[dict], Optional[list]]:
+    """
+    Team stage of the pipeline: (team agent, summary dict or None, treatment options or None).
+
+    `on_result` receives streamed `diagnoses` entries ("partial"), then the
+    "teamSummary" and, if there is a summary, the "treatmentOptions".
+    """
+    if team_mode not in TEAM_MODES:
+        raise ValueError(f"Unknown team mode {team_mode!r} (expected one of {', '.join(TEAM_MODES)})")
+    team_agent = build_team_agent(medical_report, responses, api_key=api_keys.get("MultidisciplinaryTeam"))
+    team_agent.enable_hedging(hedge_key_pool(api_keys))
+    on_team_item = None
+    if on_result:
+        on_team_item = lambda field, item: on_result("partial", team_agent.role, {"field": field, "item": item})
+    team_summary = treatment_options = None
+    if team_mode == "fused":
+        team_summary, treatment_options = await _bounded(
+            team_agent, lambda: team_agent.arun_fused(on_item=on_team_item)
+        )
+        if team_summary is None:
+            print("[Pipeline] Fused team call failed; falling back to separate team and treatment calls")
+    if team_summary is None:
+        team_summary = await _bounded(team_agent, lambda: team_agent.arun(on_item=on_team_item))
+    team_summary_dict = team_summary.model_dump() if team_summary else None
+    if on_result:
+        on_result("teamSummary", team_agent.role, team_summary_dict)
+
+    if team_summary:
+        if treatment_options is None:
+            if team_agent.fused_treatment_error:
+                print(f"[Pipeline] Treatment options fall back to a separate call: {team_agent.fused_treatment_error}")
+            treatment_options = await _bounded(
+                team_agent, lambda: team_agent.agenerate_treatment_plan_json(team_summary)
+            )
+        if on_result:
+            on_result("treatmentOptions", team_agent.role, treatment_options)
+
+    return team_agent, team_summary_dict, treatment_options
+
+
+async def run_case_pipeline(
+    medical_report: str,
+    api_keys: Optional[Dict[str, Optional[str]]] = None,
+    on_result: Optional[Callable[[str, str, object], None]] = None,
+    specialist_mode: str = "individual",
+    routing: Optional[bool] = None,
+    team_mode: str = "separate",
+) -> dict:
+    """
+    Run specialists -> team synthesis -> treatment plan for one medical report.
+
+    Returns a dict with `specialists` (name -> report dict or None),
+    `teamSummary`, `treatmentOptions`, `rateLimitWaitSeconds`, `promptTokens`
+    and `telemetry` (one record per LLM call), the same shape stored under a
+    case's `agentResults`. `on_result(stage, agent, payload)`
+    is called as soon as each piece is available: stage "specialist" for every
+    specialist report, then "teamSummary" and "treatmentOptions". While
+    responses stream, stage "partial" delivers each finished `key_findings` or
+    `diagnoses` entry early as {"field": ..., "item": ...}. `specialist_mode`
+    is one of SPECIALIST_MODES; `routing` turns the specialist router on or off
+    (default: SPECIALIST_ROUTING), and its decision is returned as `routing`.
+    `team_mode` is one of TEAM_MODES.
+    """
+    with collect_calls() as calls:
+        results = await _run_case_pipeline(medical_report, api_keys, on_result, specialist_mode, routing, team_mode)
+    results["telemetry"] = calls
+    return results
+
+
+async def _run_case_pipeline(medical_report, api_keys, on_result, specialist_mode, routing, team_mode) -> dict:
+    if api_keys is None:
+        api_keys = load_agent_api_keys()
+
+    responses, rate_limit_waits, routing_decision = await run_specialists(
+        medical_report, api_keys, specialist_mode, on_result, routing
+    )
+
+    team_agent, team_summary_dict, treatment_options = await run_team(
+        medical_report, responses, api_keys, team_mode, on_result
+    )
+    rate_limit_waits["MultidisciplinaryTeam"] = round(team_agent.last_rate_limit_wait, 3)
+
+    return {
+        "specialists": responses,
+        "teamSummary": team_summary_dict,
+        "treatmentOptions": treatment_options,
+        "rateLimitWaitSeconds": rate_limit_waits,
+        "specialistMode": specialist_mode,
+        "routing": routing_decision,
+        "teamMode": team_mode,
+        # Input tokens of the team prompts sent, and estimates for the full encoding
+        "promptTokens": team_agent.prompt_tokens,
+    }
@@ -0,0 +1,259 @@
+"""
+PDF text extraction off the event loop.
+
+pdfplumber's `extract_text` is pure Python and CPU-bound (tens of milliseconds
+or more per page), so calling it from an async handler stalls every other
+request on that server process. Extraction runs in a bounded pool of worker
+processes instead. Documents longer than one page range are split into ranges
+that are extracted in parallel, and the text is joined back in page order.
+
+Uploads are copied to a temporary file in fixed-size chunks rather than read
+into memory, and rejected above PDF_MAX_BYTES or PDF_MAX_PAGES. Per-page
+extraction times are recorded and rendered on /metrics.
+"""
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+from typing import BinaryIO, Dict, List, Optional, Sequence, Tuple
+
+import pdfplumber
+
+METRIC_PREFIX = "medaura_pdf"
+# Histogram bucket upper bounds in seconds (+Inf is implicit)
+PAGE_SECONDS_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+DOCUMENT_SECONDS_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Bytes copied per read while spooling an upload
+SPOOL_CHUNK_BYTES = 1024 * 1024
+
+
+class PDFError(ValueError):
+    """A PDF that cannot be extracted; `status_code` is the HTTP status to answer with"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class PDFSettings:
+    def __init__(self):
+        self.max_bytes = int(os.getenv("PDF_MAX_BYTES", str(10 * 1024 * 1024)))
+        self.max_pages = int(os.getenv("PDF_MAX_PAGES", "500"))
+        self.workers = max(1, int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1)))))
+        # Pages per pool task; shorter documents are extracted by a single worker
+        self.pages_per_task = max(1, int(os.getenv("PDF_PAGES_PER_TASK", "16")))
+        # Directory for spooled uploads (default: the system temp directory)
+        self.spool_dir = os.getenv("PDF_SPOOL_DIR") or None
+
+
+def spool_upload(source: BinaryIO, settings: PDFSettings, digest=None) -> str:
+    """
+    Copy an uploaded file object to a temporary .pdf file, chunk by chunk.
+
+    Returns the path; the caller removes the file. Each chunk is also fed to
+    `digest` (a hashlib object), if given. Raises PDFError (413) once more
+    than `settings.max_bytes` have been read, or (400) for an empty file.
+    """
+    fd, path = tempfile.mkstemp(suffix=".pdf", dir=settings.spool_dir)
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as spooled:
+            while True:
+                chunk = source.read(SPOOL_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > settings.max_bytes:
+                    raise PDFError(f"PDF is larger than the {settings.max_bytes / (1024 * 1024):g}MB limit", 413)
+                spooled.write(chunk)
+                if digest is not None:
+                    digest.update(chunk)
+        if size == 0:
+            raise PDFError("PDF file is empty")
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def page_ranges(pages: int, pages_per_task: int) -> List[Tuple[int, int]]:
+    """[start, end) page ranges of at most `pages_per_task` pages covering the document"""
+    return [(start, min(start + pages_per_task, pages)) for start in range(0, pages, pages_per_task)]
+
+
+# Run in the pool's worker processes
+
+def _page_count(path: str) -> int:
+    with pdfplumber.open(path) as pdf:
+        return len(pdf.pages)
+
+
+def _extract_pages(path: str, start: int, end: int) -> List[Tuple[str, float]]:
+    """(text, seconds) for pages [start, end)"""
+    results = []
+    with pdfplumber.open(path) as pdf:
+        for page in pdf.pages[start:end]:
+            started = time.perf_counter()
+            text = page.extract_text() or ""
+            results.append((text, time.perf_counter() - started))
+            # Drop the page's parsed layout objects before the next page
+            page.close()
+    return results
+
+
+class _Histogram:
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = next((i for i, bound in enumerate(self.bounds) if value <= bound), len(self.bounds))
+        self.buckets[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, metric: str) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, n in zip(list(self.bounds) + ["+Inf"], self.buckets):
+            cumulative += n
+            le = bound if bound == "+Inf" else repr(float(bound))
+            lines.append(f'{metric}_bucket{{le="{le}"}} {cumulative}')
+        lines.append(f"{metric}_sum {self.sum!r}")
+        lines.append(f"{metric}_count {self.count}")
+        return lines
+
+
+class PDFMetrics:
+    """Documents by outcome, pages extracted, and per-page / per-document extraction time"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.documents: Dict[str, int] = {}
+        self.pages = 0
+        self.page_seconds = _Histogram(PAGE_SECONDS_BUCKETS)
+        self.document_seconds = _Histogram(DOCUMENT_SECONDS_BUCKETS)
+        self.slowest_page_seconds = 0.0
+
+    def record(self, outcome: str, page_seconds: Sequence[float] = (), seconds: Optional[float] = None):
+        with self._lock:
+            self.documents[outcome] = self.documents.get(outcome, 0) + 1
+            self.pages += len(page_seconds)
+            for value in page_seconds:
+                self.page_seconds.observe(value)
+                self.slowest_page_seconds = max(self.slowest_page_seconds, value)
+            if seconds is not None:
+                self.document_seconds.observe(seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "documents": dict(self.documents),
+                "pages": self.pages,
+                "mean_page_seconds": round(self.page_seconds.sum / self.page_seconds.count, 4) if self.page_seconds.count else None,
+                "slowest_page_seconds": round(self.slowest_page_seconds, 4),
+                "mean_document_seconds": (
+                    round(self.document_seconds.sum / self.document_seconds.count, 3) if self.document_seconds.count else None
+                ),
+            }
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format, appended to the LLM metrics on /metrics"""
+        with self._lock:
+            lines = [
+                f"# HELP {METRIC_PREFIX}_documents_total PDF uploads by extraction outcome",
+                f"# TYPE {METRIC_PREFIX}_documents_total counter",
+            ]
+            for outcome, n in sorted(self.documents.items()):
+                lines.append(f'{METRIC_PREFIX}_documents_total{{outcome="{outcome}"}} {n}')
+            lines += [
+                f"# HELP {METRIC_PREFIX}_pages_total PDF pages extracted",
+                f"# TYPE {METRIC_PREFIX}_pages_total counter",
+                f"{METRIC_PREFIX}_pages_total {self.pages}",
+                f"# HELP {METRIC_PREFIX}_page_seconds Text extraction time per page",
+                f"# TYPE {METRIC_PREFIX}_page_seconds histogram",
+            ]
+            lines += self.page_seconds.render(f"{METRIC_PREFIX}_page_seconds")
+            lines += [
+                f"# HELP {METRIC_PREFIX}_document_seconds Extraction wall time per document",
+                f"# TYPE {METRIC_PREFIX}_document_seconds histogram",
+            ]
+            lines += self.document_seconds.render(f"{METRIC_PREFIX}_document_seconds")
+        return "\n".join(lines) + "\n"
+
+
+class PDFExtractor:
+    """Extracts PDF text in a process pool of `settings.workers` processes, started on first use"""
+
+    def __init__(self, settings: Optional[PDFSettings] = None):
+        self._settings = settings
+        self.metrics = PDFMetrics()
+        self._lock = Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def settings(self) -> PDFSettings:
+        # Read on first use, after .env has been loaded
+        if self._settings is None:
+            self._settings = PDFSettings()
+        return self._settings
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # Spawned, not forked: the server process runs threads
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.settings.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def _discard_pool(self, pool: ProcessPoolExecutor):
+        # A worker died (e.g. a malformed PDF crashed the parser); start a fresh pool next time
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    async def extract(self, path: str) -> str:
+        """Text of every page of the PDF at `path`, pages separated by a blank line"""
+        loop = asyncio.get_running_loop()
+        pool = self._executor()
+        started = time.perf_counter()
+        try:
+            pages = await loop.run_in_executor(pool, _page_count, path)
+            if pages > self.settings.max_pages:
+                self.metrics.record("too_many_pages")
+                raise PDFError(f"PDF has {pages} pages; the limit is {self.settings.max_pages}", 413)
+            ranges = page_ranges(pages, self.settings.pages_per_task)
+            chunks = await asyncio.gather(
+                *(loop.run_in_executor(pool, _extract_pages, path, start, end) for start, end in ranges)
+            )
+        except PDFError:
+            raise
+        except BrokenProcessPool as e:
+            self._discard_pool(pool)
+            self.metrics.record("error")
+            raise PDFError(f"Error reading PDF: extraction worker crashed ({e})") from e
+        except Exception as e:
+            self.metrics.record("error")
+            raise PDFError(f"Error reading PDF: {e}") from e
+
+        page_results = [result for chunk in chunks for result in chunk]
+        self.metrics.record("ok", [seconds for _, seconds in page_results], time.perf_counter() - started)
+        return "\n\n".join(text for text, _ in page_results if text)
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Process-wide extractor used by the API server
+pdf_extractor = PDFExtractor()
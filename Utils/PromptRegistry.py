@@ -0,0 +1,73 @@
+"""
+Registry of compiled prompt templates.
+
+A langchain `PromptTemplate` with `template_format="jinja2"` keeps only the
+template source and recompiles it with a fresh Jinja2 environment on every
+`format()` call. Agents used to build such a template in every constructor.
+The registry compiles each template once per process, keyed by name and
+version, and hands the same read-only `CompiledPrompt` to every agent.
+Rendering produces exactly the same text as `PromptTemplate.format`.
+"""
+from threading import Lock
+from typing import Callable, Dict, Sequence, Tuple
+
+from jinja2.sandbox import SandboxedEnvironment
+
+# Same sandboxed environment langchain uses for jinja2 prompt templates
+_environment = SandboxedEnvironment()
+
+
+class CompiledPrompt:
+    """Immutable, shareable prompt: source text plus its compiled Jinja2 template"""
+
+    __slots__ = ("name", "version", "template", "input_variables", "_compiled")
+
+    def __init__(self, name: str, version: str, template: str, input_variables: Sequence[str]):
+        object.__setattr__(self, "name", name)
+        object.__setattr__(self, "version", version)
+        object.__setattr__(self, "template", template)
+        object.__setattr__(self, "input_variables", tuple(input_variables))
+        object.__setattr__(self, "_compiled", _environment.from_string(template))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CompiledPrompt is read-only")
+
+    def format(self, **kwargs) -> str:
+        return self._compiled.render(**kwargs)
+
+
+class PromptRegistry:
+    """Compiles each (name, version) template on first use and shares it afterwards"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._prompts: Dict[Tuple[str, str], CompiledPrompt] = {}
+
+    def get(self, name: str, version: str, source: Callable[[], Tuple[str, Sequence[str]]]) -> CompiledPrompt:
+        """
+        Compiled prompt for (name, version).
+
+        `source()` returns (jinja2 template text, input variables); it is only
+        called the first time the key is requested.
+        """
+        key = (name, version)
+        prompt = self._prompts.get(key)
+        if prompt is None:
+            with self._lock:
+                prompt = self._prompts.get(key)
+                if prompt is None:
+                    template, input_variables = source()
+                    prompt = CompiledPrompt(name, version, template, input_variables)
+                    self._prompts[key] = prompt
+        return prompt
+
+    def clear(self):
+        with self._lock:
+            self._prompts.clear()
+
+    def __len__(self):
+        return len(self._prompts)
+
+
+# Process-wide registry shared by every agent
+prompt_registry = PromptRegistry()
@@ -0,0 +1,257 @@
+"""
+Per-key token-bucket rate limiting for LLM calls.
+
+Every (api_key, model) pair gets its own pair of buckets: one for requests per
+minute and one for tokens per minute. Callers reserve capacity while holding a
+short lock and then sleep *outside* of it, so calls that use different API keys
+(e.g. INTERNIST_API_KEY vs NEUROLOGIST_API_KEY) never wait on each other.
+
+By default the buckets live in memory and only pace the calls of one process.
+When LLM_RATE_LIMIT_PATH names a SQLite file, the bucket balances are kept there
+instead and every process using the same file (the API server and its job
+workers) draws from one budget per key, so adding workers does not multiply the
+requests sent to the provider.
+"""
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+
+def _env_float(name: str, default: Optional[float]) -> Optional[float]:
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    return float(value)
+
+
+def _default_rpm() -> float:
+    # LLM_CALL_INTERVAL_SECONDS used to be the global spacing between calls.
+    # It is still honoured, but now applies per key instead of process-wide.
+    rpm = _env_float("LLM_RPM", None)
+    if rpm is not None:
+        return rpm
+    interval = _env_float("LLM_CALL_INTERVAL_SECONDS", 7.0)
+    return 60.0 / interval if interval > 0 else 0.0
+
+
+def estimate_tokens(text) -> int:
+    """Rough token estimate (~4 characters per token) used for TPM budgeting"""
+    if not text:
+        return 0
+    return max(1, len(str(text)) // 4)
+
+
+def key_fingerprint(api_key: Optional[str]) -> str:
+    """Short, non-reversible label for an API key (safe to log or export)"""
+    if not api_key:
+        return "default"
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:8]
+
+
+class TokenBucket:
+    """
+    Classic token bucket with reservations.
+
+    `reserve()` never sleeps: it deducts the requested amount (allowing the
+    balance to go negative) and returns how long the caller has to wait before
+    the reservation becomes valid. A rate of 0 disables the bucket.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: Optional[float] = None):
+        self.rate = max(rate_per_minute, 0.0) / 60.0
+        self.capacity = float(burst) if burst else max(rate_per_minute / 60.0, 1.0)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        if self.rate <= 0 or amount <= 0:
+            return 0.0
+        self._refill(now)
+        # Never ask for more than the bucket can ever hold, otherwise a single
+        # large prompt would block forever.
+        amount = min(amount, self.capacity)
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+
+class SqliteBuckets:
+    """Bucket balances shared between processes through a SQLite file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; each reservation is one BEGIN IMMEDIATE transaction
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def reserve(self, reservations: List[Tuple[str, TokenBucket, float]], now: Optional[float] = None) -> float:
+        """Apply (key, bucket, amount) reservations to the stored balances; return the longest wait"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if now is None:
+                # Wall-clock time, since monotonic clocks are not comparable across processes
+                now = time.time()
+            wait = 0.0
+            for key, bucket, amount in reservations:
+                row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+                bucket.tokens, bucket.updated_at = row if row else (bucket.capacity, now)
+                wait = max(wait, bucket.reserve(amount, now))
+                conn.execute(
+                    "INSERT INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                    (key, bucket.tokens, bucket.updated_at),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+
+class KeyStats:
+    __slots__ = ("calls", "total_wait", "max_wait", "last_wait")
+
+    def __init__(self):
+        self.calls = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+
+    def record(self, wait: float):
+        self.calls += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.last_wait = wait
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "total_wait_seconds": round(self.total_wait, 3),
+            "avg_wait_seconds": round(self.total_wait / self.calls, 3) if self.calls else 0.0,
+            "max_wait_seconds": round(self.max_wait, 3),
+            "last_wait_seconds": round(self.last_wait, 3),
+        }
+
+
+class RateLimiter:
+    """Registry of token buckets keyed by (api_key, model)"""
+
+    def __init__(
+        self,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        burst: Optional[float] = None,
+        path: Optional[str] = None,
+    ):
+        # Unset values are read from the environment on first use, so settings
+        # loaded from apikey.env after import are still honoured.
+        self.rpm = rpm
+        self.tpm = tpm
+        self.burst = burst
+        self.path = path
+        self._shared: Optional[SqliteBuckets] = None
+        self._lock = Lock()
+        self._buckets: Dict[Tuple[str, str], Tuple[TokenBucket, TokenBucket]] = {}
+        self._stats: Dict[Tuple[str, str], KeyStats] = {}
+
+    def _buckets_for(self, key: Tuple[str, str]) -> Tuple[TokenBucket, TokenBucket]:
+        buckets = self._buckets.get(key)
+        if buckets is None:
+            if self.rpm is None:
+                self.rpm = _default_rpm()
+            if self.tpm is None:
+                self.tpm = _env_float("LLM_TPM", 0.0)
+            if self.burst is None:
+                self.burst = _env_float("LLM_BURST", None)
+            if self.path is None:
+                self.path = os.getenv("LLM_RATE_LIMIT_PATH", "")
+            if self.path and self._shared is None:
+                self._shared = SqliteBuckets(self.path)
+            request_bucket = TokenBucket(self.rpm, self.burst)
+            token_bucket = TokenBucket(self.tpm, self.tpm or None)
+            buckets = (request_bucket, token_bucket)
+            self._buckets[key] = buckets
+            self._stats[key] = KeyStats()
+        return buckets
+
+    def reserve(self, api_key: Optional[str] = None, model: Optional[str] = None, tokens: int = 0) -> float:
+        """Reserve one request (and `tokens` tokens); return the seconds to wait"""
+        key = (key_fingerprint(api_key), model or "default")
+        with self._lock:
+            request_bucket, token_bucket = self._buckets_for(key)
+            if self._shared is not None:
+                label = f"{key[0]}/{key[1]}"
+                wait = self._shared.reserve([
+                    (f"{label}/requests", request_bucket, 1),
+                    (f"{label}/tokens", token_bucket, tokens),
+                ])
+            else:
+                now = time.monotonic()
+                wait = max(request_bucket.reserve(1, now), token_bucket.reserve(tokens, now))
+            self._stats[key].record(wait)
+        return wait
+
+    def acquire(self, api_key: Optional[str] = None, model: Optional[str] = None, tokens: int = 0) -> float:
+        """Block until a call is allowed for this key/model; return the queue wait"""
+        wait = self.reserve(api_key, model, tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def aacquire(self, api_key: Optional[str] = None, model: Optional[str] = None, tokens: int = 0) -> float:
+        """Async variant of `acquire` that waits on the event loop instead of a thread"""
+        if self.path != "":
+            # Shared buckets (and the first call, which may set them up) touch SQLite and can wait on other processes
+            wait = await asyncio.to_thread(self.reserve, api_key, model, tokens)
+        else:
+            wait = self.reserve(api_key, model, tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def stats(self) -> dict:
+        """Calls and waits of this process, per key/model"""
+        with self._lock:
+            return {f"{fp}/{model}": s.as_dict() for (fp, model), s in self._stats.items()}
+
+
+# Process-wide limiter shared by every agent (and, with LLM_RATE_LIMIT_PATH, by every process)
+rate_limiter = RateLimiter()
+
+
+def enforce_rate_limit(api_key: Optional[str] = None, model: Optional[str] = None, tokens: int = 0) -> float:
+    """Wait for this key/model's rate limit; return the seconds spent waiting."""
+    return rate_limiter.acquire(api_key, model, tokens)
+
+
+async def aenforce_rate_limit(api_key: Optional[str] = None, model: Optional[str] = None, tokens: int = 0) -> float:
+    """Async variant of `enforce_rate_limit`."""
+    return await rate_limiter.aacquire(api_key, model, tokens)
@@ -0,0 +1,299 @@
+"""
+Extraction of case fields from the text of an uploaded medical report.
+
+Parsing is deterministic first: the section tokenizer (Utils.SectionTokenizer)
+reads every field in one pass over the text, and each value gets a confidence
+score from simple checks on its shape (an age is a plausible integer, a section
+did not run on into the next header, ...). Only fields below REPORT_PARSER_MIN_CONFIDENCE that the report
+appears to contain are sent to the model, together with just the lines that
+mention them, in one async call. For templated reports that is usually no call
+at all. The result records, per field, whether its value came from the rules
+or the model.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+from Utils.Agents import PROMPT_TEMPLATE_VERSION, ResponseParseError, content_text, parse_json_object
+from Utils.Concurrency import provider_semaphore
+from Utils.Hedging import DeadlineExceeded, role_deadline
+from Utils.PromptRegistry import prompt_registry
+from Utils.RateLimiter import aenforce_rate_limit, estimate_tokens
+from Utils.SectionTokenizer import default_tokenizer, load_synonyms
+from Utils.Telemetry import start_call
+
+# Case fields filled from a report, with their empty values
+CASE_FIELDS: Dict[str, Any] = {
+    "patientId": "",
+    "name": "",
+    "age": None,
+    "gender": "",
+    "chiefComplaint": "",
+    "familyHistory": "",
+    "personalHistory": "",
+    "lifestyle": "",
+    "medications": "",
+    "colonoscopy": "",
+    "stoolStudies": "",
+    "bloodTests": "",
+    "vitals": "",
+    "abdominalExam": "",
+}
+FIELD_DESCRIPTIONS = {
+    "patientId": "Patient ID or medical record number",
+    "name": "Patient's full name",
+    "age": "Patient's age (as integer, or null if not found)",
+    "gender": "Patient's gender (Male/Female/Other)",
+    "chiefComplaint": "Chief complaint or presenting symptoms",
+    "familyHistory": "Family medical history",
+    "personalHistory": "Personal medical history or past medical history",
+    "lifestyle": "Lifestyle factors (smoking, alcohol, exercise, diet, etc.)",
+    "medications": "Current medications",
+    "colonoscopy": "Colonoscopy findings (if any)",
+    "stoolStudies": "Stool study results (if any)",
+    "bloodTests": "Blood test results or lab values",
+    "vitals": "Vital signs (BP, HR, BMI, temperature, etc.)",
+    "abdominalExam": "Abdominal examination findings (if any)",
+}
+# Lowercase terms whose lines are the text a field is read from
+FIELD_KEYWORDS = {
+    "patientId": ("patient id", "patientid", "mrn", "medical record"),
+    "name": ("name",),
+    "age": ("age", "date of birth", "dob", "years old"),
+    "gender": ("gender", "sex"),
+    "chiefComplaint": ("chief complaint", "presenting complaint", "reason for visit", "presents with", "complains of"),
+    "familyHistory": ("family history",),
+    "personalHistory": ("medical history", "personal history", "past history"),
+    "lifestyle": ("lifestyle", "smok", "alcohol", "exercise"),
+    "medications": ("medication",),
+    "colonoscopy": ("colonoscopy",),
+    "stoolStudies": ("stool",),
+    "bloodTests": ("blood test", "lab", "cbc", "hemoglobin", "glucose", "hba1c"),
+    "vitals": ("vital", "blood pressure", "bp ", "heart rate", "hr ", "pulse", "bmi", "temperature"),
+    "abdominalExam": ("abdominal exam", "abdomen:"),
+}
+# Fields every report has; when missing they are looked for in the top of the report
+EXPECTED_FIELDS = ("patientId", "name", "age", "gender", "chiefComplaint")
+GENDERS = {"male", "female", "other", "m", "f"}
+# Lines of context sent with each keyword line, and the total span budget
+SPAN_CONTEXT_LINES = 3
+HEAD_LINES = 15
+MAX_SPAN_CHARS = 6000
+# Longer rule-based values are treated as a section that ran on
+MAX_FIELD_CHARS = 4000
+# Bump when the rules change, so cached parse results are not reused
+RULES_VERSION = 2
+
+# A line that is only a section header, e.g. "Recent Lab and Diagnostic Results:"
+_HEADER_LINE = re.compile(r"^[ \t]*[A-Z][A-Za-z &/()'-]{2,60}:[ \t]*$", re.M)
+_LABEL = re.compile(r"^\s*([A-Za-z][A-Za-z &/()'-]{1,40}):\s*")
+_PATIENT_ID = re.compile(r"[A-Za-z0-9][A-Za-z0-9/-]{2,}")
+_NAME = re.compile(r"[A-Za-z][A-Za-z.'-]*(?: [A-Za-z][A-Za-z.'-]*){1,4}")
+_AGE = re.compile(r"(\d{1,3})\b")
+
+REPORT_PARSER_PROMPT_NAME = "ReportParser.fields"
+_REPORT_PARSER_TEMPLATE = """You are a medical data extraction specialist. Extract the fields below from these excerpts of a medical report.
+
+Report excerpts:
+{{ spans }}
+
+Fields:
+{{ fields }}
+
+Return ONLY a JSON object with exactly these keys. Copy values from the excerpts; use an empty string (or null for age) when a field is not present. No additional text or explanation.
+"""
+
+
+def min_confidence() -> float:
+    """Confidence below which a field is sent to the model (REPORT_PARSER_MIN_CONFIDENCE, 0 disables the model)"""
+    return float(os.getenv("REPORT_PARSER_MIN_CONFIDENCE", "0.7"))
+
+
+def parser_version(model_name: str = "", threshold: Optional[float] = None) -> str:
+    """Tag of everything a parse result depends on besides the text (rules, headers, prompt, model, threshold)"""
+    if threshold is None:
+        threshold = min_confidence()
+    headers = {str(field): list(labels) for field, labels in load_synonyms().items()}
+    payload = json.dumps([RULES_VERSION, PROMPT_TEMPLATE_VERSION, model_name, threshold, headers], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def parse_medical_report_simple(text: str) -> dict:
+    """Rule-based field extraction (the deterministic first pass of `parse_medical_report`)"""
+    result = dict(CASE_FIELDS)
+    for field, value in default_tokenizer().fields(text).items():
+        if field == "age":
+            age = _AGE.match(value)
+            result["age"] = int(age.group(1)) if age else None
+        elif field in result:
+            result[field] = value
+    return result
+
+
+def _is_own_header(field: str, label: str) -> bool:
+    """Whether `label` is one of the field's own section headers (not a sub-label such as "Blood Pressure")"""
+    return default_tokenizer().header_fields.get(" ".join(label.lower().split())) == field
+
+
+def _clean(field: str, value):
+    """Drop the field's own header (alone on the first line, or as a leading label) picked up with the value"""
+    if not isinstance(value, str):
+        return value
+    value = value.strip()
+    first_line, _, rest = value.partition("\n")
+    if rest and _HEADER_LINE.fullmatch(first_line) and _is_own_header(field, first_line.strip().rstrip(":")):
+        value = rest.strip()
+    label = _LABEL.match(value)
+    if label and _is_own_header(field, label.group(1)):
+        value = value[label.end():].strip()
+    return value
+
+
+def field_confidence(field: str, value) -> float:
+    """0-1 confidence that a rule-based value is the field's complete, correct value"""
+    if value is None or value == "":
+        return 0.0
+    if field == "age":
+        return 0.95 if isinstance(value, int) and 0 <= value <= 130 else 0.3
+    value = str(value).strip()
+    if field == "gender":
+        return 0.95 if value.lower() in GENDERS else 0.4
+    if field == "patientId":
+        return 0.9 if _PATIENT_ID.fullmatch(value) else 0.4
+    if field == "name":
+        return 0.9 if _NAME.fullmatch(value) else 0.5
+    if len(value) > MAX_FIELD_CHARS or _HEADER_LINE.search(value):
+        # The section ran on into the next one
+        return 0.5
+    return 0.85
+
+
+def relevant_spans(text: str, fields: List[str]) -> str:
+    """The report lines that mention `fields` (with a few lines of context), within MAX_SPAN_CHARS"""
+    lines = text.split("\n")
+    lowered = [line.lower() for line in lines]
+    keep = set()
+    for field in fields:
+        keywords = FIELD_KEYWORDS[field]
+        for i, line in enumerate(lowered):
+            if any(keyword in line for keyword in keywords):
+                keep.update(range(i, min(i + SPAN_CONTEXT_LINES + 1, len(lines))))
+    if any(field in EXPECTED_FIELDS for field in fields):
+        keep.update(range(min(HEAD_LINES, len(lines))))
+    spans, size, previous = [], 0, None
+    for i in sorted(keep):
+        line = lines[i].strip()
+        if not line:
+            continue
+        if previous is not None and i > previous + 1:
+            line = "...\n" + line
+        if size + len(line) > MAX_SPAN_CHARS:
+            break
+        spans.append(line)
+        size += len(line) + 1
+        previous = i
+    return "\n".join(spans)
+
+
+def fields_for_model(text: str, confidence: Dict[str, float], threshold: float) -> List[str]:
+    """Low-confidence fields the model could fill: the report mentions them, or every report has them"""
+    lowered = text.lower()
+    return [
+        field for field in CASE_FIELDS
+        if confidence[field] < threshold
+        and (field in EXPECTED_FIELDS or any(keyword in lowered for keyword in FIELD_KEYWORDS[field]))
+    ]
+
+
+def _normalize(field: str, value):
+    if field != "age":
+        return "" if value is None else str(value).strip()
+    if isinstance(value, str):
+        value = value.strip()
+        return int(value) if value.isdigit() else None
+    return value if isinstance(value, int) else None
+
+
+async def _model_fields(
+    text: str, fields: List[str], model, model_name: str, api_key: Optional[str] = None, provider: str = "gemini"
+) -> Dict[str, Any]:
+    """Values of `fields` read by the model from the report lines that mention them (within the key's rate limit)"""
+    prompt = prompt_registry.get(
+        REPORT_PARSER_PROMPT_NAME, PROMPT_TEMPLATE_VERSION, lambda: (_REPORT_PARSER_TEMPLATE, ["spans", "fields"])
+    ).format(
+        spans=relevant_spans(text, fields),
+        fields="\n".join(f"- {field}: {FIELD_DESCRIPTIONS[field]}" for field in fields),
+    )
+    deadline = role_deadline("ReportParser")
+    call = start_call("report_parser", "ReportParser", model_name)
+    try:
+        # Same limits as the agents' calls: the provider's concurrency cap and the key's rate limit
+        async with provider_semaphore(provider):
+            call.rate_limit_wait += await aenforce_rate_limit(
+                api_key=api_key, model=model_name, tokens=estimate_tokens(prompt)
+            )
+            call.model_started()
+            try:
+                response = await asyncio.wait_for(model.ainvoke(prompt), deadline)
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded("ReportParser", deadline)
+        raw_text = content_text(response.content)
+        call.model_finished(prompt, raw_text, getattr(response, "usage_metadata", None))
+        if not raw_text.strip():
+            raise ResponseParseError("[ReportParser] Empty response received!", "empty_response")
+        values = parse_json_object(raw_text, Dict[str, Any], label="[ReportParser] ")
+        call.finish()
+    except Exception as e:
+        call.fail(e)
+        raise
+    return {field: _normalize(field, values.get(field)) for field in fields}
+
+
+async def parse_medical_report(
+    text: str,
+    model=None,
+    model_name: str = "",
+    threshold: Optional[float] = None,
+    api_key: Optional[str] = None,
+    provider: str = "gemini",
+) -> dict:
+    """
+    Case fields from report text: rules first, the model only for low-confidence fields.
+
+    Returns the CASE_FIELDS keys plus `extraction`: per-field `sources`
+    ("rules", "model" or "none") and `confidence`, the fields sent to the
+    model, the model error if its call failed, and the parse time. Without a
+    `model` (or if its call fails) the rule-based values are returned as they are.
+    `api_key` and `provider` select the rate-limit bucket and concurrency cap the call waits for.
+    """
+    started = time.perf_counter()
+    if threshold is None:
+        threshold = min_confidence()
+    fields = {field: _clean(field, value) for field, value in parse_medical_report_simple(text).items()}
+    confidence = {field: field_confidence(field, fields[field]) for field in CASE_FIELDS}
+    sources = {field: "rules" if confidence[field] > 0 else "none" for field in CASE_FIELDS}
+
+    requested = fields_for_model(text, confidence, threshold) if model is not None else []
+    model_error = None
+    if requested:
+        try:
+            for field, value in (await _model_fields(text, requested, model, model_name, api_key, provider)).items():
+                if value not in (None, ""):
+                    fields[field] = value
+                    sources[field] = "model"
+        except Exception as e:
+            print(f"Model extraction of {', '.join(requested)} failed, keeping rule-based values: {e}")
+            model_error = str(e)
+
+    fields["extraction"] = {
+        "sources": sources,
+        "confidence": {field: round(value, 2) for field, value in confidence.items()},
+        "modelFields": requested,
+        "modelError": model_error,
+        "seconds": round(time.perf_counter() - started, 4),
+    }
+    return fields
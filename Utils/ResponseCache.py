@@ -0,0 +1,228 @@
+"""
+Content-addressed caching of validated LLM responses.
+
+`DiskCache` is a small SQLite-backed key/value store with TTL expiry and
+size-based LRU eviction. The total size of the entries is kept in the database
+by triggers, so a write does not have to sum the whole table to decide whether
+to evict, and every process sharing the file sees the same total.
+
+`ResponseCache` sits on top of it and keys entries by hash(role, model name,
+rendered prompt, schema version), so a rerun of the same report with the same
+prompt and schema is served locally instead of calling the model again. Only
+responses that passed schema validation are ever stored.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from functools import lru_cache
+from threading import Lock
+from typing import Optional, Type
+
+from pydantic import BaseModel
+
+
+class DiskCache:
+    """SQLite key/value cache with TTL and least-recently-used eviction"""
+
+    def __init__(self, path: str, ttl_seconds: float = 7 * 24 * 3600, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.executescript(
+            """
+            BEGIN IMMEDIATE;
+            CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries (accessed_at);
+            CREATE INDEX IF NOT EXISTS idx_entries_expires ON entries (expires_at);
+            CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER NOT NULL);
+            -- Seeds the total of a cache file created before the table existed
+            INSERT OR IGNORE INTO totals (id, size) SELECT 0, COALESCE(SUM(size), 0) FROM entries;
+            CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+                UPDATE totals SET size = size + NEW.size WHERE id = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size ON entries BEGIN
+                UPDATE totals SET size = size - OLD.size + NEW.size WHERE id = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+                UPDATE totals SET size = size - OLD.size WHERE id = 0;
+            END;
+            COMMIT;
+            """
+        )
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, expires_at = row
+            if expires_at < now:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: bytes):
+        now = time.time()
+        with self._lock:
+            # An upsert rather than INSERT OR REPLACE: REPLACE's implicit delete skips the delete trigger
+            self._conn.execute(
+                "INSERT INTO entries (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, size = excluded.size, "
+                "expires_at = excluded.expires_at, accessed_at = excluded.accessed_at",
+                (key, value, len(value), now + self.ttl_seconds, now),
+            )
+            self.writes += 1
+            self._evict(now)
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM entries WHERE expires_at < ?", (now,))
+        total = self.total_bytes()
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries, a few at a time, until we are back under the limit
+        while total > self.max_bytes:
+            oldest = self._conn.execute("SELECT key, size FROM entries ORDER BY accessed_at LIMIT 32").fetchall()
+            if not oldest:
+                break
+            for key, size in oldest:
+                if total <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total -= size
+                self.evictions += 1
+
+    def total_bytes(self) -> int:
+        """Bytes held by the entries (the trigger-maintained total)"""
+        return self._conn.execute("SELECT size FROM totals WHERE id = 0").fetchone()[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            size = self.total_bytes()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "entries": entries,
+            "size_bytes": size,
+            "max_bytes": self.max_bytes,
+        }
+
+
+@lru_cache(maxsize=None)
+def schema_version(schema_model: Type[BaseModel]) -> str:
+    """Version tag derived from the schema, so changing a model invalidates its entries"""
+    schema = json.dumps(schema_model.model_json_schema(), sort_keys=True)
+    return hashlib.sha256(schema.encode("utf-8")).hexdigest()[:16]
+
+
+def cache_key(role: str, model_name: str, prompt: str, version: str) -> str:
+    digest = hashlib.sha256()
+    for part in (role, model_name, version, prompt):
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """Caches validated structured responses keyed by role/model/prompt/schema"""
+
+    def __init__(self, disk_cache: Optional[DiskCache]):
+        self.disk_cache = disk_cache
+
+    @property
+    def enabled(self) -> bool:
+        return self.disk_cache is not None
+
+    def lookup(self, role: str, model_name: str, prompt: str, schema_model: Type[BaseModel]) -> Optional[BaseModel]:
+        if not self.enabled:
+            return None
+        value = self.disk_cache.get(cache_key(role, model_name, prompt, schema_version(schema_model)))
+        if value is None:
+            return None
+        try:
+            return schema_model.model_validate_json(value)
+        except ValueError:
+            # Entry no longer matches the schema; treat as a miss
+            return None
+
+    def store(self, role: str, model_name: str, prompt: str, structured: BaseModel):
+        if not self.enabled:
+            return
+        key = cache_key(role, model_name, prompt, schema_version(type(structured)))
+        self.disk_cache.set(key, structured.model_dump_json().encode("utf-8"))
+
+    def lookup_json(self, role: str, model_name: str, prompt: str, version: str):
+        """Like `lookup`, for payloads without a pydantic model (e.g. treatment options)"""
+        if not self.enabled:
+            return None
+        value = self.disk_cache.get(cache_key(role, model_name, prompt, version))
+        return json.loads(value) if value is not None else None
+
+    def store_json(self, role: str, model_name: str, prompt: str, version: str, payload):
+        if not self.enabled:
+            return
+        key = cache_key(role, model_name, prompt, version)
+        self.disk_cache.set(key, json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+
+    def stats(self) -> dict:
+        if not self.enabled:
+            return {"enabled": False}
+        return {"enabled": True, **self.disk_cache.stats()}
+
+
+_response_cache: Optional[ResponseCache] = None
+_response_cache_lock = Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Process-wide cache shared by every agent (configured from the environment on first use)"""
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = _create_response_cache()
+    return _response_cache
+
+
+def _create_response_cache() -> ResponseCache:
+    if os.getenv("LLM_CACHE_ENABLED", "1").lower() in ("0", "false", "no"):
+        return ResponseCache(None)
+    return ResponseCache(
+        DiskCache(
+            os.getenv("LLM_CACHE_PATH", os.path.join(".cache", "llm_responses.sqlite3")),
+            ttl_seconds=float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+            max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+        )
+    )
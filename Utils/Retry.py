@@ -0,0 +1,89 @@
+"""
+Retry policy for agent model calls.
+
+Two kinds of failure are retried, each with its own budget:
+
+- Transport errors (rate limited, unavailable, timed out, connection dropped)
+  are retried with the same prompt after an exponential backoff with jitter,
+  up to `max_attempts` calls in total.
+- Schema failures (the reply is not JSON, or does not validate) are not worth
+  re-sending the full prompt for. The model instead gets a short repair prompt
+  holding only its invalid reply and the validator errors, up to
+  `repair_attempts` times.
+
+Settings come from the environment when the policy is read (LLM_MAX_ATTEMPTS,
+LLM_REPAIR_ATTEMPTS, LLM_RETRY_BASE_SECONDS, LLM_RETRY_MAX_SECONDS).
+"""
+import os
+import random
+from typing import Optional
+
+# HTTP statuses worth retrying: timeout, rate limit, server-side failures
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+# Exception class names raised by the Gemini and Ollama clients (and httpx
+# underneath them) for transient failures; matched by name so neither
+# provider package has to be importable
+TRANSIENT_ERROR_NAMES = {
+    "ResourceExhausted",
+    "ServiceUnavailable",
+    "DeadlineExceeded",
+    "InternalServerError",
+    "TooManyRequests",
+    "ServerError",
+    "ConnectError",
+    "ConnectTimeout",
+    "ReadError",
+    "ReadTimeout",
+    "WriteTimeout",
+    "PoolTimeout",
+    "RemoteProtocolError",
+}
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    for attr in ("status_code", "code", "status"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """Whether `exc` (or an exception it was raised from) is worth retrying with the same prompt"""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, (ConnectionError, TimeoutError)):
+            return True
+        if any(cls.__name__ in TRANSIENT_ERROR_NAMES for cls in type(exc).__mro__):
+            return True
+        if _status_code(exc) in TRANSIENT_STATUS_CODES:
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts: int = 3, repair_attempts: int = 2, base_delay: float = 1.0, max_delay: float = 30.0):
+        self.max_attempts = max(1, max_attempts)
+        self.repair_attempts = max(0, repair_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, retry: int) -> float:
+        """Delay before retry number `retry` (1-based): exponential, half of it jittered"""
+        delay = min(self.max_delay, self.base_delay * 2 ** (retry - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def should_retry(self, exc: BaseException, attempt: int) -> bool:
+        return attempt < self.max_attempts and is_transient_error(exc)
+
+
+def retry_policy() -> RetryPolicy:
+    """Policy from the environment (read on each call, after .env has been loaded)"""
+    return RetryPolicy(
+        max_attempts=int(os.getenv("LLM_MAX_ATTEMPTS", "3")),
+        repair_attempts=int(os.getenv("LLM_REPAIR_ATTEMPTS", "2")),
+        base_delay=float(os.getenv("LLM_RETRY_BASE_SECONDS", "1.0")),
+        max_delay=float(os.getenv("LLM_RETRY_MAX_SECONDS", "30")),
+    )
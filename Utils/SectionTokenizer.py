@@ -0,0 +1,179 @@
+"""
+Single-pass section tokenizer for medical report text.
+
+Every known header label is compiled into one alternation, factored into a
+prefix trie ("a(?:ge|bdominal exam(?:ination)?)|...") so that a line that
+starts with no header fails after a character or two. One `finditer` pass over
+the text finds the header lines and splits the report into sections:
+
+- a header with a value on its line ("Age: 35", "Vital Signs: BP 135/82")
+  covers that line and any continuation lines, up to a blank line or the next
+  `Label:` line;
+- a header alone on its line ("Recent Lab and Diagnostic Results:") covers
+  everything up to the next header of another field, so the labelled lines
+  inside the section ("PSA: ...", "Blood Tests: ...") stay part of it.
+
+Headers map to case fields through HEADER_SYNONYMS; headers mapped to None
+only end the previous section. Extra synonyms can be supplied as a JSON file
+of {field: [header, ...]} named by REPORT_HEADER_SYNONYMS_FILE. When several
+sections map to the same field, the first non-empty one wins.
+"""
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+# field -> header labels (matched case-insensitively, any amount of inner whitespace)
+HEADER_SYNONYMS: Dict[Optional[str], tuple] = {
+    "patientId": ("patient id", "patientid", "patient no", "mrn", "medical record number", "medical record no"),
+    "name": ("name", "patient name", "full name"),
+    "age": ("age",),
+    "gender": ("gender", "sex"),
+    "chiefComplaint": ("chief complaint", "presenting complaint", "reason for visit", "reason for referral"),
+    "familyHistory": ("family history", "family medical history"),
+    "personalHistory": ("personal medical history", "personal history", "past medical history", "medical history"),
+    "lifestyle": ("lifestyle", "lifestyle factors", "social history"),
+    "medications": ("medications", "medication", "current medications"),
+    "colonoscopy": ("colonoscopy",),
+    "stoolStudies": ("stool studies", "stool study", "stool tests"),
+    "bloodTests": (
+        "blood tests", "blood test", "blood work", "labs", "lab results", "laboratory results",
+        "recent lab and diagnostic results", "lab and diagnostic results",
+    ),
+    "vitals": ("vital signs", "vitals"),
+    "abdominalExam": ("abdominal exam", "abdominal examination"),
+    # Section boundaries that belong to no field
+    None: ("date of report", "date", "physical examination findings", "physical examination", "assessment", "plan"),
+}
+# Fields whose value is the first line of their span only
+SINGLE_LINE_FIELDS = ("patientId", "name", "age", "gender")
+
+
+class Section(NamedTuple):
+    field: Optional[str]
+    label: str
+    text: str
+
+
+def _normalize_label(label: str) -> str:
+    return " ".join(label.lower().split())
+
+
+def load_synonyms(path: Optional[str] = None) -> Dict[Optional[str], tuple]:
+    """HEADER_SYNONYMS extended with the {field: [header, ...]} JSON file at `path` (or REPORT_HEADER_SYNONYMS_FILE)"""
+    path = path or os.getenv("REPORT_HEADER_SYNONYMS_FILE")
+    synonyms = dict(HEADER_SYNONYMS)
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            for field, headers in json.load(f).items():
+                field = None if field in ("", "null", "none") else field
+                synonyms[field] = tuple(synonyms.get(field, ())) + tuple(headers)
+    return synonyms
+
+
+def _alternation(headers: Iterable[str]) -> str:
+    """Regex matching any of `headers`, factored into a prefix trie; the longest header wins"""
+    trie: dict = {}
+    for header in headers:
+        node = trie
+        for char in header:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def render(node: dict) -> str:
+        branches = [
+            (r"[ \t]+" if char == " " else re.escape(char)) + render(child)
+            for char, child in sorted(node.items()) if char
+        ]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            return body + "?" if body.startswith("(?:") and len(branches) > 1 else "(?:" + body + ")?"
+        return body
+
+    return render(trie)
+
+
+# Any "Label:" line, known or not; ends the value of an inline header
+_LABEL_LINE = re.compile(r"[ \t]*(?:[-*•#]+[ \t]*)?[A-Za-z][A-Za-z0-9 &/()'.-]{0,60}+(?:\([^)\n]*\)[ \t]*)?:")
+
+
+class SectionTokenizer:
+    def __init__(self, synonyms: Optional[Dict[Optional[str], Iterable[str]]] = None):
+        synonyms = HEADER_SYNONYMS if synonyms is None else synonyms
+        self.header_fields: Dict[str, Optional[str]] = {}
+        for field, headers in synonyms.items():
+            for header in headers:
+                self.header_fields.setdefault(_normalize_label(header), field)
+        # Starts with a literal newline (the text is searched with one prepended) so the
+        # regex engine can skip from line to line instead of trying every position
+        self.pattern = re.compile(
+            r"\n[ \t]*(?:[-*•#]+[ \t]*)?(?P<header>" + _alternation(self.header_fields) + r")"
+            r"[ \t]*(?:\([^)\n]*\)[ \t]*)?:",
+            re.IGNORECASE,
+        )
+
+    @staticmethod
+    def _inline_end(text: str, start: int, limit: int) -> int:
+        """End of an inline value: its line plus continuation lines, before `limit`"""
+        end = text.find("\n", start)
+        while 0 <= end < limit:
+            next_end = text.find("\n", end + 1)
+            line = text[end + 1:next_end if next_end >= 0 else len(text)]
+            if not line.strip() or _LABEL_LINE.match(line):
+                return end
+            end = next_end
+        return limit
+
+    def sections(self, text: str) -> List[Section]:
+        """Known-header sections of `text`, in document order"""
+        text = "\n" + text
+        matches = list(self.pattern.finditer(text))
+        sections: List[Section] = []
+        # (index in `sections`, field, value start) of the header-only section still open
+        open_section = None
+        for i, match in enumerate(matches):
+            label = _normalize_label(match.group("header"))
+            field = self.header_fields[label]
+            line_end = text.find("\n", match.end())
+            inline = bool(text[match.end():line_end if line_end >= 0 else len(text)].strip())
+            # Inline headers of the open section's own field ("Blood Tests:" under "Labs:") stay inside it
+            if open_section is not None and not (inline and field is not None and field == open_section[1]):
+                index, _, start = open_section
+                sections[index] = sections[index]._replace(text=text[start:match.start()].strip())
+                open_section = None
+            if inline:
+                limit = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+                end = self._inline_end(text, match.end(), limit)
+                sections.append(Section(field, label, text[match.end():end].strip()))
+            elif open_section is None:
+                open_section = (len(sections), field, match.end())
+                sections.append(Section(field, label, ""))
+        if open_section is not None:
+            index, _, start = open_section
+            sections[index] = sections[index]._replace(text=text[start:].strip())
+        return sections
+
+    def fields(self, text: str) -> Dict[str, str]:
+        """field -> text of its first non-empty section"""
+        values: Dict[str, str] = {}
+        for section in self.sections(text):
+            if section.field is None or not section.text or section.field in values:
+                continue
+            value = section.text
+            if section.field in SINGLE_LINE_FIELDS:
+                value = value.split("\n", 1)[0].strip()
+            values[section.field] = value
+        return values
+
+
+@lru_cache(maxsize=None)
+def _tokenizer(synonyms_path: Optional[str]) -> SectionTokenizer:
+    return SectionTokenizer(load_synonyms(synonyms_path))
+
+
+def default_tokenizer() -> SectionTokenizer:
+    """Tokenizer for HEADER_SYNONYMS plus REPORT_HEADER_SYNONYMS_FILE, compiled once per file"""
+    return _tokenizer(os.getenv("REPORT_HEADER_SYNONYMS_FILE") or None)
@@ -0,0 +1,149 @@
+"""
+Local relevance routing of specialists.
+
+Before any LLM call, each specialty is scored from the report text with a small
+keyword ontology: symptoms and diagnoses weigh more than test names, terms in
+the chief complaint count double, negated mentions ("no chest pain", "denies
+seizures", "non-smoker") and family history are ignored, and lines reporting
+normal results count for little. Specialists whose score reaches the threshold
+are consulted; the others get a "not consulted" entry instead of a report. The
+Internist, as the generalist, is always consulted.
+
+Scoring is pure Python over the report (or the text built from a case's
+fields), with no network calls.
+"""
+import os
+import re
+from typing import Dict, List, Optional, Sequence
+
+# Consulted whatever the report says
+ALWAYS_CONSULTED = ("Internist",)
+
+# term -> weight; terms match at the start of a word, so "hepat" covers hepatitis
+SPECIALTY_TERMS: Dict[str, Dict[str, float]] = {
+    "Neurologist": {
+        "headache": 2, "migraine": 2, "seizure": 2, "epilep": 2, "numbness": 2, "tingling": 2,
+        "neuropath": 2, "memory loss": 2, "dementia": 2, "alzheimer": 2, "disorientation": 2,
+        "stroke": 2, "tremor": 2, "paresthesia": 2, "vertigo": 2, "parkinson": 2,
+        "multiple sclerosis": 2, "burning sensation": 2, "syncope": 2, "cognitive": 1.5,
+        "dizziness": 1, "confusion": 1, "weakness": 1, "neurological": 1, "neuro exam": 1,
+        "mri brain": 1, "ct head": 1, "eeg": 1, "nerve conduction": 1, "mmse": 1,
+        "mini-mental": 1, "moca": 1, "reflexes": 1, "monofilament": 1, "gait": 1, "sensation": 0.5,
+    },
+    "Cardiologist": {
+        "chest pain": 2, "palpitation": 2, "angina": 2, "arrhythmia": 2, "atrial fibrillation": 2,
+        "heart failure": 2, "myocardial": 2, "heart attack": 2, "murmur": 2, "tachycardia": 2,
+        "bradycardia": 2, "cardiomyopathy": 2, "coronary": 2, "edema": 1.5, "shortness of breath": 1,
+        "dyspnea": 1, "syncope": 1, "hypertension": 1, "hyperlipidemia": 1, "cholesterol": 0.5,
+        "ecg": 1, "ekg": 1, "electrocardiogram": 1, "echocardiogram": 1, "troponin": 1,
+        "holter": 1, "ejection fraction": 1, "cardiac": 1, "heart": 0.5,
+    },
+    "Gastroenterologist": {
+        "abdominal pain": 2, "bloating": 2, "diarrh": 2, "constipation": 2, "bowel": 2,
+        "nausea": 2, "vomiting": 2, "heartburn": 2, "reflux": 2, "gerd": 1.5, "colitis": 2,
+        "crohn": 2, "irritable bowel": 2, "hepat": 2, "cirrhosis": 2, "jaundice": 2,
+        "pancreat": 2, "gallbladder": 2, "gallstone": 2, "rectal bleeding": 2, "melena": 2,
+        "dysphagia": 1, "difficulty swallowing": 1, "cramping": 1, "abdominal": 1, "stool": 1,
+        "colonoscopy": 1, "endoscopy": 1, "liver": 1, "proton pump": 0.5, "omeprazole": 0.5,
+    },
+    "Psychiatrist": {
+        "anxiety": 2, "panic": 2, "depress": 2, "insomnia": 2, "difficulty initiating sleep": 2,
+        "suicid": 2, "hallucination": 2, "psychosis": 2, "bipolar": 2, "ptsd": 2,
+        "impending doom": 2, "mood": 1.5, "sleep": 1, "stress": 1, "irritability": 1,
+        "fatigue": 0.5, "concentration": 1, "substance": 1, "benzodiazepine": 1, "lorazepam": 1,
+        "sertraline": 1, "ssri": 1, "cognitive behavioral": 1, "phq-9": 1, "gad-7": 1,
+        "psychiatric": 1, "behavior": 0.5,
+    },
+}
+# Multiplier for terms found in the chief complaint
+CHIEF_COMPLAINT_WEIGHT = 2.0
+# Multiplier for terms on a line that reports normal results
+NORMAL_LINE_WEIGHT = 0.25
+
+_NEGATION = re.compile(r"(?:\b(?:no|not|denies|denied|without|negative for|absence of)\b|\bnon-)[^.;:]*$")
+_NORMAL_LINE = re.compile(r"\b(?:normal|unremarkable|within normal limits|negative)\b")
+_SKIPPED_LINES = re.compile(r"^\s*family history\b")
+_CHIEF_COMPLAINT = re.compile(r"chief complaint:?(.*?)(?:\n\s*\n|\n[a-z][a-z /()-]*:\s*\n|\Z)", re.S)
+_term_patterns = {
+    specialty: [(term, weight, re.compile(r"\b" + re.escape(term))) for term, weight in terms.items()]
+    for specialty, terms in SPECIALTY_TERMS.items()
+}
+
+
+def routing_enabled() -> bool:
+    """Whether specialists are routed (SPECIALIST_ROUTING, off unless set to 1/true)"""
+    return os.getenv("SPECIALIST_ROUTING", "0").lower() in ("1", "true", "yes")
+
+
+def routing_threshold() -> float:
+    return float(os.getenv("SPECIALIST_ROUTING_THRESHOLD", "2.5"))
+
+
+def _line_weight(line: str, start: int) -> float:
+    """Weight of a match at `start` in `line` (0 when negated)"""
+    if _NEGATION.search(line[:start]):
+        return 0.0
+    return NORMAL_LINE_WEIGHT if _NORMAL_LINE.search(line) else 1.0
+
+
+def score_specialties(report: str) -> Dict[str, float]:
+    """Relevance score per routed specialty; each term counts once, at its best weight"""
+    text = report.lower()
+    chief = _CHIEF_COMPLAINT.search(text)
+    chief_span = chief.span(1) if chief else (0, 0)
+    lines = []
+    offset = 0
+    for line in text.split("\n"):
+        if not _SKIPPED_LINES.match(line):
+            lines.append((offset, line))
+        offset += len(line) + 1
+
+    scores = {}
+    for specialty, patterns in _term_patterns.items():
+        score = 0.0
+        for term, weight, pattern in patterns:
+            best = 0.0
+            for line_start, line in lines:
+                for match in pattern.finditer(line):
+                    factor = _line_weight(line, match.start())
+                    if chief_span[0] <= line_start + match.start() < chief_span[1]:
+                        factor *= CHIEF_COMPLAINT_WEIGHT
+                    best = max(best, weight * factor)
+            score += best
+        scores[specialty] = round(score, 2)
+    return scores
+
+
+class RoutingDecision:
+    def __init__(self, scores: Dict[str, float], threshold: float, roles: Sequence[str]):
+        self.scores = scores
+        self.threshold = threshold
+        self.consulted: List[str] = [
+            role for role in roles if role in ALWAYS_CONSULTED or scores.get(role, 0.0) >= threshold
+        ]
+        self.skipped: List[str] = [role for role in roles if role not in self.consulted]
+
+    def not_consulted_entry(self, role: str) -> dict:
+        """Stand-in for a skipped specialist's report (understood by the team prompt)"""
+        return {
+            "specialist": role,
+            "status": "not_consulted",
+            "relevance": self.scores.get(role, 0.0),
+            "reason": f"The report holds little or nothing for this specialty (relevance "
+                      f"{self.scores.get(role, 0.0):g}, threshold {self.threshold:g})",
+        }
+
+    def as_dict(self) -> dict:
+        return {
+            "threshold": self.threshold,
+            "scores": self.scores,
+            "consulted": self.consulted,
+            "skipped": self.skipped,
+        }
+
+
+def route_specialists(report: str, roles: Sequence[str], threshold: Optional[float] = None) -> RoutingDecision:
+    """Which of `roles` to consult for `report`"""
+    if threshold is None:
+        threshold = routing_threshold()
+    return RoutingDecision(score_specialties(report), threshold, roles)
@@ -0,0 +1,154 @@
+"""
+Locating JSON objects in model output.
+
+`iter_json_objects` walks a complete response and yields each top-level JSON
+object in it. Every candidate `{` is handed to the C-accelerated
+`JSONDecoder.raw_decode`, which both finds where the object ends (braces inside
+strings included) and decodes it in the same pass; stray braces in prose or
+code fences fail immediately and are skipped.
+
+`IncrementalJSONParser` scans each chunk once, tracking string/escape state and
+the stack of open objects and arrays. Items of the watched top-level array
+fields (e.g. `diagnoses`) are decoded and returned as soon as their closing
+brace arrives, and `done` turns True once the top-level object is closed so the
+caller can stop reading the stream instead of paying for trailing prose. A
+closed span that is not valid JSON (`{braces}` in prose before the reply's
+object) is dropped and scanning restarts at the next brace.
+"""
+import json
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+_decoder = json.JSONDecoder()
+
+
+def iter_json_objects(text: str) -> Iterator[Tuple[int, int, dict]]:
+    """
+    Yield (start, end, value) for each top-level JSON object in `text`, in order.
+
+    A `{` that does not start valid JSON (e.g. `{see below}` in prose) is
+    skipped; after a decoded object, scanning resumes at its end, so nested
+    objects are never yielded on their own.
+    """
+    start = text.find("{")
+    while start >= 0:
+        try:
+            value, end = _decoder.raw_decode(text, start)
+        except ValueError:
+            start = text.find("{", start + 1)
+            continue
+        yield start, end, value
+        start = text.find("{", end)
+
+
+class _Frame:
+    __slots__ = ("kind", "start", "key", "expect_key")
+
+    def __init__(self, kind: str, start: int):
+        self.kind = kind
+        self.start = start
+        self.key = None
+        self.expect_key = kind == "{"
+
+
+class IncrementalJSONParser:
+    """Feed text chunks; collects completed items of the watched array fields"""
+
+    def __init__(self, watch: Iterable[str] = ()):
+        self.watch = set(watch)
+        self.text = ""
+        self.done = False
+        self._start: Optional[int] = None
+        self._end: Optional[int] = None
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+
+    @property
+    def document(self) -> Optional[str]:
+        """Text of the complete top-level object, once `done`"""
+        if not self.done:
+            return None
+        return self.text[self._start:self._end]
+
+    def feed(self, chunk: str) -> List[Tuple[str, object]]:
+        """Consume a chunk; returns (field, item) for every watched item it completed"""
+        if self.done or not chunk:
+            return []
+        pos = len(self.text)
+        self.text += chunk
+        if self._start is None:
+            # Anything before the first brace (prose, a ```json fence) is skipped
+            start = self.text.find("{", pos)
+            if start < 0:
+                return []
+            self._start = pos = start
+        return self._scan(pos)
+
+    def _scan(self, pos: int) -> List[Tuple[str, object]]:
+        items = []
+        while pos is not None:
+            pos = self._scan_from(pos, items)
+        return items
+
+    def _restart(self, after: int) -> Optional[int]:
+        """Drop the current span and start over at the next `{` after `after` (None if there is none yet)"""
+        self._stack.clear()
+        self._in_string = False
+        self._escape = False
+        start = self.text.find("{", after + 1)
+        self._start = start if start >= 0 else None
+        return self._start
+
+    def _scan_from(self, pos: int, items: List[Tuple[str, object]]) -> Optional[int]:
+        """Scan from `pos`, appending completed items; returns where to rescan from after a false start"""
+        text = self.text
+        stack = self._stack
+        for i in range(pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    frame = stack[-1]
+                    if frame.kind == "{" and frame.expect_key:
+                        try:
+                            frame.key = json.loads(text[self._string_start:i + 1])
+                        except ValueError:
+                            frame.key = None
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch == "{" or ch == "[":
+                stack.append(_Frame(ch, i))
+            elif ch == "}" or ch == "]":
+                if not stack:
+                    continue
+                frame = stack.pop()
+                if not stack:
+                    try:
+                        json.loads(text[self._start:i + 1])
+                    except ValueError:
+                        # Braces in prose, not the reply's JSON object
+                        return self._restart(self._start)
+                    self.done = True
+                    self._end = i + 1
+                    return None
+                # An object directly inside a watched array of the top-level object
+                if ch == "}" and len(stack) == 2 and stack[1].kind == "[" and stack[0].key in self.watch:
+                    try:
+                        items.append((stack[0].key, json.loads(text[frame.start:i + 1])))
+                    except ValueError:
+                        pass
+            elif ch == ":":
+                if stack:
+                    stack[-1].expect_key = False
+            elif ch == ",":
+                if stack and stack[-1].kind == "{":
+                    stack[-1].expect_key = True
+        return None
@@ -0,0 +1,318 @@
+"""
+Per-call LLM telemetry.
+
+Every model call (agents, treatment JSON, report parsing) is described by an
+`LLMCall`: rate-limit wait, model latency, prompt/completion tokens, outcome
+(ok, cached, a parse failure reason, deadline_exceeded or model_error),
+transport retries, repair prompts and hedge requests.
+Finished calls are aggregated into counters and histograms labelled by kind,
+role and model, and appended to the case collector active in the current
+context (see `collect_calls`), so each case can store its own call records.
+
+Cases run in worker processes, so each process periodically writes its
+aggregates to `<TELEMETRY_DIR>/<host>-<pid>.json`. The API server merges these
+snapshot files with its own registry and renders them in the Prometheus text
+format on `GET /metrics`.
+"""
+import contextlib
+import contextvars
+import glob
+import json
+import os
+import socket
+import time
+from threading import Lock
+from typing import Dict, List, Optional
+
+from Utils.RateLimiter import estimate_tokens
+
+METRIC_PREFIX = "medaura_llm"
+
+# Histogram bucket upper bounds (+Inf is implicit)
+HISTOGRAM_BUCKETS = {
+    "latency_seconds": (0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 128),
+    "rate_limit_wait_seconds": (0, 0.1, 0.5, 1, 2, 5, 10, 30, 60, 120),
+    "prompt_tokens": (256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536),
+    "full_prompt_tokens_estimate": (256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536),
+    "completion_tokens": (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384),
+}
+HISTOGRAM_HELP = {
+    "latency_seconds": "Model call latency (excluding rate-limit wait)",
+    "rate_limit_wait_seconds": "Time spent waiting for the per-key rate limit",
+    "prompt_tokens": "Prompt tokens per call",
+    "full_prompt_tokens_estimate": "Estimated prompt tokens of the full encoding, for calls sent a compact prompt",
+    "completion_tokens": "Completion tokens per call",
+}
+# Per-call counts summed into `<prefix>_<name>_total` counters
+COUNTERS = {
+    "retries": "LLM call attempts retried after a transport error",
+    "repairs": "Repair prompts sent after a reply failed validation",
+    "hedges": "Hedge requests sent on a second API key after the hedge delay",
+    "hedge_wins": "Hedge requests that answered before the original request",
+}
+LABELS = ("kind", "role", "model")
+
+# List that finished calls are appended to for the case being processed
+_case_calls: contextvars.ContextVar[Optional[List[dict]]] = contextvars.ContextVar("case_calls", default=None)
+
+
+@contextlib.contextmanager
+def collect_calls():
+    """Collect the records of every call finished inside this block (including tasks it starts)"""
+    calls: List[dict] = []
+    token = _case_calls.set(calls)
+    try:
+        yield calls
+    finally:
+        _case_calls.reset(token)
+
+
+def _usage_tokens(usage) -> tuple:
+    if not usage:
+        return None, None
+    if not isinstance(usage, dict):
+        usage = dict(usage)
+    return usage.get("input_tokens"), usage.get("output_tokens")
+
+
+class LLMCall:
+    """Measurements of one model call; `finish` or `fail` records it exactly once"""
+
+    def __init__(self, kind: str, role: str, model: str):
+        self.kind = kind
+        self.role = role
+        self.model = model
+        self.rate_limit_wait = 0.0
+        self.latency: Optional[float] = None
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+        self.tokens_estimated = False
+        # Set by agents that send a compact prompt, to show what it saved
+        self.full_prompt_tokens_estimate: Optional[int] = None
+        self.retries = 0
+        self.repairs = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.outcome: Optional[str] = None
+        self.error: Optional[str] = None
+        self._model_started: Optional[float] = None
+        self._recorded = False
+
+    def model_started(self):
+        self._model_started = time.perf_counter()
+
+    def model_failed(self):
+        """Stop the latency clock after the model call raised (the time still counts)"""
+        if self._model_started is not None:
+            self.latency = (self.latency or 0.0) + time.perf_counter() - self._model_started
+            self._model_started = None
+
+    def model_finished(self, prompt=None, completion=None, usage=None):
+        """Stop the latency clock and take token counts from usage metadata (or estimate them)"""
+        if self._model_started is not None:
+            self.latency = (self.latency or 0.0) + time.perf_counter() - self._model_started
+            self._model_started = None
+        prompt_tokens, completion_tokens = _usage_tokens(usage)
+        if prompt_tokens is None or completion_tokens is None:
+            self.tokens_estimated = True
+            prompt_tokens = prompt_tokens if prompt_tokens is not None else estimate_tokens(prompt)
+            completion_tokens = completion_tokens if completion_tokens is not None else estimate_tokens(completion)
+        self.prompt_tokens = (self.prompt_tokens or 0) + prompt_tokens
+        self.completion_tokens = (self.completion_tokens or 0) + completion_tokens
+
+    def finish(self, outcome: str = "ok", error: Optional[str] = None):
+        if self._recorded:
+            return
+        self._recorded = True
+        self.outcome = outcome
+        self.error = error
+        telemetry.record(self.as_dict())
+
+    def fail(self, exc: BaseException):
+        """Record a failed call; parse failures and deadlines carry their reason, anything else is a model error"""
+        self.model_failed()
+        reason = getattr(exc, "reason", None) or "model_error"
+        self.finish(reason, f"{type(exc).__name__}: {exc}"[:500])
+
+    def as_dict(self) -> dict:
+        return {
+            "kind": self.kind,
+            "role": self.role,
+            "model": self.model,
+            "outcome": self.outcome,
+            "error": self.error,
+            "rate_limit_wait_seconds": round(self.rate_limit_wait, 3),
+            "latency_seconds": round(self.latency, 3) if self.latency is not None else None,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "tokens_estimated": self.tokens_estimated,
+            "full_prompt_tokens_estimate": self.full_prompt_tokens_estimate,
+            "retries": self.retries,
+            "repairs": self.repairs,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "finished_at": time.time(),
+        }
+
+
+def start_call(kind: str, role: str, model: str) -> LLMCall:
+    return LLMCall(kind, role, model)
+
+
+def _new_histogram(name: str) -> dict:
+    return {"buckets": [0] * (len(HISTOGRAM_BUCKETS[name]) + 1), "sum": 0.0, "count": 0}
+
+
+class Telemetry:
+    """Process-wide counters and histograms keyed by (kind, role, model)"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._calls: Dict[tuple, int] = {}
+        self._counters: Dict[str, Dict[tuple, int]] = {name: {} for name in COUNTERS}
+        self._histograms: Dict[str, Dict[tuple, dict]] = {name: {} for name in HISTOGRAM_BUCKETS}
+        self._flushed_at = 0.0
+        self.snapshot_dir: Optional[str] = None
+        self.flush_interval = 1.0
+
+    def record(self, call: dict):
+        labels = tuple(call[label] for label in LABELS)
+        with self._lock:
+            outcome_key = labels + (call["outcome"],)
+            self._calls[outcome_key] = self._calls.get(outcome_key, 0) + 1
+            for name, series in self._counters.items():
+                if call.get(name):
+                    series[labels] = series.get(labels, 0) + call[name]
+            # Cached calls never reached the model; they are only counted
+            for name in HISTOGRAM_BUCKETS if call["outcome"] != "cached" else ():
+                value = call.get(name)
+                if value is None:
+                    continue
+                histogram = self._histograms[name].setdefault(labels, _new_histogram(name))
+                index = next((i for i, bound in enumerate(HISTOGRAM_BUCKETS[name]) if value <= bound), len(HISTOGRAM_BUCKETS[name]))
+                histogram["buckets"][index] += 1
+                histogram["sum"] += value
+                histogram["count"] += 1
+        collector = _case_calls.get()
+        if collector is not None:
+            collector.append(call)
+        if self.snapshot_dir and time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def snapshot(self) -> dict:
+        """JSON-serialisable copy of the aggregates"""
+        with self._lock:
+            return {
+                "calls": [[list(key), n] for key, n in self._calls.items()],
+                "counters": {
+                    name: [[list(key), n] for key, n in series.items()] for name, series in self._counters.items()
+                },
+                "histograms": {
+                    name: [[list(key), dict(h, buckets=list(h["buckets"]))] for key, h in series.items()]
+                    for name, series in self._histograms.items()
+                },
+            }
+
+    def enable_snapshots(self, directory: str, flush_interval: float = 1.0):
+        """Write this process's aggregates to `directory` so another process can serve them"""
+        os.makedirs(directory, exist_ok=True)
+        self.snapshot_dir = directory
+        self.flush_interval = flush_interval
+
+    def snapshot_path(self) -> Optional[str]:
+        if not self.snapshot_dir:
+            return None
+        return os.path.join(self.snapshot_dir, f"{socket.gethostname()}-{os.getpid()}.json")
+
+    def flush(self):
+        path = self.snapshot_path()
+        if not path:
+            return
+        self._flushed_at = time.monotonic()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+
+def merge_snapshots(snapshots: List[dict]) -> dict:
+    calls: Dict[tuple, int] = {}
+    counters: Dict[str, Dict[tuple, int]] = {name: {} for name in COUNTERS}
+    histograms: Dict[str, Dict[tuple, dict]] = {name: {} for name in HISTOGRAM_BUCKETS}
+    for snapshot in snapshots:
+        for key, n in snapshot.get("calls", []):
+            calls[tuple(key)] = calls.get(tuple(key), 0) + n
+        for name, series in snapshot.get("counters", {}).items():
+            if name not in counters:
+                continue
+            for key, n in series:
+                counters[name][tuple(key)] = counters[name].get(tuple(key), 0) + n
+        for name, series in snapshot.get("histograms", {}).items():
+            if name not in histograms:
+                continue
+            for key, h in series:
+                merged = histograms[name].setdefault(tuple(key), _new_histogram(name))
+                merged["buckets"] = [a + b for a, b in zip(merged["buckets"], h["buckets"])]
+                merged["sum"] += h["sum"]
+                merged["count"] += h["count"]
+    return {"calls": calls, "counters": counters, "histograms": histograms}
+
+
+def read_snapshots(directory: str, exclude: Optional[str] = None) -> List[dict]:
+    """Snapshots written by other processes (unreadable or half-written files are skipped)"""
+    snapshots = []
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        if exclude and os.path.abspath(path) == os.path.abspath(exclude):
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def _format_labels(key: tuple, names=LABELS, extra: str = "") -> str:
+    parts = []
+    for name, value in zip(names, key):
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{name}="{escaped}"')
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}"
+
+
+def _format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(merged: dict) -> str:
+    """Prometheus text exposition format (version 0.0.4)"""
+    lines = [
+        f"# HELP {METRIC_PREFIX}_calls_total LLM calls by outcome",
+        f"# TYPE {METRIC_PREFIX}_calls_total counter",
+    ]
+    for key, n in sorted(merged["calls"].items()):
+        lines.append(f"{METRIC_PREFIX}_calls_total{_format_labels(key, LABELS + ('outcome',))} {n}")
+    for name, help_text in COUNTERS.items():
+        metric = f"{METRIC_PREFIX}_{name}_total"
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+        for key, n in sorted(merged["counters"][name].items()):
+            lines.append(f"{metric}{_format_labels(key)} {n}")
+    for name, bounds in HISTOGRAM_BUCKETS.items():
+        metric = f"{METRIC_PREFIX}_{name}"
+        lines += [f"# HELP {metric} {HISTOGRAM_HELP[name]}", f"# TYPE {metric} histogram"]
+        for key, h in sorted(merged["histograms"][name].items()):
+            cumulative = 0
+            for bound, n in zip(list(bounds) + ["+Inf"], h["buckets"]):
+                cumulative += n
+                le = bound if bound == "+Inf" else _format_value(float(bound))
+                bucket_labels = _format_labels(key, extra='le="%s"' % le)
+                lines.append(f"{metric}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{metric}_sum{_format_labels(key)} {_format_value(float(h['sum']))}")
+            lines.append(f"{metric}_count{_format_labels(key)} {h['count']}")
+    return "\n".join(lines) + "\n"
+
+
+# Process-wide telemetry shared by every agent
+telemetry = Telemetry()
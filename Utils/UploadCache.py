@@ -0,0 +1,142 @@
+"""
+Content-hash cache for uploaded report PDFs.
+
+The same referral PDF is often uploaded several times (to preview the parsed
+fields, then again after a correction). Entries are keyed by the SHA-256 of the
+PDF bytes, computed while the upload is spooled, and kept in a `DiskCache`
+(SQLite, TTL expiry, size-bounded LRU eviction). Two kinds of entry are stored
+separately:
+
+- `text`: the text pdfplumber extracted, reused whatever the parser settings;
+- `fields`: the parsed field dict, keyed also by the parser version (rules,
+  synonym table, model and threshold), so changing any of them re-parses the
+  cached text instead of serving stale fields.
+
+Lookups are counted per kind and exported on /metrics.
+"""
+import json
+import os
+from threading import Lock
+from typing import Dict, Optional
+
+from Utils.ResponseCache import DiskCache
+
+METRIC_PREFIX = "medaura_upload_cache"
+KINDS = ("text", "fields")
+
+
+class UploadCache:
+    def __init__(self, disk_cache: Optional[DiskCache]):
+        self.disk_cache = disk_cache
+        self._lock = Lock()
+        self.hits: Dict[str, int] = {kind: 0 for kind in KINDS}
+        self.misses: Dict[str, int] = {kind: 0 for kind in KINDS}
+
+    @property
+    def enabled(self) -> bool:
+        return self.disk_cache is not None
+
+    def _get(self, kind: str, key: str) -> Optional[bytes]:
+        if not self.enabled:
+            return None
+        value = self.disk_cache.get(key)
+        with self._lock:
+            if value is None:
+                self.misses[kind] += 1
+            else:
+                self.hits[kind] += 1
+        return value
+
+    def get_text(self, digest: str) -> Optional[str]:
+        value = self._get("text", f"text:{digest}")
+        return value.decode("utf-8") if value is not None else None
+
+    def set_text(self, digest: str, text: str):
+        if self.enabled:
+            self.disk_cache.set(f"text:{digest}", text.encode("utf-8"))
+
+    def get_fields(self, digest: str, version: str) -> Optional[dict]:
+        value = self._get("fields", f"fields:{version}:{digest}")
+        return json.loads(value) if value is not None else None
+
+    def set_fields(self, digest: str, version: str, fields: dict):
+        if self.enabled:
+            self.disk_cache.set(f"fields:{version}:{digest}", json.dumps(fields, separators=(",", ":")).encode("utf-8"))
+
+    def stats(self) -> dict:
+        if not self.enabled:
+            return {"enabled": False}
+        with self._lock:
+            kinds = {
+                kind: {
+                    "hits": self.hits[kind],
+                    "misses": self.misses[kind],
+                    "hit_rate": round(self.hits[kind] / (self.hits[kind] + self.misses[kind]), 3)
+                    if self.hits[kind] + self.misses[kind] else 0.0,
+                }
+                for kind in KINDS
+            }
+        disk = self.disk_cache.stats()
+        return {
+            "enabled": True,
+            **kinds,
+            "writes": disk["writes"],
+            "evictions": disk["evictions"],
+            "entries": disk["entries"],
+            "size_bytes": disk["size_bytes"],
+            "max_bytes": disk["max_bytes"],
+        }
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format, appended to the other metrics on /metrics"""
+        stats = self.stats()
+        if not stats["enabled"]:
+            return ""
+        lines = [
+            f"# HELP {METRIC_PREFIX}_lookups_total Upload cache lookups by entry kind and result",
+            f"# TYPE {METRIC_PREFIX}_lookups_total counter",
+        ]
+        for kind in KINDS:
+            lines.append(f'{METRIC_PREFIX}_lookups_total{{kind="{kind}",result="hit"}} {stats[kind]["hits"]}')
+            lines.append(f'{METRIC_PREFIX}_lookups_total{{kind="{kind}",result="miss"}} {stats[kind]["misses"]}')
+        lines += [
+            f"# HELP {METRIC_PREFIX}_hit_ratio Share of upload cache lookups that were hits",
+            f"# TYPE {METRIC_PREFIX}_hit_ratio gauge",
+        ]
+        for kind in KINDS:
+            lines.append(f'{METRIC_PREFIX}_hit_ratio{{kind="{kind}"}} {stats[kind]["hit_rate"]}')
+        lines += [
+            f"# HELP {METRIC_PREFIX}_evictions_total Entries evicted to stay under the size limit",
+            f"# TYPE {METRIC_PREFIX}_evictions_total counter",
+            f"{METRIC_PREFIX}_evictions_total {stats['evictions']}",
+            f"# HELP {METRIC_PREFIX}_size_bytes Bytes held by the upload cache",
+            f"# TYPE {METRIC_PREFIX}_size_bytes gauge",
+            f"{METRIC_PREFIX}_size_bytes {stats['size_bytes']}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+_upload_cache: Optional[UploadCache] = None
+_upload_cache_lock = Lock()
+
+
+def get_upload_cache() -> UploadCache:
+    """Process-wide upload cache (configured from the environment on first use)"""
+    global _upload_cache
+    if _upload_cache is None:
+        with _upload_cache_lock:
+            if _upload_cache is None:
+                _upload_cache = _create_upload_cache()
+    return _upload_cache
+
+
+def _create_upload_cache() -> UploadCache:
+    if os.getenv("UPLOAD_CACHE_ENABLED", "1").lower() in ("0", "false", "no"):
+        return UploadCache(None)
+    return UploadCache(
+        DiskCache(
+            os.getenv("UPLOAD_CACHE_PATH", os.path.join(".cache", "uploads.sqlite3")),
+            ttl_seconds=float(os.getenv("UPLOAD_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+            max_bytes=int(os.getenv("UPLOAD_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+        )
+    )
@@ -1,32 +1,32 @@
 """
 FastAPI server for MedAuraAI - Medical Diagnostics API
 """
-from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks
+from fastapi import FastAPI, HTTPException, UploadFile, File, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
 from datetime import datetime
+import asyncio
+import base64
+import hashlib
 import json
+import multiprocessing
 import os
+import socket
 import uuid
-import io
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-import pdfplumber
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.prompts import PromptTemplate
-from langchain_core.output_parsers import JsonOutputParser
-
-from Utils.Agents import (
-    Internist,
-    Neurologist,
-    Cardiologist,
-    Gastroenterologist,
-    Psychiatrist,
-    MultidisciplinaryTeam,
-    TeamSummary,
-)
+
+from Utils.LLMClients import get_chat_model, llm_clients, warm_up_agent_clients
+from Utils.Orchestrator import load_agent_api_keys, run_case_pipeline
+from Utils.RateLimiter import rate_limiter
+from Utils.Telemetry import merge_snapshots, read_snapshots, render_prometheus, telemetry
+from Utils.ResponseCache import get_response_cache
+from Utils.CaseStore import CaseWriter, create_case_store
+from Utils.JobQueue import QueueFullError, create_job_queue
+from Utils.PDFExtraction import PDFError, pdf_extractor, spool_upload
+from Utils.ReportParser import parse_medical_report, parser_version
+from Utils.UploadCache import get_upload_cache
 
 # Load environment variables
 load_dotenv(dotenv_path='apikey.env')
@@ -42,10 +42,40 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In-memory storage (replace with database in production)
-cases_db: Dict[str, dict] = {}
+# Persistent case storage (SQLite); cases_data/*.json is imported once on first start
 cases_dir = "cases_data"
 os.makedirs(cases_dir, exist_ok=True)
+case_store = create_case_store()
+# Saves are applied by a writer thread; progress updates of a case made in quick succession are coalesced
+case_writer = CaseWriter(case_store, coalesce_seconds=float(os.getenv("CASE_WRITE_COALESCE_SECONDS", "0.05")))
+
+# Durable job queue; case processing runs in JOB_WORKERS worker processes
+# (or on the server's own event loop when JOB_WORKERS=0)
+job_queue = create_job_queue()
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "8"))
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "1"))
+JOB_RETRY_BASE_DELAY_SECONDS = float(os.getenv("JOB_RETRY_BASE_DELAY_SECONDS", "5"))
+worker_processes: List[multiprocessing.Process] = []
+if JOB_WORKERS > 0:
+    # The server and its workers share one set of rate-limit buckets per key; the
+    # spawned workers inherit the variable (and re-import this module)
+    os.environ.setdefault("LLM_RATE_LIMIT_PATH", os.path.join(cases_dir, "ratelimit.sqlite3"))
+
+# Worker processes write their LLM call metrics here; GET /metrics merges them
+TELEMETRY_DIR = os.getenv("TELEMETRY_DIR", os.path.join(cases_dir, "telemetry"))
+
+# Model used for the report fields the rule-based parser is unsure of
+REPORT_PARSER_MODEL = "gemini-pro"
+REPORT_PARSER_TEMPERATURE = 0.1
+# Less extracted text than this means a scanned or broken PDF; it is rejected and not cached
+MIN_REPORT_TEXT_CHARS = 50
+# Create the shared LLM clients at startup instead of on the first request
+LLM_WARMUP = os.getenv("LLM_WARMUP", "1").lower() not in ("0", "false", "no")
+# "individual" (one call per specialist) or "panel" (one call for all five, see Utils.Orchestrator)
+SPECIALIST_MODE = os.getenv("SPECIALIST_MODE", "individual")
+# "separate" (team summary, then treatment options) or "fused" (both from one call)
+TEAM_MODE = os.getenv("TEAM_MODE", "separate")
 
 # Pydantic models
 class CaseCreate(BaseModel):
@@ -75,6 +105,22 @@ class CaseResponse(BaseModel):
     createdAt: str
     updatedAt: str
     agentResults: Optional[Dict] = None
+    queuePosition: Optional[int] = None
+
+# Fields returned by GET /api/cases unless ?fields= asks for others
+LIST_DEFAULT_FIELDS = ["id", "patientId", "name", "age", "gender", "chiefComplaint", "status", "createdAt", "updatedAt"]
+LIST_MAX_LIMIT = 200
+
+def encode_cursor(key) -> str:
+    """Opaque cursor for the (createdAt, id) keyset position"""
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, case_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(created_at), str(case_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 def build_medical_report(case_data: dict) -> str:
     """Build a medical report string from case data"""
@@ -117,142 +163,321 @@ def build_medical_report(case_data: dict) -> str:
     
     return "\n".join(report_parts)
 
-def run_agents_for_case(case_id: str, medical_report: str):
-    """Run all AI agents for a case in the background"""
+async def run_agents_for_case(case_id: str, final_attempt: bool = True):
+    """Run all AI agents for a case, persisting and publishing each result as it arrives"""
     try:
-        case = cases_db.get(case_id)
+        case = await asyncio.to_thread(case_store.get, case_id, include_results=False)
         if not case:
             return
         
         case["status"] = "Running"
-        save_case_to_file(case_id, case)
-        
-        # Load API keys
-        agent_api_keys = {
-            "Internist": os.getenv("INTERNIST_API_KEY") or os.getenv("GOOGLE_API_KEY"),
-            "Neurologist": os.getenv("NEUROLOGIST_API_KEY") or os.getenv("GOOGLE_API_KEY"),
-            "Cardiologist": os.getenv("CARDIOLOGIST_API_KEY") or os.getenv("GOOGLE_API_KEY"),
-            "Gastroenterologist": os.getenv("GASTROENTEROLOGIST_API_KEY") or os.getenv("GOOGLE_API_KEY"),
-            "Psychiatrist": os.getenv("PSYCHIATRIST_API_KEY") or os.getenv("GOOGLE_API_KEY"),
-        }
-        
-        # Initialize agents
-        agents = {
-            "Internist": Internist(medical_report, api_key=agent_api_keys["Internist"]),
-            "Neurologist": Neurologist(medical_report, api_key=agent_api_keys["Neurologist"]),
-            "Cardiologist": Cardiologist(medical_report, api_key=agent_api_keys["Cardiologist"]),
-            "Gastroenterologist": Gastroenterologist(medical_report, api_key=agent_api_keys["Gastroenterologist"]),
-            "Psychiatrist": Psychiatrist(medical_report, api_key=agent_api_keys["Psychiatrist"])
-        }
+        case.pop("error", None)
+        case["agentResults"] = {"specialists": {}, "teamSummary": None, "treatmentOptions": None}
+        case["updatedAt"] = datetime.utcnow().isoformat()
+        await persist_case(case)
+        case_writer.clear_events(case_id)
+        publish_case_event(case_id, "status", {"status": "Running", "updatedAt": case["updatedAt"]})
+        medical_report = build_medical_report(case)
         
-        # Run agents concurrently
-        responses = {}
-        def get_response(agent_name, agent):
-            try:
-                print(f"[API] Starting {agent_name} agent...")
-                response = agent.run()
-                if response is None:
+        def on_result(stage, agent_name, payload):
+            if stage == "partial":
+                # Streamed entries are only published; the full report is saved when it completes
+                publish_case_event(case_id, "partial", {"agent": agent_name, **payload})
+                return
+            if stage == "specialist":
+                if payload is None:
                     print(f"[API] WARNING: {agent_name} returned None - agent may have failed")
                 else:
                     print(f"[API] {agent_name} completed successfully")
-                return agent_name, response
-            except Exception as e:
-                print(f"[API] ERROR: {agent_name} failed with exception: {e}")
-                import traceback
-                traceback.print_exc()
-                return agent_name, None
-        
-        with ThreadPoolExecutor() as executor:
-            futures = {executor.submit(get_response, name, agent): name for name, agent in agents.items()}
-            for future in as_completed(futures):
-                try:
-                    agent_name, response = future.result()
-                    if response is None:
-                        print(f"[API] WARNING: Storing None for {agent_name} - check logs above for errors")
-                    responses[agent_name] = response.model_dump() if response else None
-                except Exception as e:
-                    print(f"[API] ERROR: Failed to get result for agent: {e}")
-                    import traceback
-                    traceback.print_exc()
+                case["agentResults"]["specialists"][agent_name] = payload
+            else:
+                case["agentResults"][stage] = payload
+            case["updatedAt"] = datetime.utcnow().isoformat()
+            save_case(case)
+            publish_case_event(case_id, stage, {"agent": agent_name, "result": payload})
         
-        # Run multidisciplinary team
-        team_api_key = os.getenv("MULTIDISCIPLINARYTEAM_API_KEY") or os.getenv("GOOGLE_API_KEY")
-        team_agent = MultidisciplinaryTeam(
-            medical_report=medical_report,
-            internist_report=json.dumps(responses.get("Internist", {}), indent=2),
-            neurologist_report=json.dumps(responses.get("Neurologist", {}), indent=2),
-            cardiologist_report=json.dumps(responses.get("Cardiologist", {}), indent=2),
-            gastroenterologist_report=json.dumps(responses.get("Gastroenterologist", {}), indent=2),
-            psychiatrist_report=json.dumps(responses.get("Psychiatrist", {}), indent=2),
-            structured_reports_json=json.dumps(responses, indent=2),
-            api_key=team_api_key
+        # Specialists run concurrently, then team synthesis and treatment plan
+        agent_results = await run_case_pipeline(
+            medical_report, on_result=on_result, specialist_mode=SPECIALIST_MODE, team_mode=TEAM_MODE
         )
         
-        team_summary = team_agent.run()
-        team_summary_dict = team_summary.model_dump() if team_summary else None
-        
-        # Generate treatment plan
-        treatment_options = None
-        if team_summary:
-            treatment_options = team_agent.generate_treatment_plan_json(team_summary)
-        
         # Update case with results
         case["status"] = "Completed"
-        case["agentResults"] = {
-            "specialists": responses,
-            "teamSummary": team_summary_dict,
-            "treatmentOptions": treatment_options
-        }
+        case["agentResults"] = agent_results
         case["updatedAt"] = datetime.utcnow().isoformat()
         
-        save_case_to_file(case_id, case)
+        await persist_case(case)
+        publish_case_event(case_id, "completed", {
+            "status": "Completed",
+            "updatedAt": case["updatedAt"],
+            "agentResults": agent_results,
+        })
         
     except Exception as e:
-        case = cases_db.get(case_id)
+        await record_case_error(case_id, str(e), final_attempt)
+        print(f"Error processing case {case_id}: {e}")
+        raise
+
+async def record_case_error(case_id: str, error: str, final_attempt: bool = True):
+    """Store a failed run's error on the case and publish it (status "Error", or "Queued" if it will be retried)"""
+    # Read the case only once its progress updates have been written
+    await asyncio.wrap_future(case_writer.flush())
+    case = await asyncio.to_thread(case_store.get, case_id)
+    if not case:
+        return
+    # A job that will be retried stays queued; only the last attempt reports the error
+    case["status"] = "Error" if final_attempt else "Queued"
+    case["error"] = error
+    case["updatedAt"] = datetime.utcnow().isoformat()
+    await persist_case(case)
+    # Not "error": EventSource reserves that name for connection errors
+    publish_case_event(case_id, "failed" if final_attempt else "status", {
+        "status": case["status"],
+        "error": case["error"],
+        "updatedAt": case["updatedAt"],
+    })
+
+async def reap_expired_jobs():
+    """Fail the jobs whose final attempt died without reporting back, and their cases"""
+    for job in await asyncio.to_thread(job_queue.reap_expired):
+        print(f"Job {job['id']} for case {job['case_id']} failed: {job['last_error']}")
+        await record_case_error(job["case_id"], job["last_error"])
+
+def publish_case_event(case_id: str, event_type: str, data: dict):
+    """Queue a progress event for the case writer; GET /api/cases/{case_id}/events streams it to clients"""
+    return case_writer.append_event(case_id, event_type, data)
+
+def report_hash(medical_report: str) -> str:
+    """Content hash used to coalesce identical executions"""
+    return hashlib.sha256(medical_report.encode("utf-8")).hexdigest()
+
+def enqueue_case(case: dict, priority: int = 0, supersede: bool = False):
+    """
+    Queue a case for processing (single-flight per case); returns (job, created).
+    
+    Answers 429 when the queue is full.
+    """
+    try:
+        return job_queue.enqueue(
+            case["id"],
+            {"kind": "run_agents"},
+            priority=priority,
+            report_hash=report_hash(build_medical_report(case)),
+            supersede=supersede,
+        )
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+
+async def process_job(job: dict, worker_id: str):
+    """Run one claimed job, keeping its lease alive and honouring supersede requests"""
+    run = asyncio.create_task(
+        run_agents_for_case(job["case_id"], final_attempt=job["attempts"] >= job["max_attempts"])
+    )
+    
+    async def watch():
+        last_heartbeat = asyncio.get_running_loop().time()
+        while not run.done():
+            await asyncio.sleep(JOB_POLL_INTERVAL_SECONDS)
+            if await asyncio.to_thread(job_queue.cancel_requested, job["id"]):
+                run.cancel()
+                return
+            now = asyncio.get_running_loop().time()
+            if now - last_heartbeat >= job_queue.visibility_timeout / 3:
+                await asyncio.to_thread(job_queue.heartbeat, job["id"], worker_id)
+                last_heartbeat = now
+    
+    watcher = asyncio.create_task(watch())
+    try:
+        await run
+        if not await asyncio.to_thread(job_queue.complete, job["id"], worker_id):
+            print(f"[Worker {worker_id}] Job {job['id']} finished after its lease passed to another worker")
+    except asyncio.CancelledError:
+        if not run.cancelled():
+            raise
+        # Superseded by a newer run of the same case, which is already queued. Progress
+        # saved before the cancel landed may have overwritten its "Queued" status; the
+        # new job is not claimed until this one is marked cancelled, so restore it first.
+        await asyncio.wrap_future(case_writer.flush())
+        case = await asyncio.to_thread(case_store.get, job["case_id"], include_results=False)
         if case:
-            case["status"] = "Error"
-            case["error"] = str(e)
+            case["status"] = "Queued"
             case["updatedAt"] = datetime.utcnow().isoformat()
-            save_case_to_file(case_id, case)
-        print(f"Error processing case {case_id}: {e}")
+            await persist_case(case)
+            publish_case_event(job["case_id"], "status", {"status": "Queued", "updatedAt": case["updatedAt"]})
+        await asyncio.to_thread(job_queue.mark_cancelled, job["id"], worker_id)
+        print(f"[Worker {worker_id}] Job {job['id']} for case {job['case_id']} superseded")
+    except Exception as e:
+        delay = JOB_RETRY_BASE_DELAY_SECONDS * 2 ** (job["attempts"] - 1)
+        if await asyncio.to_thread(job_queue.fail, job["id"], worker_id, str(e), retry_delay=delay):
+            print(f"[Worker {worker_id}] Job {job['id']} failed (attempt {job['attempts']}), retrying in {delay:.0f}s")
+    finally:
+        watcher.cancel()
+        # Publish this job's calls to GET /metrics without waiting for the next one
+        telemetry.flush()
+
+async def run_job_worker(worker_id: str):
+    """Claim and run jobs forever, at most JOB_WORKER_CONCURRENCY at a time"""
+    in_flight = set()
+    while True:
+        await reap_expired_jobs()
+        while len(in_flight) < JOB_WORKER_CONCURRENCY:
+            job = await asyncio.to_thread(job_queue.claim, worker_id)
+            if job is None:
+                break
+            task = asyncio.create_task(process_job(job, worker_id))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        await asyncio.sleep(JOB_POLL_INTERVAL_SECONDS)
 
-def save_case_to_file(case_id: str, case: dict):
-    """Save case to JSON file"""
-    file_path = os.path.join(cases_dir, f"{case_id}.json")
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(case, f, indent=2)
-
-def load_case_from_file(case_id: str) -> Optional[dict]:
-    """Load case from JSON file"""
-    file_path = os.path.join(cases_dir, f"{case_id}.json")
-    if os.path.exists(file_path):
-        with open(file_path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return None
-
-# Load existing cases on startup
-def load_existing_cases():
-    """Load all cases from files"""
-    if os.path.exists(cases_dir):
-        for filename in os.listdir(cases_dir):
-            if filename.endswith(".json"):
-                case_id = filename[:-5]
-                case = load_case_from_file(case_id)
-                if case:
-                    cases_db[case_id] = case
+def job_worker_main():
+    """Entry point of a worker process"""
+    load_dotenv(dotenv_path='apikey.env')
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    print(f"[Worker {worker_id}] started")
+    telemetry.enable_snapshots(TELEMETRY_DIR)
+    if LLM_WARMUP:
+        warm_up_agent_clients(load_agent_api_keys().values())
+    try:
+        asyncio.run(run_job_worker(worker_id))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        case_writer.close()
+
+def worker_is_alive(worker_id: str) -> bool:
+    """Whether the process holding a job lease still exists (other hosts are assumed alive)"""
+    host, _, pid = worker_id.rpartition(":")
+    if host != socket.gethostname():
+        return True
+    if not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def save_case(case: dict):
+    """
+    Queue a case (and its agent results) for the case writer and return at once.
+    
+    Used for progress updates, which may be coalesced with the next save of
+    the same case; use `persist_case` when the write must have happened.
+    """
+    return case_writer.save(case)
+
+async def persist_case(case: dict):
+    """Save a case and wait until it is written, without blocking the event loop"""
+    await asyncio.wrap_future(case_writer.save(case, urgent=True))
 
 @app.on_event("startup")
 async def startup_event():
-    load_existing_cases()
-    print(f"Loaded {len(cases_db)} existing cases")
+    # Metrics restart with the server: drop snapshots left by previous worker processes
+    if os.path.isdir(TELEMETRY_DIR):
+        for filename in os.listdir(TELEMETRY_DIR):
+            os.remove(os.path.join(TELEMETRY_DIR, filename))
+    
+    imported = await asyncio.to_thread(case_store.import_json_dir, cases_dir)
+    if imported:
+        print(f"Imported {imported} cases from {cases_dir}/")
+    print(f"Case store has {case_store.count()} cases")
+    
+    # Jobs that were running when a previous server died go back in the queue
+    for case_id in await asyncio.to_thread(job_queue.requeue_running, worker_is_alive):
+        case = await asyncio.to_thread(case_store.get, case_id, include_results=False)
+        if case and case.get("status") == "Running":
+            case["status"] = "Queued"
+            await persist_case(case)
+        print(f"Requeued interrupted job for case {case_id}")
+    
+    if LLM_WARMUP:
+        google_api_key = os.getenv("GOOGLE_API_KEY")
+        if google_api_key:
+            llm_clients.warm_up([("gemini", REPORT_PARSER_MODEL, google_api_key, REPORT_PARSER_TEMPERATURE)])
+        if JOB_WORKERS == 0:
+            # Agents run in this process
+            warm_up_agent_clients(load_agent_api_keys().values())
+        print(f"Warmed up {llm_clients.stats()['clients']} LLM clients")
+    
+    if JOB_WORKERS > 0:
+        context = multiprocessing.get_context("spawn")
+        for _ in range(JOB_WORKERS):
+            process = context.Process(target=job_worker_main, daemon=True)
+            process.start()
+            worker_processes.append(process)
+    else:
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        app.state.worker_task = asyncio.create_task(run_job_worker(worker_id))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for process in worker_processes:
+        process.terminate()
+    for process in worker_processes:
+        process.join(timeout=5)
+    worker_task = getattr(app.state, "worker_task", None)
+    if worker_task:
+        worker_task.cancel()
+    pdf_extractor.shutdown()
+    case_writer.close()
 
 # API Endpoints
 @app.get("/")
 async def root():
     return {"message": "MedAuraAI API", "version": "1.0.0"}
 
+@app.get("/api/rate-limits")
+async def rate_limit_stats():
+    """Queue wait statistics for each API key/model bucket"""
+    return {"buckets": rate_limiter.stats()}
+
+@app.get("/api/llm-cache")
+async def llm_cache_stats():
+    """Hit/miss counters and size of the LLM response cache"""
+    return get_response_cache().stats()
+
+@app.get("/metrics")
+async def metrics():
+    """LLM call metrics of this process and all worker processes, plus PDF extraction and upload cache metrics, in Prometheus text format"""
+    snapshots = [telemetry.snapshot()] + read_snapshots(TELEMETRY_DIR, exclude=telemetry.snapshot_path())
+    return Response(
+        content=(
+            render_prometheus(merge_snapshots(snapshots))
+            + pdf_extractor.metrics.render_prometheus()
+            + get_upload_cache().render_prometheus()
+        ),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+@app.get("/api/llm-clients")
+async def llm_client_stats():
+    """Shared LLM client pool of the API server process (workers keep their own)"""
+    return llm_clients.stats()
+
+@app.get("/api/pdf-extraction")
+async def pdf_extraction_stats():
+    """Documents, pages and extraction times of uploaded PDFs"""
+    return pdf_extractor.metrics.stats()
+
+@app.get("/api/upload-cache")
+async def upload_cache_stats():
+    """Hit rates and size of the cache of extracted and parsed report PDFs"""
+    return get_upload_cache().stats()
+
+@app.get("/api/queue")
+async def queue_stats():
+    """Job counts by state"""
+    return await asyncio.to_thread(job_queue.stats)
+
+@app.get("/api/case-writer")
+async def case_writer_stats():
+    """Saves, coalesced saves and write batches of the case writer in this process"""
+    return case_writer.stats()
+
 @app.post("/api/cases", response_model=CaseResponse)
-async def create_case(case_data: CaseCreate, background_tasks: BackgroundTasks):
+async def create_case(case_data: CaseCreate, priority: int = 0):
     """Create a new medical case"""
     case_id = str(uuid.uuid4())
     now = datetime.utcnow().isoformat()
@@ -279,322 +504,220 @@ async def create_case(case_data: CaseCreate, background_tasks: BackgroundTasks):
         "agentResults": None
     }
     
-    cases_db[case_id] = case
-    save_case_to_file(case_id, case)
+    # Written before the job is queued: a worker process reads it from the store
+    await persist_case(case)
     
-    # Build medical report and run agents in background
-    medical_report = build_medical_report(case)
-    background_tasks.add_task(run_agents_for_case, case_id, medical_report)
+    # Agents run in a worker once the job is claimed
+    try:
+        job, _ = await asyncio.to_thread(enqueue_case, case, priority=priority)
+    except HTTPException:
+        await asyncio.to_thread(case_store.delete, case_id)
+        raise
+    publish_case_event(case_id, "status", {"status": "Queued", "updatedAt": now})
     
-    return CaseResponse(**case)
+    return CaseResponse(**case, queuePosition=await asyncio.to_thread(job_queue.position, job["id"]))
 
 @app.get("/api/cases")
-async def list_cases(status: Optional[str] = None):
-    """List all cases, optionally filtered by status"""
-    cases = list(cases_db.values())
-    
-    if status and status.lower() != "all":
-        cases = [c for c in cases if c.get("status", "").lower() == status.lower()]
-    
-    # Sort by creation date (newest first)
-    cases.sort(key=lambda x: x.get("createdAt", ""), reverse=True)
-    
-    return {"items": cases, "total": len(cases)}
+async def list_cases(
+    request: Request,
+    status: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=LIST_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    """
+    List cases newest first, optionally filtered by status.
+
+    Results are paginated with an opaque `cursor` (pass back `nextCursor`).
+    `fields` is a comma-separated projection; agentResults is only included
+    when requested explicitly (or with `fields=*`).
+    """
+    if status and status.lower() == "all":
+        status = None
+    after = decode_cursor(cursor) if cursor else None
+    if fields == "*":
+        projection = None
+    else:
+        projection = [f.strip() for f in fields.split(",") if f.strip()] if fields else LIST_DEFAULT_FIELDS
+    include_results = projection is None or "agentResults" in projection
+    
+    # Let pollers skip re-downloading an unchanged listing
+    total, last_updated = await asyncio.to_thread(case_store.version, status)
+    etag_source = f"{total}|{last_updated}|{status}|{limit}|{cursor}|{fields}"
+    etag = 'W/"' + hashlib.sha1(etag_source.encode("utf-8")).hexdigest() + '"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    # Ordered by the (createdAt, id) index; no sorting in Python
+    cases, next_key = await asyncio.to_thread(
+        case_store.list_page, status=status, limit=limit, after=after, include_results=include_results
+    )
+    if projection is not None:
+        cases = [{f: c.get(f) for f in projection} for c in cases]
+    
+    return JSONResponse(
+        {"items": cases, "total": total, "nextCursor": encode_cursor(next_key) if next_key else None},
+        headers={"ETag": etag},
+    )
 
 @app.get("/api/cases/{case_id}", response_model=CaseResponse)
 async def get_case(case_id: str):
     """Get a specific case by ID"""
-    case = cases_db.get(case_id)
+    case = await asyncio.to_thread(case_store.get, case_id)
     if not case:
-        # Try loading from file
-        case = load_case_from_file(case_id)
-        if case:
-            cases_db[case_id] = case
-        else:
-            raise HTTPException(status_code=404, detail="Case not found")
+        raise HTTPException(status_code=404, detail="Case not found")
     
     return CaseResponse(**case)
 
-@app.post("/api/cases/{case_id}/rerun")
-async def rerun_agents(case_id: str, background_tasks: BackgroundTasks):
-    """Rerun AI agents for a case"""
-    case = cases_db.get(case_id)
+SSE_POLL_INTERVAL_SECONDS = float(os.getenv("SSE_POLL_INTERVAL_SECONDS", "0.5"))
+SSE_KEEPALIVE_SECONDS = 15
+TERMINAL_EVENTS = {"completed", "failed"}
+
+def format_sse(event_id: int, event_type: str, data) -> str:
+    return f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+@app.get("/api/cases/{case_id}/events")
+async def case_events(case_id: str, request: Request):
+    """
+    Server-Sent Events stream of a case's progress.
+    
+    A new connection first receives a `snapshot` event with the full case, then
+    `status`, `specialist`, `teamSummary` and `treatmentOptions` events as they
+    are persisted, and ends with `completed` or `failed`. Reconnects with
+    Last-Event-ID resume where the previous stream stopped.
+    """
+    # Read the event position before the snapshot so nothing falls in between
+    after = await asyncio.to_thread(case_store.last_event_id, case_id)
+    case = await asyncio.to_thread(case_store.get, case_id)
     if not case:
         raise HTTPException(status_code=404, detail="Case not found")
+    last_event_id = request.headers.get("last-event-id", "")
     
-    medical_report = build_medical_report(case)
-    background_tasks.add_task(run_agents_for_case, case_id, medical_report)
+    async def stream():
+        position = after
+        if last_event_id.isdigit():
+            position = int(last_event_id)
+        else:
+            yield format_sse(position, "snapshot", case)
+            if case.get("status") in ("Completed", "Error"):
+                return
+        idle = 0.0
+        while not await request.is_disconnected():
+            events = await asyncio.to_thread(case_store.events_since, case_id, position)
+            for event in events:
+                position = event["id"]
+                yield format_sse(event["id"], event["type"], event["data"])
+                if event["type"] in TERMINAL_EVENTS:
+                    return
+            idle = 0.0 if events else idle + SSE_POLL_INTERVAL_SECONDS
+            if idle >= SSE_KEEPALIVE_SECONDS:
+                yield ": keep-alive\n\n"
+                idle = 0.0
+            await asyncio.sleep(SSE_POLL_INTERVAL_SECONDS)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/api/cases/{case_id}/rerun")
+async def rerun_agents(case_id: str, priority: int = 0, mode: str = Query("attach", pattern="^(attach|supersede)$")):
+    """
+    Rerun AI agents for a case.
+    
+    Never starts a duplicate pipeline: if the case is already queued or running,
+    `mode=attach` (default) returns the existing job, while `mode=supersede`
+    cancels the running job and queues a fresh one.
+    """
+    case = await asyncio.to_thread(case_store.get, case_id, include_results=False)
+    if not case:
+        raise HTTPException(status_code=404, detail="Case not found")
     
-    return {"message": "Agents rerun initiated", "case_id": case_id}
+    job, created = await asyncio.to_thread(enqueue_case, case, priority=priority, supersede=(mode == "supersede"))
+    if created:
+        case["status"] = "Queued"
+        case["updatedAt"] = datetime.utcnow().isoformat()
+        await persist_case(case)
+        publish_case_event(case_id, "status", {"status": "Queued", "updatedAt": case["updatedAt"]})
+    
+    return {
+        "message": "Agents rerun initiated" if created else "Attached to the run already in progress",
+        "case_id": case_id,
+        "job_id": job["id"],
+        "attached": not created,
+        "queuePosition": await asyncio.to_thread(job_queue.position, job["id"]),
+    }
 
-def extract_text_from_pdf(pdf_bytes: bytes) -> str:
-    """Extract text from PDF bytes"""
-    try:
-        with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-            text_parts = []
-            for page in pdf.pages:
-                text = page.extract_text()
-                if text:
-                    text_parts.append(text)
-            return "\n\n".join(text_parts)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Error reading PDF: {str(e)}")
+async def extract_text_from_pdf(file: UploadFile) -> Tuple[str, str]:
+    """
+    Extract text from an uploaded PDF without blocking the event loop.
 
-def parse_medical_report_with_ai(text: str) -> dict:
-    """Use AI to extract structured data from medical report text"""
+    The upload is spooled to a temporary file in chunks, hashing it on the way,
+    and extracted in the PDF process pool (see `Utils.PDFExtraction`) unless
+    the upload cache already holds the text of a PDF with the same bytes.
+    Returns (text, SHA-256 of the PDF).
+    """
+    settings = pdf_extractor.settings
+    if file.size is not None and file.size > settings.max_bytes:
+        raise HTTPException(status_code=413, detail=f"PDF is larger than the {settings.max_bytes / (1024 * 1024):g}MB limit")
+    upload_cache = get_upload_cache()
+    digest = hashlib.sha256()
     try:
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
-            raise HTTPException(status_code=500, detail="GOOGLE_API_KEY not configured")
-        
-        llm = ChatGoogleGenerativeAI(
-            model="gemini-pro",
-            google_api_key=api_key,
-            temperature=0.1
-        )
-        
-        parser = JsonOutputParser()
-        
-        prompt = PromptTemplate(
-            template="""You are a medical data extraction specialist. Extract structured information from the following medical report text.
-
-Medical Report Text:
-{report_text}
-
-Extract the following fields and return as JSON. If a field is not found in the text, use an empty string or null as appropriate:
-- patientId: Patient ID or medical record number
-- name: Patient's full name
-- age: Patient's age (as integer, or null if not found)
-- gender: Patient's gender (Male/Female/Other)
-- chiefComplaint: Chief complaint or presenting symptoms
-- familyHistory: Family medical history
-- personalHistory: Personal medical history or past medical history
-- lifestyle: Lifestyle factors (smoking, alcohol, exercise, diet, etc.)
-- medications: Current medications
-- colonoscopy: Colonoscopy findings (if any)
-- stoolStudies: Stool study results (if any)
-- bloodTests: Blood test results or lab values
-- vitals: Vital signs (BP, HR, BMI, temperature, etc.)
-- abdominalExam: Abdominal examination findings (if any)
-
-Return ONLY valid JSON, no additional text or explanation.
-
-{format_instructions}""",
-            input_variables=["report_text"],
-            partial_variables={"format_instructions": parser.get_format_instructions()}
-        )
-        
-        chain = prompt | llm | parser
-        
-        result = chain.invoke({"report_text": text})
-        
-        # Ensure all expected fields are present
-        expected_fields = {
-            "patientId": "",
-            "name": "",
-            "age": None,
-            "gender": "",
-            "chiefComplaint": "",
-            "familyHistory": "",
-            "personalHistory": "",
-            "lifestyle": "",
-            "medications": "",
-            "colonoscopy": "",
-            "stoolStudies": "",
-            "bloodTests": "",
-            "vitals": "",
-            "abdominalExam": ""
-        }
-        
-        # Merge extracted data with defaults
-        extracted = {**expected_fields, **result}
-        
-        # Convert age to int if it's a string number
-        if isinstance(extracted.get("age"), str) and extracted["age"].isdigit():
-            extracted["age"] = int(extracted["age"])
-        elif extracted.get("age") == "":
-            extracted["age"] = None
-        
-        return extracted
-        
-    except Exception as e:
-        print(f"Error parsing with AI: {e}")
-        # Fallback: try simple text parsing
-        return parse_medical_report_simple(text)
-
-def parse_medical_report_simple(text: str) -> dict:
-    """Simple rule-based parsing as fallback"""
-    result = {
-        "patientId": "",
-        "name": "",
-        "age": None,
-        "gender": "",
-        "chiefComplaint": "",
-        "familyHistory": "",
-        "personalHistory": "",
-        "lifestyle": "",
-        "medications": "",
-        "colonoscopy": "",
-        "stoolStudies": "",
-        "bloodTests": "",
-        "vitals": "",
-        "abdominalExam": ""
-    }
-    
-    lines = text.split('\n')
-    text_lower = text.lower()
-    
-    # Extract patient ID
-    for line in lines:
-        if 'patient id' in line.lower() or 'patientid' in line.lower():
-            parts = line.split(':')
-            if len(parts) > 1:
-                result["patientId"] = parts[1].strip()
-    
-    # Extract name
-    for line in lines:
-        if line.lower().startswith('name:'):
-            result["name"] = line.split(':', 1)[1].strip()
-    
-    # Extract age
-    for line in lines:
-        if line.lower().startswith('age:'):
-            age_str = line.split(':', 1)[1].strip()
-            try:
-                result["age"] = int(age_str)
-            except:
-                pass
-    
-    # Extract gender
-    for line in lines:
-        if line.lower().startswith('gender:'):
-            result["gender"] = line.split(':', 1)[1].strip()
-    
-    # Extract chief complaint
-    if 'chief complaint' in text_lower:
-        start_idx = text_lower.find('chief complaint')
-        end_idx = text_lower.find('medical history', start_idx)
-        if end_idx == -1:
-            end_idx = text_lower.find('recent lab', start_idx)
-        if end_idx == -1:
-            end_idx = len(text)
-        complaint_text = text[start_idx:end_idx].split(':', 1)
-        if len(complaint_text) > 1:
-            result["chiefComplaint"] = complaint_text[1].strip()
-    
-    # Extract family history
-    if 'family history' in text_lower:
-        start_idx = text_lower.find('family history')
-        end_idx = text_lower.find('personal', start_idx)
-        if end_idx == -1:
-            end_idx = text_lower.find('lifestyle', start_idx)
-        if end_idx == -1:
-            end_idx = len(text)
-        history_text = text[start_idx:end_idx].split(':', 1)
-        if len(history_text) > 1:
-            result["familyHistory"] = history_text[1].strip()
-    
-    # Extract personal history
-    if 'personal' in text_lower and 'history' in text_lower:
-        start_idx = text_lower.find('personal')
-        end_idx = text_lower.find('lifestyle', start_idx)
-        if end_idx == -1:
-            end_idx = text_lower.find('medications', start_idx)
-        if end_idx == -1:
-            end_idx = len(text)
-        history_text = text[start_idx:end_idx].split(':', 1)
-        if len(history_text) > 1:
-            result["personalHistory"] = history_text[1].strip()
-    
-    # Extract lifestyle
-    if 'lifestyle' in text_lower:
-        start_idx = text_lower.find('lifestyle')
-        end_idx = text_lower.find('medications', start_idx)
-        if end_idx == -1:
-            end_idx = len(text)
-        lifestyle_text = text[start_idx:end_idx].split(':', 1)
-        if len(lifestyle_text) > 1:
-            result["lifestyle"] = lifestyle_text[1].strip()
-    
-    # Extract medications
-    if 'medications' in text_lower or 'medication' in text_lower:
-        start_idx = text_lower.find('medication')
-        end_idx = text_lower.find('recent lab', start_idx)
-        if end_idx == -1:
-            end_idx = text_lower.find('physical examination', start_idx)
-        if end_idx == -1:
-            end_idx = len(text)
-        med_text = text[start_idx:end_idx].split(':', 1)
-        if len(med_text) > 1:
-            result["medications"] = med_text[1].strip()
-    
-    # Extract colonoscopy
-    if 'colonoscopy' in text_lower:
-        for line in lines:
-            if 'colonoscopy' in line.lower():
-                parts = line.split(':', 1)
-                if len(parts) > 1:
-                    result["colonoscopy"] = parts[1].strip()
-    
-    # Extract stool studies
-    if 'stool' in text_lower:
-        for line in lines:
-            if 'stool' in line.lower():
-                parts = line.split(':', 1)
-                if len(parts) > 1:
-                    result["stoolStudies"] = parts[1].strip()
-    
-    # Extract blood tests
-    if 'blood' in text_lower or 'lab' in text_lower:
-        start_idx = text_lower.find('blood') if 'blood' in text_lower else text_lower.find('lab')
-        end_idx = text_lower.find('physical examination', start_idx)
-        if end_idx == -1:
-            end_idx = len(text)
-        lab_section = text[start_idx:end_idx]
-        result["bloodTests"] = lab_section.strip()
-    
-    # Extract vitals
-    if 'vital' in text_lower:
-        for line in lines:
-            if 'vital' in line.lower():
-                parts = line.split(':', 1)
-                if len(parts) > 1:
-                    result["vitals"] = parts[1].strip()
-    
-    # Extract abdominal exam
-    if 'abdominal' in text_lower:
-        for line in lines:
-            if 'abdominal' in line.lower():
-                parts = line.split(':', 1)
-                if len(parts) > 1:
-                    result["abdominalExam"] = parts[1].strip()
-    
-    return result
+        path = await asyncio.to_thread(spool_upload, file.file, settings, digest)
+        try:
+            pdf_hash = digest.hexdigest()
+            text = await asyncio.to_thread(upload_cache.get_text, pdf_hash)
+            if text is None:
+                text = await pdf_extractor.extract(path)
+                if len(text.strip()) >= MIN_REPORT_TEXT_CHARS:
+                    await asyncio.to_thread(upload_cache.set_text, pdf_hash, text)
+            return text, pdf_hash
+        finally:
+            os.remove(path)
+    except PDFError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+def report_parser_model():
+    """Model for fields the rule-based parser is unsure of (None without GOOGLE_API_KEY)"""
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        return None
+    return get_chat_model("gemini", REPORT_PARSER_MODEL, api_key, temperature=REPORT_PARSER_TEMPERATURE)
 
 @app.post("/api/cases/parse-report")
 async def parse_report(file: UploadFile = File(...)):
-    """Parse PDF report and extract structured data using AI"""
+    """Parse PDF report and extract structured data (rules first, AI for uncertain fields)"""
     if not file.filename or not file.filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are supported")
     
     try:
-        # Read PDF file
-        pdf_bytes = await file.read()
-        
-        if len(pdf_bytes) == 0:
-            raise HTTPException(status_code=400, detail="PDF file is empty")
-        
         # Extract text from PDF
-        report_text = extract_text_from_pdf(pdf_bytes)
+        report_text, pdf_hash = await extract_text_from_pdf(file)
         
-        if not report_text or len(report_text.strip()) < 50:
+        if not report_text or len(report_text.strip()) < MIN_REPORT_TEXT_CHARS:
             raise HTTPException(
                 status_code=400, 
                 detail="Could not extract sufficient text from PDF. The PDF may be scanned or corrupted."
             )
         
-        # Parse with AI
-        extracted_data = parse_medical_report_with_ai(report_text)
+        # The same PDF parsed with the same parser settings before
+        model = report_parser_model()
+        upload_cache = get_upload_cache()
+        version = parser_version(REPORT_PARSER_MODEL if model is not None else "")
+        cached = await asyncio.to_thread(upload_cache.get_fields, pdf_hash, version)
+        if cached is not None:
+            cached["extraction"]["cached"] = True
+            return cached
+
+        # Rule-based parse; only low-confidence fields go to the model
+        extracted_data = await parse_medical_report(
+            report_text, model, REPORT_PARSER_MODEL, api_key=os.getenv("GOOGLE_API_KEY")
+        )
+        # A failed model call is retried on the next upload rather than cached
+        if extracted_data["extraction"]["modelError"] is None:
+            await asyncio.to_thread(upload_cache.set_fields, pdf_hash, version, extracted_data)
+        extracted_data["extraction"]["cached"] = False
         
         return extracted_data
         
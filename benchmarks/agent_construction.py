@@ -0,0 +1,104 @@
+"""
+Micro-benchmark: cost of building the agents (and their prompts) for one case.
+
+Compares the previous behaviour, where every agent built a jinja2
+`PromptTemplate` that was recompiled on each `format()`, with the shared
+prompt registry. LLM clients come from the shared pool in both modes, and no
+model is called.
+
+Usage:
+    python benchmarks/agent_construction.py [--cases 200]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.prompts import PromptTemplate
+
+from Utils.Orchestrator import SPECIALISTS, build_team_agent
+from Utils.PromptRegistry import prompt_registry
+
+REPORT_PATH = os.path.join("Medical Reports", "Medical Report - Charles Baker - Prostate Cancer (Suspicion).txt")
+SPECIALIST_REPORT = {
+    "specialist": "Internist",
+    "primary_assessment": "Benchmark",
+    "overall_confidence": 50,
+    "key_findings": [],
+    "contradictions": [],
+    "recommendations": [],
+}
+TREATMENT_INPUT = {"overall_confidence": 50, "diagnoses": []}
+
+
+def build_case(medical_report, specialist_reports):
+    """Everything one case constructs and renders before calling the model"""
+    prompts = []
+    for cls in SPECIALISTS.values():
+        agent = cls(medical_report)
+        prompts.append(agent.build_prompt())
+    team = build_team_agent(medical_report, specialist_reports)
+    prompts.append(team.build_prompt())
+    prompts.append(team._build_treatment_json_prompt(TREATMENT_INPUT))
+    return prompts
+
+
+def legacy_prompt(compiled):
+    """The per-instance PromptTemplate agents used to create"""
+    return PromptTemplate(template=compiled.template, input_variables=list(compiled.input_variables), template_format="jinja2")
+
+
+def build_case_legacy(medical_report, specialist_reports):
+    # Swap each agent's shared prompts for fresh PromptTemplates, as the constructors used to
+    prompts = []
+    for cls in SPECIALISTS.values():
+        agent = cls(medical_report)
+        agent.prompt_template = legacy_prompt(agent.prompt_template)
+        prompts.append(agent.build_prompt())
+    team = build_team_agent(medical_report, specialist_reports)
+    team.prompt_template = legacy_prompt(team.prompt_template)
+    team.treatment_prompt_template = legacy_prompt(team.treatment_prompt_template)
+    team.treatment_json_prompt_template = legacy_prompt(team.treatment_json_prompt_template)
+    prompts.append(team.build_prompt())
+    prompts.append(team._build_treatment_json_prompt(TREATMENT_INPUT))
+    return prompts
+
+
+def measure(fn, cases, *args):
+    started = time.perf_counter()
+    for _ in range(cases):
+        fn(*args)
+    return (time.perf_counter() - started) / cases * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cases", type=int, default=200)
+    args = parser.parse_args()
+
+    with open(REPORT_PATH, "r", encoding="utf-8") as f:
+        medical_report = f.read()
+    specialist_reports = {name: dict(SPECIALIST_REPORT, specialist=name) for name in SPECIALISTS}
+
+    # Warm-up: creates the pooled clients and compiles the registry once
+    current = build_case(medical_report, specialist_reports)
+    legacy = build_case_legacy(medical_report, specialist_reports)
+    assert current == legacy, "registry prompts differ from PromptTemplate output"
+
+    legacy_ms = measure(build_case_legacy, args.cases, medical_report, specialist_reports)
+    registry_ms = measure(build_case, args.cases, medical_report, specialist_reports)
+
+    print(json.dumps({
+        "cases": args.cases,
+        "compiled_templates": len(prompt_registry),
+        "per_case_ms_before": round(legacy_ms, 3),
+        "per_case_ms_after": round(registry_ms, 3),
+        "speedup": round(legacy_ms / registry_ms, 1) if registry_ms else None,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark: case progress saves made directly vs through the CaseWriter.
+
+Simulates `--cases` concurrent runs that each save their case `--updates`
+times as agent results arrive (growing agentResults, as in the API server).
+Directly, every save blocks its caller (the event loop, in the server) for a
+full SQLite transaction. Through `CaseWriter` the caller only snapshots the
+case, and the writer thread coalesces each case's pending saves into one write.
+
+Usage:
+    python benchmarks/case_writes.py [--cases 20] [--updates 8] [--interval-ms 5]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Utils.CaseStore import CaseWriter, SqliteCaseStore
+
+SPECIALISTS = ("Internist", "Neurologist", "Cardiologist", "Gastroenterologist", "Psychiatrist")
+
+
+def specialist_report(role):
+    return {
+        "specialist": role,
+        "primary_assessment": "Findings consistent with the reported symptoms. " * 10,
+        "overall_confidence": 70,
+        "key_findings": [{"summary": "Finding " * 20, "quote": "Quote " * 20, "confidence": 60} for _ in range(6)],
+        "contradictions": [],
+        "recommendations": ["Recommendation " * 10 for _ in range(5)],
+    }
+
+
+def simulate(save, cases, updates, interval):
+    """Seconds the callers spent inside `save`"""
+    runs = [
+        {"id": f"case-{n}", "status": "Running", "createdAt": f"2025-01-01T00:00:{n:02d}", "updatedAt": "",
+         "agentResults": {"specialists": {}, "teamSummary": None, "treatmentOptions": None}}
+        for n in range(cases)
+    ]
+    blocked = 0.0
+    for update in range(updates):
+        for case in runs:
+            if update < len(SPECIALISTS):
+                case["agentResults"]["specialists"][SPECIALISTS[update]] = specialist_report(SPECIALISTS[update])
+            else:
+                case["agentResults"]["teamSummary"] = {"notes": ["Summary " * 50] * update}
+            case["updatedAt"] = f"2025-01-01T00:01:{update:02d}"
+            started = time.perf_counter()
+            save(case)
+            blocked += time.perf_counter() - started
+        time.sleep(interval)
+    return blocked
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cases", type=int, default=20, help="Concurrent case runs (default: 20)")
+    parser.add_argument("--updates", type=int, default=8, help="Saves per case (default: 8)")
+    parser.add_argument("--interval-ms", type=float, default=5, help="Time between rounds of updates (default: 5)")
+    args = parser.parse_args()
+    interval = args.interval_ms / 1000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        direct_store = SqliteCaseStore(os.path.join(tmp, "direct.sqlite3"))
+        direct = simulate(direct_store.save, args.cases, args.updates, interval)
+
+        writer = CaseWriter(SqliteCaseStore(os.path.join(tmp, "writer.sqlite3")))
+        queued = simulate(writer.save, args.cases, args.updates, interval)
+        started = time.perf_counter()
+        writer.flush().result()
+        drain = time.perf_counter() - started
+        writer.close()
+
+    saves = args.cases * args.updates
+    print(json.dumps({
+        "saves": saves,
+        "direct": {"caller_blocked_ms": round(direct * 1000, 1), "writes": saves},
+        "case_writer": {
+            "caller_blocked_ms": round(queued * 1000, 1),
+            "writes": writer.written,
+            "batches": writer.batches,
+            "final_flush_ms": round(drain * 1000, 1),
+        },
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Micro-benchmark: extracting and validating structured output from model text.
+
+Compares the previous `_extract_json` + `_parse_response` path (markdown regex,
+greedy brace regex, `json.loads` to check the candidate, `json.loads` again,
+then `model_validate`) with `parse_json_object`: one `validate_json` over the
+outermost brace span, falling back to decoding the objects one at a time
+with `iter_json_objects` when prose around the JSON contains braces. Inputs are a large TeamSummary, the same wrapped in a
+code fence with prose (including stray braces) around it, and a typical
+specialist report.
+
+Usage:
+    python benchmarks/json_parsing.py [--iterations 200]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Utils.Agents import SpecialistReport, TeamSummary, parse_json_object
+
+
+def legacy_parse(text, schema_model):
+    """The previous implementation, kept here for comparison"""
+    text = text.strip()
+    markdown_match = re.search(r'```(?:json)?\s*\n?(.*?)\n?```', text, flags=re.S | re.I)
+    if markdown_match:
+        text = markdown_match.group(1).strip()
+    match = re.search(r'\{.*\}', text, flags=re.S)
+    if match:
+        candidate = match.group(0)
+        try:
+            json.loads(candidate)
+            text = candidate
+        except json.JSONDecodeError:
+            pass
+    return schema_model.model_validate(json.loads(text))
+
+
+def team_summary(findings_per_diagnosis):
+    support = [
+        {"specialist": name, "confidence": 70, "evidence": "Consistent with reported symptoms and laboratory values. " * 4}
+        for name in ("Internist", "Neurologist", "Cardiologist", "Gastroenterologist", "Psychiatrist")
+    ]
+    diagnoses = [
+        {
+            "rank": rank,
+            "condition": f"Condition {rank}",
+            "confidence": 90 - rank * 10,
+            "primary_reason": "Supported by history, examination and test results. " * 5,
+            "specialist_support": support * (findings_per_diagnosis // len(support)),
+            "contradictions": [
+                {"description": "Timeline of symptoms {onset} is unclear.", "specialist": "Internist", "impact": "medium"}
+            ],
+            "next_steps": [f"Order follow-up test {i}" for i in range(findings_per_diagnosis)],
+        }
+        for rank in (1, 2, 3)
+    ]
+    return {
+        "overall_confidence": 72,
+        "diagnoses": diagnoses,
+        "consensus_highlights": ["Agreement on primary condition"] * 10,
+        "disagreement_notes": ["Psychiatric contribution debated"] * 5,
+        "specialist_confidence": {"Internist": 80, "Neurologist": 60, "Cardiologist": 55, "Gastroenterologist": 65, "Psychiatrist": 50},
+    }
+
+
+def specialist_report():
+    return {
+        "specialist": "Internist",
+        "primary_assessment": "Findings suggest a systemic inflammatory process.",
+        "overall_confidence": 75,
+        "key_findings": [{"summary": "Elevated CRP", "quote": "CRP 24 mg/L", "confidence": 80}] * 4,
+        "contradictions": [],
+        "recommendations": ["Repeat inflammatory markers in two weeks"],
+    }
+
+
+def messy(payload):
+    return (
+        "Sure! Below is the analysis {as requested}. Note: values in { } are estimates.\n\n"
+        "```json\n" + json.dumps(payload, indent=2) + "\n```\n\n"
+        "Let me know if you need anything else {e.g. references}."
+    )
+
+
+def measure(fn, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    cases = {
+        "large_team_summary": (json.dumps(team_summary(60), indent=2), TeamSummary),
+        "large_team_summary_messy": (messy(team_summary(60)), TeamSummary),
+        "specialist_report_messy": (messy(specialist_report()), SpecialistReport),
+    }
+    results = {}
+    for name, (text, schema) in cases.items():
+        # Both paths must agree before timing them
+        assert legacy_parse(text, schema) == parse_json_object(text, schema)
+        before = measure(lambda: legacy_parse(text, schema), args.iterations)
+        after = measure(lambda: parse_json_object(text, schema), args.iterations)
+        results[name] = {
+            "size_kb": round(len(text) / 1024, 1),
+            "ms_before": round(before, 3),
+            "ms_after": round(after, 3),
+            "speedup": round(before / after, 2) if after else None,
+        }
+    print(json.dumps({"iterations": args.iterations, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark: PDF text extraction inline vs in the PDF process pool.
+
+Generates a multi-page lab-report PDF with reportlab (or uses the PDF given),
+then extracts it (1) inline with pdfplumber, the way the upload handler used
+to, and (2) with `PDFExtractor`, which splits the pages into ranges across the
+pool's processes. While each runs, a ticker coroutine measures how long the
+event loop is blocked: that is the stall every other request would see.
+
+Usage:
+    python benchmarks/pdf_extraction.py [--pages 100] [--workers 4] [--pdf file.pdf]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pdfplumber
+
+from Utils.PDFExtraction import PDFExtractor, PDFSettings
+
+
+def make_pdf(path, pages):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    pdf = canvas.Canvas(path, pagesize=A4)
+    for page in range(1, pages + 1):
+        y = 800
+        pdf.drawString(50, y, f"Laboratory Report - page {page}")
+        for row in range(45):
+            y -= 16
+            pdf.drawString(50, y, f"Test {page}.{row}: Hemoglobin {12 + row % 5}.{row % 10} g/dL   "
+                                  f"Reference 12.0-16.0   Flag {'H' if row % 7 == 0 else 'N'}")
+        pdf.showPage()
+    pdf.save()
+
+
+def extract_inline(path):
+    with pdfplumber.open(path) as pdf:
+        return "\n\n".join(text for text in (page.extract_text() for page in pdf.pages) if text)
+
+
+async def with_loop_lag(coroutine_factory):
+    """(result, seconds, longest event-loop stall in seconds) of running the coroutine"""
+    stalls = []
+    done = False
+
+    async def ticker():
+        loop = asyncio.get_running_loop()
+        while not done:
+            before = loop.time()
+            await asyncio.sleep(0.01)
+            stalls.append(loop.time() - before - 0.01)
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    started = time.perf_counter()
+    result = await coroutine_factory()
+    elapsed = time.perf_counter() - started
+    done = True
+    await tick
+    return result, elapsed, max(stalls, default=0.0)
+
+
+async def run(path, workers):
+    async def inline():
+        return extract_inline(path)
+
+    settings = PDFSettings()
+    settings.workers = workers
+    extractor = PDFExtractor(settings)
+    # Start the pool's processes before timing, as a running server would have
+    await extractor.extract(path)
+
+    inline_text, inline_seconds, inline_stall = await with_loop_lag(inline)
+    pool_text, pool_seconds, pool_stall = await with_loop_lag(lambda: extractor.extract(path))
+    extractor.shutdown()
+    assert inline_text == pool_text, "pool extraction differs from inline extraction"
+    return {
+        "inline": {"seconds": round(inline_seconds, 3), "max_event_loop_stall_seconds": round(inline_stall, 3)},
+        "pool": {"seconds": round(pool_seconds, 3), "max_event_loop_stall_seconds": round(pool_stall, 3)},
+        "page_metrics": extractor.metrics.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=100, help="Pages of the generated PDF (default: 100)")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1), help="Pool processes")
+    parser.add_argument("--pdf", help="Extract this PDF instead of a generated one")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.pdf
+        if not path:
+            path = os.path.join(tmp, "lab_bundle.pdf")
+            make_pdf(path, args.pages)
+        with pdfplumber.open(path) as pdf:
+            pages = len(pdf.pages)
+        result = asyncio.run(run(path, args.workers))
+    print(json.dumps({"pages": pages, "workers": args.workers, **result}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark: deterministic-first parsing of report text into case fields.
+
+Runs `parse_medical_report` over the given reports without a model and reports
+the parse time, the per-field confidence, and which fields would have been
+sent to the model. Before this path, every upload made one blocking model call
+for all fields.
+
+Usage:
+    python benchmarks/report_parsing.py ["Medical Reports/*.txt"] [--threshold 0.7] [--iterations 100]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Main import collect_reports
+from Utils.ReportParser import fields_for_model, min_confidence, parse_medical_report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("inputs", nargs="*", default=[os.path.join("Medical Reports", "*.txt")])
+    parser.add_argument("--threshold", type=float, default=None, help="Model threshold (default: REPORT_PARSER_MIN_CONFIDENCE or 0.7)")
+    parser.add_argument("--iterations", type=int, default=100, help="Parses per report for the timing (default: 100)")
+    args = parser.parse_args()
+    threshold = args.threshold if args.threshold is not None else min_confidence()
+
+    paths = collect_reports(args.inputs)
+    if not paths:
+        parser.error("no medical reports matched the given inputs")
+    reports = {}
+    timings = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            result = asyncio.run(parse_medical_report(text, threshold=threshold))
+        timings.append((time.perf_counter() - started) / args.iterations * 1000)
+        confidence = result["extraction"]["confidence"]
+        reports[os.path.basename(path)] = {
+            "ms": round(timings[-1], 3),
+            "fields_from_rules": sum(source == "rules" for source in result["extraction"]["sources"].values()),
+            "model_fields": fields_for_model(text, confidence, threshold),
+        }
+
+    needing_model = sum(1 for report in reports.values() if report["model_fields"])
+    print(json.dumps({
+        "threshold": threshold,
+        "reports": reports,
+        "summary": {
+            "reports": len(reports),
+            "median_parse_ms": round(statistics.median(timings), 3),
+            "reports_needing_model_call": needing_model,
+            "model_fields_total": sum(len(report["model_fields"]) for report in reports.values()),
+        },
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
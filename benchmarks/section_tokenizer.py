@@ -0,0 +1,163 @@
+"""
+Benchmark: rule-based report parsing on very long reports.
+
+Compares the previous `parse_medical_report_simple`, which scanned the whole
+text once or more per field (line loops with `line.lower()`, `find` from the
+first occurrence of each keyword), with the section tokenizer, which splits the
+report into labelled sections with one compiled pattern in a single pass.
+Reports are synthetic: the header of a real report followed by `--pages` pages
+of lab results, exam findings and narrative, then the remaining sections.
+
+Usage:
+    python benchmarks/section_tokenizer.py [--pages 500] [--lines-per-page 50] [--iterations 5]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Utils.ReportParser import CASE_FIELDS, parse_medical_report_simple
+
+HEADER = """Medical Case Report
+Patient ID: 100235
+Name: David Wilson
+Age: 72
+Gender: Male
+Date of Report: 2025-01-03
+
+Chief Complaint:
+The patient complains of progressive memory loss, difficulty managing daily tasks, and disorientation for the past two years.
+
+Medical History:
+Family History: Mother had dementia.
+Personal Medical History: Hypertension, hyperlipidemia.
+Lifestyle Factors: Retired, no smoking, occasional alcohol.
+Medications: Simvastatin 20 mg daily, Amlodipine 5 mg daily.
+
+Recent Lab and Diagnostic Results:
+"""
+FOOTER = """Blood Tests: Normal vitamin B12, thyroid function.
+
+Physical Examination Findings:
+Vital Signs: BP 135/82 mmHg, HR 80 bpm, BMI 24.7.
+Abdominal Exam: Soft, non-tender.
+"""
+PAGE_LINES = (
+    "Serum sodium {n} mmol/L, potassium 4.{d} mmol/L, creatinine 0.{d} mg/dL, within reference ranges.",
+    "MRI Brain (follow-up {n}): Stable cortical atrophy, no new lesions.",
+    "Progress note day {n}: patient oriented to person, intermittently to place; appetite fair.",
+    "Hemoglobin 13.{d} g/dL, white cell count {d}.2 x10^9/L, platelets {n} x10^9/L.",
+    "Nursing observation {n}: slept six hours, no falls, mobilising with a frame.",
+    "Mini-Mental State Exam (MMSE) repeat {n}: Score 1{d}/30.",
+)
+
+
+def synthetic_report(pages, lines_per_page, seed=0):
+    rng = random.Random(seed)
+    body = []
+    for page in range(pages):
+        body.append(f"--- Page {page + 1} ---")
+        for _ in range(lines_per_page):
+            body.append(rng.choice(PAGE_LINES).format(n=rng.randint(100, 400), d=rng.randint(0, 9)))
+    return HEADER + "\n".join(body) + "\n" + FOOTER
+
+
+def legacy_parse(text):
+    """The previous implementation, kept here for comparison"""
+    result = dict(CASE_FIELDS)
+    lines = text.split('\n')
+    text_lower = text.lower()
+    for line in lines:
+        if 'patient id' in line.lower() or 'patientid' in line.lower():
+            parts = line.split(':')
+            if len(parts) > 1:
+                result["patientId"] = parts[1].strip()
+    for line in lines:
+        if line.lower().startswith('name:'):
+            result["name"] = line.split(':', 1)[1].strip()
+    for line in lines:
+        if line.lower().startswith('age:'):
+            try:
+                result["age"] = int(line.split(':', 1)[1].strip())
+            except ValueError:
+                pass
+    for line in lines:
+        if line.lower().startswith('gender:'):
+            result["gender"] = line.split(':', 1)[1].strip()
+    sections = (
+        ("chiefComplaint", "chief complaint", ("medical history", "recent lab")),
+        ("familyHistory", "family history", ("personal", "lifestyle")),
+        ("personalHistory", "personal", ("lifestyle", "medications")),
+        ("lifestyle", "lifestyle", ("medications",)),
+        ("medications", "medication", ("recent lab", "physical examination")),
+    )
+    for field, start_key, end_keys in sections:
+        if start_key in text_lower:
+            start_idx = text_lower.find(start_key)
+            end_idx = -1
+            for end_key in end_keys:
+                end_idx = text_lower.find(end_key, start_idx)
+                if end_idx != -1:
+                    break
+            if end_idx == -1:
+                end_idx = len(text)
+            section = text[start_idx:end_idx].split(':', 1)
+            if len(section) > 1:
+                result[field] = section[1].strip()
+    for field, keyword in (("colonoscopy", "colonoscopy"), ("stoolStudies", "stool"), ("vitals", "vital"), ("abdominalExam", "abdominal")):
+        if keyword in text_lower:
+            for line in lines:
+                if keyword in line.lower():
+                    parts = line.split(':', 1)
+                    if len(parts) > 1:
+                        result[field] = parts[1].strip()
+    if 'blood' in text_lower or 'lab' in text_lower:
+        start_idx = text_lower.find('blood') if 'blood' in text_lower else text_lower.find('lab')
+        end_idx = text_lower.find('physical examination', start_idx)
+        if end_idx == -1:
+            end_idx = len(text)
+        result["bloodTests"] = text[start_idx:end_idx].strip()
+    return result
+
+
+def measure(fn, text, iterations):
+    best = float("inf")
+    for _ in range(iterations):
+        started = time.perf_counter()
+        result = fn(text)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=500, help="Synthetic pages per report (default: 500)")
+    parser.add_argument("--lines-per-page", type=int, default=50, help="Lines per synthetic page (default: 50)")
+    parser.add_argument("--iterations", type=int, default=5, help="Parses per parser; the best time is reported (default: 5)")
+    args = parser.parse_args()
+
+    text = synthetic_report(args.pages, args.lines_per_page)
+    before, legacy = measure(legacy_parse, text, args.iterations)
+    after, current = measure(parse_medical_report_simple, text, args.iterations)
+    differing = {
+        field: {"legacy": str(legacy[field])[:80], "tokenizer": str(current[field])[:80]}
+        for field in CASE_FIELDS if field != "bloodTests" and legacy[field] != current[field]
+    }
+    print(json.dumps({
+        "pages": args.pages,
+        "chars": len(text),
+        "legacy_ms": round(before * 1000, 2),
+        "tokenizer_ms": round(after * 1000, 2),
+        "speedup": round(before / after, 1) if after else None,
+        # The legacy lab section starts at the first "blood" anywhere in the text
+        "blood_tests_chars": {"legacy": len(legacy["bloodTests"]), "tokenizer": len(current["bloodTests"])},
+        "other_fields_differing": differing,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
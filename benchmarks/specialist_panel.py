@@ -0,0 +1,86 @@
+"""
+Benchmark: the specialist stage in "individual" vs "panel" mode.
+
+Runs the five specialists for each report in both modes (response cache off)
+and compares LLM calls, prompt/completion tokens, fallback calls and wall time.
+Token counts come from the providers' usage metadata when available and are
+estimated otherwise. Needs the same API keys (or Ollama) as `Main.py`;
+`--dry-run` only compares the estimated prompt sizes without calling a model.
+
+Usage:
+    python benchmarks/specialist_panel.py ["Medical Reports/*.txt"] [--reports 3] [--dry-run]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+from Main import collect_reports
+from Utils.Agents import SpecialistPanel
+from Utils.Orchestrator import SPECIALISTS, SPECIALIST_MODES, load_agent_api_keys, run_specialists
+from Utils.RateLimiter import estimate_tokens
+from Utils.Telemetry import collect_calls
+
+
+def prompt_tokens(medical_report):
+    """Estimated prompt tokens of the specialist stage in each mode"""
+    individual = sum(estimate_tokens(cls(medical_report).build_prompt()) for cls in SPECIALISTS.values())
+    return {"individual": individual, "panel": estimate_tokens(SpecialistPanel(medical_report).build_prompt())}
+
+
+async def run_mode(mode, reports, api_keys):
+    totals = {"calls": 0, "fallback_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "failed_reports": 0, "wall_seconds": 0.0}
+    for medical_report in reports:
+        started = time.perf_counter()
+        with collect_calls() as calls:
+            responses, _, _ = await run_specialists(medical_report, api_keys, mode, routing=False)
+        totals["wall_seconds"] += time.perf_counter() - started
+        totals["calls"] += len(calls)
+        if mode == "panel":
+            totals["fallback_calls"] += sum(1 for call in calls if call["kind"] == "agent")
+        totals["prompt_tokens"] += sum(call["prompt_tokens"] or 0 for call in calls)
+        totals["completion_tokens"] += sum(call["completion_tokens"] or 0 for call in calls)
+        totals["failed_reports"] += any(report is None for report in responses.values())
+    totals["wall_seconds"] = round(totals["wall_seconds"], 2)
+    totals["wall_seconds_per_report"] = round(totals["wall_seconds"] / len(reports), 2)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("inputs", nargs="*", default=[os.path.join("Medical Reports", "*.txt")])
+    parser.add_argument("--reports", type=int, default=3, help="Number of reports to run (default: 3)")
+    parser.add_argument("--dry-run", action="store_true", help="Only compare estimated prompt sizes")
+    args = parser.parse_args()
+
+    load_dotenv(dotenv_path="apikey.env")
+    # Every call must reach the model in both modes
+    os.environ["LLM_CACHE_ENABLED"] = "0"
+
+    paths = collect_reports(args.inputs)[:args.reports]
+    if not paths:
+        parser.error("no medical reports matched the given inputs")
+    reports = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            reports.append(f.read())
+
+    estimated = [prompt_tokens(report) for report in reports]
+    result = {
+        "reports": len(reports),
+        "estimated_prompt_tokens": {mode: sum(e[mode] for e in estimated) for mode in SPECIALIST_MODES},
+    }
+    if not args.dry_run:
+        api_keys = load_agent_api_keys()
+        result["modes"] = {mode: asyncio.run(run_mode(mode, reports, api_keys)) for mode in SPECIALIST_MODES}
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
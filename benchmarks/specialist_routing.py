@@ -0,0 +1,89 @@
+"""
+Benchmark: how many specialist calls the local relevance router saves.
+
+Scores every report with `Utils.SpecialistRouter` (no model calls) and reports,
+per report, the relevance scores, the specialists consulted and the calls saved
+against consulting all five. Reports whose file name contains a condition in
+PRIMARY_SPECIALTY are also checked for recall: the specialty that owns the
+condition must be among those consulted.
+
+Usage:
+    python benchmarks/specialist_routing.py ["Medical Reports/*.txt"] [--threshold 2.5]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Main import collect_reports
+from Utils.Orchestrator import SPECIALISTS
+from Utils.SpecialistRouter import route_specialists, routing_threshold
+
+# Condition (in the report file name) -> specialty that has to be consulted
+PRIMARY_SPECIALTY = {
+    "irritable bowel": "Gastroenterologist",
+    "alzheimer": "Neurologist",
+    "insomnia": "Psychiatrist",
+    "neuropathy": "Neurologist",
+    "panic": "Psychiatrist",
+    "prostate": "Internist",
+    "rheumatoid": "Internist",
+    "polycystic ovary": "Internist",
+    "tonsillitis": "Internist",
+    "copd": "Internist",
+}
+
+
+def primary_specialty(path):
+    name = os.path.basename(path).lower()
+    return next((role for condition, role in PRIMARY_SPECIALTY.items() if condition in name), None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("inputs", nargs="*", default=[os.path.join("Medical Reports", "*.txt")])
+    parser.add_argument("--threshold", type=float, default=None, help="Routing threshold (default: SPECIALIST_ROUTING_THRESHOLD or 2.5)")
+    args = parser.parse_args()
+    threshold = args.threshold if args.threshold is not None else routing_threshold()
+
+    report_paths = collect_reports(args.inputs)
+    roles = list(SPECIALISTS)
+    reports = {}
+    consulted_total = 0
+    labelled = recalled = 0
+    started = time.perf_counter()
+    for path in report_paths:
+        with open(path, "r", encoding="utf-8") as f:
+            decision = route_specialists(f.read(), roles, threshold)
+        consulted_total += len(decision.consulted)
+        expected = primary_specialty(path)
+        if expected:
+            labelled += 1
+            recalled += expected in decision.consulted
+        reports[os.path.basename(path)] = {
+            "scores": decision.scores,
+            "consulted": decision.consulted,
+            "primary_specialty": expected,
+        }
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    all_calls = len(roles) * len(report_paths)
+    print(json.dumps({
+        "threshold": threshold,
+        "reports": reports,
+        "summary": {
+            "reports": len(report_paths),
+            "calls_without_routing": all_calls,
+            "calls_with_routing": consulted_total,
+            "calls_saved_pct": round(100 * (all_calls - consulted_total) / all_calls, 1) if all_calls else None,
+            "primary_specialty_recall": f"{recalled}/{labelled}",
+            "routing_ms_per_report": round(elapsed_ms / len(report_paths), 3) if report_paths else None,
+        },
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark: the team stage in "separate" vs "fused" mode.
+
+For each report the specialists run once; the team stage then runs in both
+modes on the same specialist reports (response cache off). Compares LLM calls,
+prompt/completion tokens, fallback calls and wall time of the team stage.
+Needs the same API keys (or Ollama) as `Main.py`.
+
+Usage:
+    python benchmarks/team_fused.py ["Medical Reports/*.txt"] [--reports 3]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+from Main import collect_reports
+from Utils.Orchestrator import TEAM_MODES, load_agent_api_keys, run_specialists, run_team
+from Utils.Telemetry import collect_calls
+
+
+async def run_modes(reports, api_keys):
+    totals = {
+        mode: {"calls": 0, "fallback_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "failed_reports": 0, "wall_seconds": 0.0}
+        for mode in TEAM_MODES
+    }
+    for medical_report in reports:
+        responses, _, _ = await run_specialists(medical_report, api_keys, routing=False)
+        for mode in TEAM_MODES:
+            started = time.perf_counter()
+            with collect_calls() as calls:
+                _, summary, options = await run_team(medical_report, responses, api_keys, mode)
+            mode_totals = totals[mode]
+            mode_totals["wall_seconds"] += time.perf_counter() - started
+            mode_totals["calls"] += len(calls)
+            if mode == "fused":
+                mode_totals["fallback_calls"] += sum(1 for call in calls if call["kind"] != "fused")
+            mode_totals["prompt_tokens"] += sum(call["prompt_tokens"] or 0 for call in calls)
+            mode_totals["completion_tokens"] += sum(call["completion_tokens"] or 0 for call in calls)
+            mode_totals["failed_reports"] += summary is None or not options
+    for mode_totals in totals.values():
+        mode_totals["wall_seconds"] = round(mode_totals["wall_seconds"], 2)
+        mode_totals["wall_seconds_per_report"] = round(mode_totals["wall_seconds"] / len(reports), 2)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("inputs", nargs="*", default=[os.path.join("Medical Reports", "*.txt")])
+    parser.add_argument("--reports", type=int, default=3, help="Number of reports to run (default: 3)")
+    args = parser.parse_args()
+
+    load_dotenv(dotenv_path="apikey.env")
+    # Every call must reach the model in both modes
+    os.environ["LLM_CACHE_ENABLED"] = "0"
+
+    paths = collect_reports(args.inputs)[:args.reports]
+    if not paths:
+        parser.error("no medical reports matched the given inputs")
+    reports = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            reports.append(f.read())
+
+    modes = asyncio.run(run_modes(reports, load_agent_api_keys()))
+    print(json.dumps({"reports": len(reports), "modes": modes}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark: first and repeat upload of the same PDF through the upload cache.
+
+Runs the parse-report path outside the server: spool the PDF while hashing it,
+look up the extracted text and the parsed fields by that hash, and on a miss
+extract with `PDFExtractor` and parse with `parse_medical_report` (rules only,
+no model). The first upload misses both entries; repeats are served from the
+cache. Uses a throwaway cache file unless --cache-path is given.
+
+Usage:
+    python benchmarks/upload_cache.py [--pages 30] [--repeats 5] [--pdf file.pdf]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_extraction import make_pdf
+
+from Utils.PDFExtraction import PDFExtractor, PDFSettings, spool_upload
+from Utils.ReportParser import parse_medical_report, parser_version
+from Utils.ResponseCache import DiskCache
+from Utils.UploadCache import UploadCache
+
+
+async def upload(path, extractor, cache):
+    """Seconds taken by one upload of the PDF at `path`"""
+    started = time.perf_counter()
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        spooled = await asyncio.to_thread(spool_upload, source, extractor.settings, digest)
+    try:
+        pdf_hash = digest.hexdigest()
+        text = cache.get_text(pdf_hash)
+        if text is None:
+            text = await extractor.extract(spooled)
+            cache.set_text(pdf_hash, text)
+        version = parser_version()
+        if cache.get_fields(pdf_hash, version) is None:
+            cache.set_fields(pdf_hash, version, await parse_medical_report(text))
+    finally:
+        os.remove(spooled)
+    return time.perf_counter() - started
+
+
+async def run(args, pdf_path, cache_path):
+    extractor = PDFExtractor(PDFSettings())
+    cache = UploadCache(DiskCache(cache_path))
+    try:
+        first = await upload(pdf_path, extractor, cache)
+        repeats = [await upload(pdf_path, extractor, cache) for _ in range(args.repeats)]
+    finally:
+        extractor.shutdown()
+    return {
+        "pdf_bytes": os.path.getsize(pdf_path),
+        "first_upload_ms": round(first * 1000, 1),
+        "repeat_upload_median_ms": round(statistics.median(repeats) * 1000, 2),
+        "speedup": round(first / statistics.median(repeats), 1),
+        "cache": cache.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=30, help="Pages of the generated PDF (default: 30)")
+    parser.add_argument("--repeats", type=int, default=5, help="Repeat uploads after the first (default: 5)")
+    parser.add_argument("--pdf", help="Use this PDF instead of generating one")
+    parser.add_argument("--cache-path", help="Upload cache file (default: a temporary file)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = args.pdf
+        if not pdf_path:
+            pdf_path = os.path.join(tmp, "report.pdf")
+            make_pdf(pdf_path, args.pages)
+        cache_path = args.cache_path or os.path.join(tmp, "uploads.sqlite3")
+        print(json.dumps(asyncio.run(run(args, pdf_path, cache_path)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
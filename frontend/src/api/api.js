@@ -86,6 +86,14 @@ export function getCase(caseId) {
   return request(`/api/cases/${encodeURIComponent(caseId)}`);
 }
 
+/**
+ * URL of the Server-Sent Events stream for a case's progress
+ * (snapshot, status, specialist, teamSummary, treatmentOptions, completed/error).
+ */
+export function caseEventsUrl(caseId) {
+  return `${BASE_URL}/api/cases/${encodeURIComponent(caseId)}/events`;
+}
+
 export function rerunAgents(caseId) {
   return request(`/api/cases/${encodeURIComponent(caseId)}/rerun`, {
     method: "POST"
@@ -57,6 +57,8 @@ export default function CaseDashboard() {
   const [q, setQ] = useState("");
   const [statusFilter, setStatusFilter] = useState("all");
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState("");
   const navigate = useNavigate();
 
@@ -79,6 +81,7 @@ export default function CaseDashboard() {
           setCases(MOCK_CASES);
         } else {
           setCases(items);
+          setNextCursor(data?.nextCursor || null);
         }
       } catch (err) {
         console.error("Error loading cases, using mock:", err);
@@ -97,6 +100,21 @@ export default function CaseDashboard() {
     };
   }, []);
 
+  async function loadMore() {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const data = await listCases({ cursor: nextCursor });
+      setCases((prev) => [...prev, ...(data?.items || [])]);
+      setNextCursor(data?.nextCursor || null);
+    } catch (err) {
+      console.error("Error loading more cases:", err);
+      setError("Could not load more cases from backend.");
+    } finally {
+      setLoadingMore(false);
+    }
+  }
+
   const filtered = cases.filter((c) => {
     const matchesQ =
       !q ||
@@ -189,6 +207,17 @@ export default function CaseDashboard() {
           ))}
         </div>
       )}
+
+      {!loading && nextCursor && (
+        <button
+          className="btn btn-ghost-lg"
+          style={{ marginTop: 16 }}
+          onClick={loadMore}
+          disabled={loadingMore}
+        >
+          {loadingMore ? "Loading…" : "Load more"}
+        </button>
+      )}
     </section>
   );
 }
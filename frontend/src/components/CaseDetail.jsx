@@ -1,6 +1,6 @@
 import React, { useEffect, useState } from "react";
 import { useParams, useNavigate } from "react-router-dom";
-import { getCase, rerunAgents } from "../api/api";
+import { getCase, rerunAgents, caseEventsUrl } from "../api/api";
 
 function StatusBadge({ status }) {
   const s = (status || "").toLowerCase();
@@ -20,6 +20,8 @@ export default function CaseDetail() {
   const [error, setError] = useState("");
   const [rerunning, setRerunning] = useState(false);
 
+  const isActive = caseData?.status === "Running" || caseData?.status === "Queued";
+
   useEffect(() => {
     async function fetchCase() {
       try {
@@ -36,15 +38,40 @@ export default function CaseDetail() {
 
     if (id) {
       fetchCase();
-      // Poll for updates if case is running
-      const interval = setInterval(() => {
-        if (caseData?.status === "Running" || caseData?.status === "Queued") {
-          fetchCase();
-        }
-      }, 3000);
-      return () => clearInterval(interval);
     }
-  }, [id, caseData?.status]);
+  }, [id]);
+
+  // Stream results as each agent finishes instead of polling the case
+  useEffect(() => {
+    if (!id || !isActive) return;
+
+    const source = new EventSource(caseEventsUrl(id));
+    const on = (type, apply) =>
+      source.addEventListener(type, (e) => {
+        if (!e.data) return;
+        const data = JSON.parse(e.data);
+        setCaseData((prev) => apply(prev || {}, data));
+        if (type === "completed" || type === "failed") source.close();
+      });
+    const withResults = (prev, results) => ({
+      ...prev,
+      agentResults: { ...(prev.agentResults || {}), ...results }
+    });
+
+    on("snapshot", (_prev, data) => data);
+    on("status", (prev, data) => ({ ...prev, ...data }));
+    on("specialist", (prev, data) =>
+      withResults(prev, {
+        specialists: { ...(prev.agentResults?.specialists || {}), [data.agent]: data.result }
+      })
+    );
+    on("teamSummary", (prev, data) => withResults(prev, { teamSummary: data.result }));
+    on("treatmentOptions", (prev, data) => withResults(prev, { treatmentOptions: data.result }));
+    on("completed", (prev, data) => ({ ...prev, ...data }));
+    on("failed", (prev, data) => ({ ...prev, ...data }));
+
+    return () => source.close();
+  }, [id, isActive]);
 
   const handleRerun = async () => {
     try {
@@ -225,6 +252,12 @@ export default function CaseDetail() {
                           </div>
                         )}
                       </>
+                    ) : report && report.status === "not_consulted" ? (
+                      <div style={{ padding: "16px", background: "rgba(148, 163, 184, 0.1)", borderRadius: "8px", border: "1px solid rgba(148, 163, 184, 0.3)" }}>
+                        <p style={{ color: "#94a3b8", fontSize: "0.9rem", margin: 0 }}>
+                          Not consulted. {report.reason}
+                        </p>
+                      </div>
                     ) : (
                       <div style={{ padding: "16px", background: "rgba(220, 38, 38, 0.1)", borderRadius: "8px", border: "1px solid rgba(220, 38, 38, 0.3)" }}>
                         <p style={{ color: "#fca5a5", fontSize: "0.9rem", margin: 0 }}>
@@ -0,0 +1,102 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Utils.CaseStore import CaseWriter, SqliteCaseStore, snapshot_case
+
+
+class RecordingStore(SqliteCaseStore):
+    """SqliteCaseStore that remembers the batches it was asked to write"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.batches = []
+
+    def save_many(self, cases):
+        cases = list(cases)
+        self.batches.append([case["id"] for case in cases])
+        super().save_many(cases)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return RecordingStore(str(tmp_path / "cases.sqlite3"))
+
+
+def case(status, **fields):
+    return {"id": "case-1", "name": "A B", "status": status, **fields}
+
+
+def test_saves_of_a_case_are_coalesced_last_write_wins(store):
+    writer = CaseWriter(store, coalesce_seconds=5)
+    futures = [writer.save(case(status)) for status in ("Queued", "Running", "Completed")]
+    writer.flush().result(timeout=5)
+    for future in futures:
+        future.result(timeout=5)
+
+    assert store.batches == [["case-1"]]
+    assert store.get("case-1")["status"] == "Completed"
+    assert writer.stats()["coalesced"] == 2
+    writer.close()
+
+
+def test_coalesced_save_keeps_pending_agent_results(store):
+    writer = CaseWriter(store, coalesce_seconds=5)
+    writer.save(case("Running", agentResults={"specialists": {"Internist": {"ok": True}}}))
+    writer.save(case("Running"))
+    writer.flush().result(timeout=5)
+
+    assert store.get("case-1")["agentResults"] == {"specialists": {"Internist": {"ok": True}}}
+    writer.close()
+
+
+def test_nested_mutation_after_save_does_not_reach_the_queued_write(store):
+    writer = CaseWriter(store, coalesce_seconds=5)
+    live = case("Running", agentResults={"specialists": {"Internist": {"findings": ["a"]}}, "teamSummary": None})
+    writer.save(live)
+    live["status"] = "Completed"
+    live["agentResults"]["specialists"]["Internist"]["findings"].append("b")
+    live["agentResults"]["teamSummary"] = {"diagnoses": []}
+    writer.flush().result(timeout=5)
+
+    stored = store.get("case-1")
+    assert stored["status"] == "Running"
+    assert stored["agentResults"] == {"specialists": {"Internist": {"findings": ["a"]}}, "teamSummary": None}
+    writer.close()
+
+
+def test_snapshot_is_a_deep_copy():
+    live = case("Running", agentResults={"specialists": {"Internist": {"findings": ["a"]}}})
+    snapshot = snapshot_case(live)
+    live["agentResults"]["specialists"]["Internist"]["findings"].append("b")
+    assert snapshot["agentResults"]["specialists"]["Internist"]["findings"] == ["a"]
+
+
+def test_close_writes_pending_saves_and_later_saves_synchronously(store):
+    writer = CaseWriter(store, coalesce_seconds=60)
+    pending = writer.save(case("Running"))
+    event = writer.append_event("case-1", "status", {"status": "Running"})
+    writer.close(timeout=5)
+
+    assert pending.done() and event.done()
+    assert store.get("case-1")["status"] == "Running"
+    assert [e["type"] for e in store.events_since("case-1")] == ["status"]
+
+    late = writer.save(case("Completed"))
+    assert late.done()
+    assert store.get("case-1")["status"] == "Completed"
+
+
+def test_events_keep_their_order_around_clears(store):
+    writer = CaseWriter(store, coalesce_seconds=5)
+    writer.append_event("case-1", "status", {"n": 1})
+    writer.clear_events("case-1")
+    writer.append_event("case-1", "status", {"n": 2})
+    writer.append_event("case-1", "completed", {"n": 3})
+    writer.flush().result(timeout=5)
+
+    assert [e["data"]["n"] for e in store.events_since("case-1")] == [2, 3]
+    writer.close()
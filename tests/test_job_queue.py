@@ -0,0 +1,87 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Utils.JobQueue import JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.sqlite3"), max_attempts=2)
+
+
+def expire_lease(queue, job_id):
+    queue._conn().execute("UPDATE jobs SET lease_expires_at = 0 WHERE id = ?", (job_id,))
+
+
+def test_rerun_attaches_to_the_active_job(queue):
+    job, created = queue.enqueue("case-1", report_hash="a")
+    assert created
+    attached, created = queue.enqueue("case-1", report_hash="a")
+    assert not created and attached["id"] == job["id"]
+
+    queue.claim("w1")
+    attached, created = queue.enqueue("case-1", report_hash="a")
+    assert not created and attached["id"] == job["id"]
+    assert queue.depth() == 1
+
+
+def test_supersede_waits_for_the_old_job_to_be_cancelled(queue):
+    old, _ = queue.enqueue("case-1", report_hash="a")
+    queue.claim("w1")
+
+    new, created = queue.enqueue("case-1", report_hash="b", supersede=True)
+    assert created and new["id"] != old["id"]
+    assert queue.cancel_requested(old["id"])
+    assert not queue.cancel_requested(new["id"])
+    # The old run still holds the case
+    assert queue.claim("w2") is None
+
+    assert queue.mark_cancelled(old["id"], "w1")
+    assert queue.get(old["id"])["status"] == "cancelled"
+    assert queue.claim("w2")["id"] == new["id"]
+
+
+def test_same_report_is_not_claimed_while_one_is_running(queue):
+    first, _ = queue.enqueue("case-1", report_hash="same")
+    second, _ = queue.enqueue("case-2", report_hash="same")
+    other, _ = queue.enqueue("case-3", report_hash="other")
+
+    assert queue.claim("w1")["id"] == first["id"]
+    assert queue.claim("w2")["id"] == other["id"]
+    assert queue.claim("w2") is None
+
+    assert queue.complete(first["id"], "w1")
+    assert queue.claim("w2")["id"] == second["id"]
+
+
+def test_lost_lease_cannot_complete_or_fail(queue):
+    job, _ = queue.enqueue("case-1")
+    queue.claim("w1")
+    expire_lease(queue, job["id"])
+    assert queue.claim("w2")["id"] == job["id"]
+
+    assert not queue.complete(job["id"], "w1")
+    assert not queue.fail(job["id"], "w1", "boom")
+    assert not queue.mark_cancelled(job["id"], "w1")
+    stored = queue.get(job["id"])
+    assert (stored["status"], stored["worker"], stored["attempts"]) == ("running", "w2", 2)
+
+    assert queue.fail(job["id"], "w2", "boom") is False
+    assert queue.get(job["id"])["status"] == "failed"
+
+
+def test_expired_final_attempt_is_reaped_not_claimed(queue):
+    job, _ = queue.enqueue("case-1")
+    for worker in ("w1", "w2"):
+        assert queue.claim(worker)["id"] == job["id"]
+        expire_lease(queue, job["id"])
+
+    assert queue.claim("w3") is None
+    reaped = queue.reap_expired()
+    assert [(j["id"], j["case_id"], j["status"]) for j in reaped] == [(job["id"], "case-1", "failed")]
+    assert queue.get(job["id"])["status"] == "failed"
+    assert queue.reap_expired() == []
@@ -0,0 +1,49 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="module")
+def api(tmp_path_factory):
+    """api_server on temporary stores: no worker processes, one attempt per job, short leases"""
+    directory = tmp_path_factory.mktemp("api")
+    with pytest.MonkeyPatch.context() as env:
+        env.chdir(ROOT)
+        env.setenv("JOB_WORKERS", "0")
+        env.setenv("JOB_MAX_ATTEMPTS", "1")
+        env.setenv("JOB_VISIBILITY_TIMEOUT_SECONDS", "0.05")
+        env.setenv("CASE_DB_PATH", str(directory / "cases.sqlite3"))
+        env.setenv("JOB_QUEUE_PATH", str(directory / "jobs.sqlite3"))
+        env.setenv("TELEMETRY_DIR", str(directory / "telemetry"))
+        env.setenv("LLM_WARMUP", "0")
+        import api_server
+        yield api_server
+        api_server.case_writer.close()
+
+
+def test_expired_final_attempt_fails_the_case(api):
+    case = {"id": "expired-case", "name": "A B", "chiefComplaint": "headache", "status": "Running"}
+    api.case_store.save(case)
+    job, _ = api.job_queue.enqueue(case["id"], {"kind": "run_agents"})
+    assert api.job_queue.claim("gone:1")["id"] == job["id"]
+    # The worker dies: its lease runs out without a heartbeat, complete or fail
+    time.sleep(0.1)
+    assert api.job_queue.claim("other:2") is None
+
+    asyncio.run(api.reap_expired_jobs())
+
+    assert api.job_queue.get(job["id"])["status"] == "failed"
+    stored = api.case_store.get(case["id"], include_results=False)
+    assert stored["status"] == "Error"
+    assert stored["error"] == "Lease expired on final attempt"
+    api.case_writer.flush().result(timeout=5)
+    events = api.case_store.events_since(case["id"])
+    assert events[-1]["type"] == "failed"
+    # Reaped once only
+    assert api.job_queue.reap_expired() == []
@@ -0,0 +1,72 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Utils.RateLimiter import RateLimiter, SqliteBuckets, TokenBucket
+
+
+def test_reservations_go_negative_and_return_the_wait():
+    bucket = TokenBucket(60, burst=2)
+    bucket.updated_at = 0.0
+    assert bucket.reserve(1, now=0.0) == 0.0
+    assert bucket.reserve(1, now=0.0) == 0.0
+    # Empty: the third request waits one refill interval, the fourth two
+    assert bucket.reserve(1, now=0.0) == pytest.approx(1.0)
+    assert bucket.reserve(1, now=0.0) == pytest.approx(2.0)
+    assert bucket.tokens == pytest.approx(-2.0)
+    # Refills at one token per second, up to the capacity
+    assert bucket.reserve(1, now=3.0) == 0.0
+    assert bucket.reserve(0, now=100.0) == 0.0
+    bucket._refill(100.0)
+    assert bucket.tokens == pytest.approx(2.0)
+
+
+def test_amount_is_clamped_to_the_capacity():
+    bucket = TokenBucket(600, burst=100)
+    bucket.updated_at = 0.0
+    # A prompt larger than the bucket waits for a full bucket, not forever
+    assert bucket.reserve(1000, now=0.0) == 0.0
+    assert bucket.tokens == pytest.approx(0.0)
+    assert bucket.reserve(1000, now=0.0) == pytest.approx(10.0)
+
+
+def test_rate_zero_disables_the_bucket():
+    bucket = TokenBucket(0)
+    for _ in range(100):
+        assert bucket.reserve(1000, now=0.0) == 0.0
+    limiter = RateLimiter(rpm=0, tpm=0, path="")
+    assert limiter.reserve("key", "model", tokens=10_000) == 0.0
+
+
+def test_keys_have_separate_buckets():
+    limiter = RateLimiter(rpm=60, tpm=0, burst=1, path="")
+    assert limiter.reserve("key-a", "model") == 0.0
+    assert limiter.reserve("key-b", "model") == 0.0
+    assert limiter.reserve("key-a", "other-model") == 0.0
+    assert limiter.reserve("key-a", "model") > 0.0
+
+
+def test_sqlite_buckets_share_balances_between_processes(tmp_path):
+    path = str(tmp_path / "ratelimit.sqlite3")
+    # Two stores on one file stand in for two processes, each with its own in-memory buckets
+    first, second = SqliteBuckets(path), SqliteBuckets(path)
+
+    def reserve(store, now):
+        return store.reserve([("key/model/requests", TokenBucket(60, burst=1), 1)], now=now)
+
+    assert reserve(first, 1000.0) == 0.0
+    assert reserve(second, 1000.0) == pytest.approx(1.0)
+    assert reserve(first, 1000.0) == pytest.approx(2.0)
+    # Balances refill from the stored timestamp
+    assert reserve(second, 1004.0) == 0.0
+
+
+def test_sqlite_reservation_returns_the_longest_wait(tmp_path):
+    store = SqliteBuckets(str(tmp_path / "ratelimit.sqlite3"))
+    requests, tokens = TokenBucket(60, burst=10), TokenBucket(600, burst=100)
+    assert store.reserve([("r", requests, 1), ("t", tokens, 100)], now=0.0) == 0.0
+    # Plenty of requests left, but the token bucket is empty: wait for 50 tokens at 10/s
+    assert store.reserve([("r", requests, 1), ("t", tokens, 50)], now=0.0) == pytest.approx(5.0)
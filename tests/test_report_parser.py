@@ -0,0 +1,40 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Utils.ReportParser import _clean, parse_medical_report
+
+
+def parse(text):
+    return asyncio.run(parse_medical_report(text))
+
+
+def test_sub_labels_inside_a_section_are_kept():
+    assert parse("Vital Signs:\nBlood Pressure: 135/82\nHeart rate: 88")["vitals"] == "Blood Pressure: 135/82\nHeart rate: 88"
+    assert parse("Lifestyle:\nSmoking: 1 pack/day")["lifestyle"] == "Smoking: 1 pack/day"
+    assert parse("Labs:\nHemoglobin: 12\nGlucose: 90")["bloodTests"] == "Hemoglobin: 12\nGlucose: 90"
+
+
+def test_clean_strips_only_the_fields_own_header():
+    assert _clean("vitals", "Blood Pressure: 135/82\nHeart rate: 88") == "Blood Pressure: 135/82\nHeart rate: 88"
+    assert _clean("lifestyle", "Smoking: 1 pack/day") == "Smoking: 1 pack/day"
+    assert _clean("bloodTests", "Hemoglobin: 12") == "Hemoglobin: 12"
+    assert _clean("vitals", "Vital Signs: BP 135/82") == "BP 135/82"
+    assert _clean("bloodTests", "Lab Results:\nHemoglobin: 12") == "Hemoglobin: 12"
+    assert _clean("bloodTests", "Urinalysis:\nNegative") == "Urinalysis:\nNegative"
+
+
+def test_templated_report_fields():
+    fields = parse(
+        "Patient ID: 100235\nName: David Wilson\nAge: 72\nGender: Male\n\n"
+        "Chief Complaint:\nProgressive memory loss.\n\n"
+        "Recent Lab and Diagnostic Results:\nMRI Brain: Cortical atrophy.\nBlood Tests: Normal B12.\n\n"
+        "Physical Examination Findings:\nVital Signs: BP 135/82 mmHg, HR 80 bpm.\n"
+    )
+    assert (fields["patientId"], fields["name"], fields["age"], fields["gender"]) == ("100235", "David Wilson", 72, "Male")
+    assert fields["chiefComplaint"] == "Progressive memory loss."
+    assert fields["bloodTests"] == "MRI Brain: Cortical atrophy.\nBlood Tests: Normal B12."
+    assert fields["vitals"] == "BP 135/82 mmHg, HR 80 bpm."
+    assert fields["extraction"]["sources"]["vitals"] == "rules"
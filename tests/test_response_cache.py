@@ -0,0 +1,94 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Utils.ResponseCache as response_cache
+from Utils.ResponseCache import DiskCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def tick(self, seconds=1.0):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache.time, "time", clock)
+    return clock
+
+
+def keys(cache):
+    return sorted(row[0] for row in cache._conn.execute("SELECT key FROM entries"))
+
+
+def table_size(cache):
+    return cache._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+
+def test_overfilled_cache_evicts_least_recently_used(tmp_path, clock):
+    cache = DiskCache(str(tmp_path / "cache.sqlite3"), max_bytes=300)
+    for key in ("a", "b", "c"):
+        cache.set(key, b"x" * 100)
+        clock.tick()
+    assert cache.total_bytes() == 300
+    # Reading "a" makes "b" the least recently used entry
+    assert cache.get("a") == b"x" * 100
+    clock.tick()
+
+    cache.set("d", b"x" * 100)
+    assert keys(cache) == ["a", "c", "d"]
+    assert cache.total_bytes() == table_size(cache) == 300
+
+    # One large entry pushes out as many old ones as it needs
+    clock.tick()
+    cache.set("e", b"x" * 250)
+    assert keys(cache) == ["e"]
+    assert cache.total_bytes() == table_size(cache) == 250
+    assert cache.stats()["evictions"] == 4
+
+
+def test_replacing_an_entry_adjusts_the_total(tmp_path, clock):
+    cache = DiskCache(str(tmp_path / "cache.sqlite3"), max_bytes=1000)
+    cache.set("a", b"x" * 100)
+    cache.set("a", b"x" * 40)
+    assert cache.total_bytes() == table_size(cache) == 40
+    assert cache.stats()["entries"] == 1
+
+
+def test_expired_entries_are_dropped_and_uncounted(tmp_path, clock):
+    cache = DiskCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=10, max_bytes=1000)
+    cache.set("old", b"x" * 100)
+    clock.tick(5)
+    cache.set("new", b"x" * 100)
+    clock.tick(6)
+
+    assert cache.get("old") is None
+    assert cache.total_bytes() == 100
+    clock.tick(5)
+    # The next write purges whatever else has expired
+    cache.set("newest", b"x" * 10)
+    assert keys(cache) == ["newest"]
+    assert cache.total_bytes() == table_size(cache) == 10
+
+
+def test_total_is_shared_and_seeded_for_existing_files(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    first = DiskCache(path, max_bytes=1000)
+    first.set("a", b"x" * 100)
+    first._conn.execute("DROP TABLE totals")
+
+    # A second handle (another process) seeds the missing total from the table
+    second = DiskCache(path, max_bytes=1000)
+    assert second.total_bytes() == 100
+    second.set("b", b"x" * 50)
+    assert first.total_bytes() == 150
@@ -0,0 +1,52 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Utils.StreamingJSON import IncrementalJSONParser
+
+PAYLOAD = {"overall_confidence": 60, "diagnoses": [{"rank": 1, "condition": "a"}, {"rank": 2, "condition": "b {x}"}]}
+
+
+def feed_in_chunks(parser, text, size=5):
+    items = []
+    for i in range(0, len(text), size):
+        items += parser.feed(text[i:i + size])
+        if parser.done:
+            break
+    return items
+
+
+def test_complete_object_sets_done():
+    parser = IncrementalJSONParser(watch=["diagnoses"])
+    items = feed_in_chunks(parser, "```json\n" + json.dumps(PAYLOAD) + "\n```\nTrailing prose")
+    assert parser.done
+    assert json.loads(parser.document) == PAYLOAD
+    assert [item["rank"] for _, item in items] == [1, 2]
+
+
+def test_braces_in_prose_before_the_object_are_skipped():
+    # Regression: the parser used to stop at "{braces}" and return only that fragment
+    text = "Fields in {braces} are filled: ```json " + json.dumps(PAYLOAD) + "```"
+    for size in (1, 7, len(text)):
+        parser = IncrementalJSONParser(watch=["diagnoses"])
+        items = feed_in_chunks(parser, text, size)
+        assert parser.done
+        assert json.loads(parser.document) == PAYLOAD
+        assert [item["rank"] for _, item in items] == [1, 2]
+
+
+def test_several_prose_brace_spans():
+    text = "{a} then {b {c}} and {not json} " + json.dumps(PAYLOAD)
+    parser = IncrementalJSONParser()
+    feed_in_chunks(parser, text, 3)
+    assert parser.done
+    assert json.loads(parser.document) == PAYLOAD
+
+
+def test_prose_braces_without_json_never_finish():
+    parser = IncrementalJSONParser()
+    feed_in_chunks(parser, "Only {prose} here {and here}", 4)
+    assert not parser.done
+    assert parser.document is None
@@ -0,0 +1,82 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Utils.Orchestrator import build_team_agent
+from Utils.RateLimiter import estimate_tokens
+from Utils.Telemetry import start_call
+
+SPECIALIST_REPORTS = {
+    role: {
+        "specialist": role,
+        "primary_assessment": "Assessment of the presenting symptoms",
+        "overall_confidence": 70,
+        "key_findings": [{"finding": "Elevated blood pressure", "evidence": None, "significance": ""}],
+        "contradictions": [],
+        "recommendations": ["Repeat the measurement"],
+    }
+    for role in ("Internist", "Neurologist", "Cardiologist", "Gastroenterologist", "Psychiatrist")
+}
+TREATMENT_INPUT = {"overall_confidence": 50, "diagnoses": [{"rank": 1, "name": "Hypertension", "notes": None}]}
+
+
+class Reply:
+    def __init__(self, content, input_tokens):
+        self.content = content
+        self.usage_metadata = {"input_tokens": input_tokens, "output_tokens": 5}
+
+
+class FakeModel:
+    def __init__(self, *input_tokens):
+        self.input_tokens = list(input_tokens)
+
+    def invoke(self, prompt, **kwargs):
+        return Reply("{}", self.input_tokens.pop(0))
+
+
+@pytest.fixture
+def team():
+    team = build_team_agent("Report", SPECIALIST_REPORTS)
+    team._wait_for_rate_limit = lambda prompt: 0.0
+    return team
+
+
+def full_prompts(team):
+    team.compact = False
+    return team.build_prompt(), team.build_fused_prompt(), team._build_treatment_json_prompt(TREATMENT_INPUT)
+
+
+def test_full_encoding_is_estimated_without_rendering_it(team):
+    team.compact = True
+    compact = (team.build_prompt(), team.build_fused_prompt(), team._build_treatment_json_prompt(TREATMENT_INPUT))
+    estimates = dict(team._full_prompt_estimates)
+    full = full_prompts(team)
+
+    assert estimates == {name: estimate_tokens(prompt) for name, prompt in zip(("team", "fused", "treatment"), full)}
+    assert all(estimate_tokens(c) < estimate_tokens(f) for c, f in zip(compact, full))
+
+
+def test_sent_tokens_come_from_the_first_reply_usage(team):
+    team.compact = True
+    prompt = team.build_prompt()
+    team.model = FakeModel(321, 40)
+    call = start_call("agent", team.role, team.model_name)
+    team._generate(prompt, call)
+    # A repair prompt on the same call adds to the call, not to the prompt sent
+    team._generate("repair", call)
+
+    full_estimate = team._full_prompt_estimates["team"]
+    assert team.prompt_tokens == {"team": {"sent": 321, "sentEstimated": False, "fullEstimate": full_estimate}}
+    assert call.as_dict()["full_prompt_tokens_estimate"] == full_estimate
+    assert call.prompt_tokens == 361
+
+
+def test_other_calls_are_not_tracked(team):
+    team.model = FakeModel(10)
+    call = start_call("treatment_text", team.role, team.model_name)
+    team._generate("prompt", call)
+    assert team.prompt_tokens == {}
+    assert call.full_prompt_tokens_estimate is None